@@ -0,0 +1,240 @@
+"""
+Модуль команд администратора
+
+Доступ к командам имеют только пользователи из переменной окружения ADMIN_IDS
+(список Telegram ID через запятую).
+"""
+import asyncio
+import html
+import logging
+import os
+from collections import Counter
+from datetime import date, timedelta
+from os import getenv
+from typing import FrozenSet
+
+from aiogram import Bot, Router
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import BaseFilter, Command, CommandObject
+from aiogram.fsm.context import FSMContext
+from aiogram.types import FSInputFile, Message
+
+import database
+import events
+import export
+from broadcast import engine as broadcast_engine
+from fsm_storage import EvictingMemoryStorage
+from goal_scenario import ScenarioStage
+from profiler import profiler
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_admin_ids(value: str) -> FrozenSet[int]:
+    """Разбор списка ID администраторов"""
+    return frozenset(int(part) for part in value.replace(" ", "").split(",") if part.isdigit())
+
+
+ADMIN_IDS = _parse_admin_ids(getenv("ADMIN_IDS", ""))
+
+# Ограничения длительности профилирования в секундах
+PROFILE_DEFAULT_SECONDS = 30
+PROFILE_MAX_SECONDS = 300
+
+# Максимальный размер документа, который бот может отправить через Bot API
+DOCUMENT_MAX_BYTES = 50 * 1024 * 1024
+
+# Период отчета /funnel в днях
+FUNNEL_DEFAULT_DAYS = 7
+FUNNEL_MAX_DAYS = 90
+
+
+class IsAdmin(BaseFilter):
+    """Фильтр: сообщение от администратора"""
+
+    async def __call__(self, message: Message) -> bool:
+        return message.from_user is not None and message.from_user.id in ADMIN_IDS
+
+
+router = Router(name="admin")
+router.message.filter(IsAdmin())
+
+
+# Команда /profile [секунды]
+@router.message(Command("profile"))
+async def command_profile(message: Message, command: CommandObject) -> None:
+    """Профилирование работающего бота в течение N секунд"""
+    seconds = PROFILE_DEFAULT_SECONDS
+    if command.args:
+        if not command.args.strip().isdigit():
+            await message.answer("❌ Использование: /profile [секунды]")
+            return
+        seconds = min(max(int(command.args.strip()), 1), PROFILE_MAX_SECONDS)
+
+    if profiler.running:
+        await message.answer("⏳ Профилирование уже запущено, дождись результата.")
+        return
+
+    await message.answer(f"🔬 Профилирование запущено на {seconds} с...")
+    logger.info(f"Администратор {message.from_user.id} запустил профилирование на {seconds} с")
+
+    stacks = await profiler.profile(seconds)
+    path = profiler.save(stacks)
+    total = sum(stacks.values()) or 1
+    top = "\n".join(
+        f"{count * 100 / total:5.1f}% {html.escape(name)}"
+        for name, count in profiler.top_functions(stacks, limit=10)
+    )
+    await message.answer(
+        f"📈 <b>Профилирование завершено</b>\n\n"
+        f"Снимков: {profiler.samples}\n\n"
+        f"<b>Собственное время:</b>\n<pre>{top}</pre>"
+    )
+    await message.answer_document(FSInputFile(path), caption="Collapsed stacks (flamegraph.pl / speedscope)")
+
+
+# Команда /broadcast <текст>
+@router.message(Command("broadcast"))
+async def command_broadcast(message: Message, command: CommandObject, bot: Bot) -> None:
+    """Запуск рассылки всем активным пользователям"""
+    if not command.args:
+        await message.answer("❌ Использование: /broadcast текст сообщения (поддерживается HTML)")
+        return
+    # Предпросмотр администратору: текст с ошибкой разметки не дошел бы ни до кого
+    try:
+        await message.answer(command.args)
+    except TelegramBadRequest as e:
+        await message.answer(f"❌ Рассылка не запущена, текст не отправляется: {html.escape(e.message)}")
+        return
+    broadcast_id = await broadcast_engine.start(bot, command.args)
+    logger.info(f"Администратор {message.from_user.id} запустил рассылку {broadcast_id}")
+    await message.answer(
+        f"📣 Рассылка #{broadcast_id} запущена (сообщение выше - предпросмотр).\n\n"
+        f"Статус: /broadcast_status {broadcast_id}\n"
+        f"Отмена: /broadcast_cancel {broadcast_id}"
+    )
+
+
+# Команда /broadcast_status <id>
+@router.message(Command("broadcast_status"))
+async def command_broadcast_status(message: Message, command: CommandObject) -> None:
+    """Прогресс рассылки"""
+    if not command.args or not command.args.strip().isdigit():
+        await message.answer("❌ Использование: /broadcast_status ID")
+        return
+    broadcast = await database.get_broadcast(int(command.args.strip()))
+    if broadcast is None:
+        await message.answer("❌ Рассылка не найдена.")
+        return
+    await message.answer(
+        f"📣 <b>Рассылка #{broadcast['id']}</b>\n\n"
+        f"Статус: {broadcast['status']}\n"
+        f"✅ Отправлено: {broadcast['sent']}\n"
+        f"🚫 Заблокировали бота: {broadcast['blocked']}\n"
+        f"❌ Ошибки: {broadcast['failed']}\n"
+        f"Последний user_id: {broadcast['last_user_id']}"
+    )
+
+
+# Команда /broadcast_cancel <id>
+@router.message(Command("broadcast_cancel"))
+async def command_broadcast_cancel(message: Message, command: CommandObject) -> None:
+    """Отмена рассылки"""
+    if not command.args or not command.args.strip().isdigit():
+        await message.answer("❌ Использование: /broadcast_cancel ID")
+        return
+    if await broadcast_engine.cancel(int(command.args.strip())):
+        await message.answer("🛑 Рассылка отменена.")
+    else:
+        await message.answer("❌ Рассылка не найдена или уже завершена.")
+
+
+# Команда /export [csv|jsonl]
+@router.message(Command("export"))
+async def command_export(message: Message, command: CommandObject, bot: Bot) -> None:
+    """Выгрузка пользователей и сценариев целеполагания этого бота"""
+    fmt = (command.args or "jsonl").strip().lower()
+    if fmt not in export.FORMATS:
+        await message.answer(f"❌ Использование: /export [{'|'.join(export.FORMATS)}]")
+        return
+
+    await message.answer("📦 Выгрузка запущена...")
+    await asyncio.to_thread(export.cleanup)
+    path = export.default_path(fmt)
+    try:
+        total = await export.export(path, fmt, bot_id=bot.id)
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    size = os.path.getsize(path)
+    if size > DOCUMENT_MAX_BYTES:
+        # Файл остается на сервере до очистки по сроку хранения (export.cleanup)
+        await message.answer(
+            f"✅ Выгружено строк: {total}\n\n"
+            f"Файл слишком большой для отправки ({size // 1024 // 1024} МБ), "
+            f"он сохранен на сервере: <code>{html.escape(path)}</code>\n"
+            f"Файл будет удален через {export.EXPORTS_RETENTION_HOURS:g} ч."
+        )
+        return
+    try:
+        await message.answer_document(FSInputFile(path), caption=f"✅ Выгружено строк: {total}")
+    finally:
+        # Персональные данные не хранятся на сервере после отправки
+        os.remove(path)
+
+
+# Команда /fsm_stats
+@router.message(Command("fsm_stats"))
+async def command_fsm_stats(message: Message, state: FSMContext) -> None:
+    """Память FSM контекстов: общий объем и самые большие контексты"""
+    if not isinstance(state.storage, EvictingMemoryStorage):
+        await message.answer("❌ Учет памяти недоступен для текущего хранилища FSM.")
+        return
+    report = state.storage.memory_report(top=5)
+    largest = "\n".join(
+        f"{size:>7} Б  {html.escape(key)}  {html.escape(str(fsm_state))}"
+        for key, size, fsm_state in report["largest"]
+    )
+    await message.answer(
+        f"🧠 <b>FSM контексты</b>\n\n"
+        f"В памяти: {report['contexts']}\n"
+        f"Объем: {report['total_bytes'] / 1024:.1f} КБ\n\n"
+        f"<b>Самые большие:</b>\n<pre>{largest or '-'}</pre>"
+    )
+
+
+# Команда /funnel [дней]
+@router.message(Command("funnel"))
+async def command_funnel(message: Message, command: CommandObject) -> None:
+    """Воронка сценария и результаты вызовов LLM по дневным итогам журнала событий"""
+    days = FUNNEL_DEFAULT_DAYS
+    if command.args:
+        if not command.args.strip().isdigit():
+            await message.answer("❌ Использование: /funnel [дней]")
+            return
+        days = min(max(int(command.args.strip()), 1), FUNNEL_MAX_DAYS)
+
+    since = (date.today() - timedelta(days=days - 1)).isoformat()
+    totals = Counter()
+    for _, kind, name, count in await database.get_daily_stats(since):
+        totals[kind, name] += count
+
+    started = totals[events.STAGE, ScenarioStage.COLLECTING_GOALS.value]
+    funnel = "\n".join(
+        f"{stage.value:<26}{totals[events.STAGE, stage.value]:>7}"
+        f"{totals[events.STAGE, stage.value] * 100 / started if started else 0:>6.0f}%"
+        for stage in ScenarioStage
+        if stage != ScenarioStage.INTRODUCTION
+    )
+    llm_total = sum(count for (kind, _), count in totals.items() if kind == events.LLM)
+    llm = "\n".join(
+        f"{name:<10}{count:>7}{count * 100 / llm_total:>6.1f}%"
+        for (kind, name), count in totals.most_common()
+        if kind == events.LLM
+    )
+    await message.answer(
+        f"📊 <b>Воронка сценария за {days} дн.</b>\n\n"
+        f"<pre>{funnel}</pre>\n\n"
+        f"<b>Вызовы LLM:</b>\n<pre>{llm or '-'}</pre>"
+    )
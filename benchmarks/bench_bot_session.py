@@ -0,0 +1,112 @@
+"""
+Бенчмарк сессии Bot API при всплесках отправки сообщений
+
+Запускает тестовый Bot API (benchmarks/fake_bot_api.py) в отдельном процессе
+и отправляет несколько всплесков sendMessage с паузой между ними через
+стандартную сессию aiogram и через bot_session.TunedAiohttpSession.
+Пауза больше keep-alive по умолчанию (15 с), поэтому стандартная сессия
+заново устанавливает соединения в каждом всплеске.
+
+Запуск: python benchmarks/bench_bot_session.py --bursts 3 --burst-size 200 --gap 16
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+import bot_session
+
+TOKEN = "1:benchmark"
+
+
+def _stats(port: int) -> dict:
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/stats") as response:
+        return json.loads(response.read())
+
+
+def _percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+async def run(session, port: int, bursts: int, burst_size: int, gap: float) -> dict:
+    bot = Bot(TOKEN, session=session)
+    before = _stats(port)
+    latencies = []
+    started = time.perf_counter()
+
+    async def send(i: int) -> None:
+        t = time.perf_counter()
+        await bot.send_message(chat_id=1000 + i, text=f"Сообщение {i}")
+        latencies.append(time.perf_counter() - t)
+
+    for burst in range(bursts):
+        if burst:
+            await asyncio.sleep(gap)
+        await asyncio.gather(*(send(i) for i in range(burst_size)))
+    elapsed = time.perf_counter() - started - gap * (bursts - 1)
+    await bot.session.close()
+    after = _stats(port)
+    return {
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "send_seconds": elapsed,
+        "connections": after["connections"] - before["connections"]
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк сессии Bot API")
+    parser.add_argument("--port", type=int, default=8091)
+    parser.add_argument("--bursts", type=int, default=3)
+    parser.add_argument("--burst-size", type=int, default=200)
+    parser.add_argument("--gap", type=float, default=16, help="Пауза между всплесками, с")
+    parser.add_argument("--latency-ms", type=float, default=30)
+    parser.add_argument("--connect-cost-ms", type=float, default=150)
+    args = parser.parse_args()
+
+    server = subprocess.Popen([
+        sys.executable, os.path.join(ROOT, "benchmarks", "fake_bot_api.py"),
+        "--port", str(args.port),
+        "--latency-ms", str(args.latency_ms),
+        "--connect-cost-ms", str(args.connect_cost_ms)
+    ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(50):
+            try:
+                _stats(args.port)
+                break
+            except OSError:
+                time.sleep(0.1)
+
+        api_url = f"http://127.0.0.1:{args.port}"
+        sessions = {
+            "aiogram default": lambda: AiohttpSession(api=TelegramAPIServer.from_base(api_url)),
+            "tuned": lambda: bot_session.TunedAiohttpSession(api_url=api_url),
+        }
+        print(f"{args.bursts} всплеска по {args.burst_size} sendMessage, пауза {args.gap} с")
+        print(f"{'сессия':<16}{'p50, мс':>10}{'p99, мс':>10}{'отправка, с':>14}{'соединений':>12}")
+        for name, factory in sessions.items():
+            result = asyncio.run(run(factory(), args.port, args.bursts, args.burst_size, args.gap))
+            print(
+                f"{name:<16}{result['p50_ms']:>10.1f}{result['p99_ms']:>10.1f}"
+                f"{result['send_seconds']:>14.2f}{result['connections']:>12}"
+            )
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Бенчмарк времени импорта модулей бота
+
+Запускает `python -X importtime -c "import <module>"` несколько раз в чистом
+процессе и выводит медианное общее время и самые тяжелые пакеты верхнего уровня.
+
+Запуск: python benchmarks/bench_import_time.py [модуль] [повторы]
+"""
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(module: str) -> dict[str, int]:
+    """Вернуть накопленное время импорта (мкс) по пакетам верхнего уровня"""
+    env = dict(os.environ, BOT_TOKEN=os.getenv("BOT_TOKEN", "123456:benchmark"))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    packages: dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        # Самая внешняя запись пакета содержит накопленное время всех его подмодулей
+        top = name.strip().split(".")[0]
+        packages[top] = max(packages.get(top, 0), int(cumulative))
+    return packages
+
+
+def main() -> None:
+    module = sys.argv[1] if len(sys.argv) > 1 else "bot"
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    totals = []
+    per_package: dict[str, list[int]] = defaultdict(list)
+    for _ in range(repeats):
+        packages = measure(module)
+        totals.append(packages.get(module, 0))
+        for name, value in packages.items():
+            per_package[name].append(value)
+
+    print(f"Импорт '{module}': медиана {statistics.median(totals) / 1000:.0f} мс ({repeats} запусков)")
+    heaviest = sorted(per_package.items(), key=lambda item: statistics.median(item[1]), reverse=True)
+    for name, values in heaviest[:12]:
+        print(f"  {name:<30} {statistics.median(values) / 1000:>8.1f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Бенчмарк распознавания намерений на синтетическом корпусе сообщений
+
+Сравнивает последовательные проверки (как было в обработчиках:
+`text in [...]` и `any(stem in text for stem in [...])` по спискам одно
+за другим) с intents.IntentMatcher. Кроме встроенных намерений
+добавляются синтетические, чтобы показать, как время разбора зависит
+от их количества. Результаты обоих способов сверяются.
+
+Запуск: python benchmarks/bench_intents.py --messages 200000 --extra 0 20 100
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from typing import Dict, List, Optional, Sequence
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import intents
+
+SYLLABLES = ("ка", "ро", "ми", "на", "те", "ль", "во", "за", "пре", "ст", "ди", "лу", "ны", "сь", "ог", "ир")
+
+
+def _word(rng: random.Random) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4)))
+
+
+def make_intents(extra: int, rng: random.Random) -> Dict[str, Dict[str, tuple]]:
+    """Встроенные намерения и extra синтетических по 10 основ"""
+    config = dict(intents.DEFAULT_INTENTS)
+    for i in range(extra):
+        config[f"extra_{i}"] = {"stems": tuple(_word(rng) + "ж" + _word(rng) for _ in range(10))}
+    return config
+
+
+def make_corpus(config: Dict[str, Dict[str, tuple]], size: int, rng: random.Random) -> List[str]:
+    """Сообщения из случайных слов; в 20% вставлена основа, в 5% - фраза целиком"""
+    stems = [stem for patterns in config.values() for stem in patterns.get("stems", ())]
+    phrases = [phrase for patterns in config.values() for phrase in patterns.get("phrases", ())]
+    corpus = []
+    for _ in range(size):
+        roll = rng.random()
+        if roll < 0.05:
+            corpus.append(rng.choice(phrases).capitalize())
+            continue
+        words = [_word(rng) for _ in range(rng.randint(3, 25))]
+        if roll < 0.25:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(stems) + "ами")
+        corpus.append(" ".join(words))
+    return corpus
+
+
+def sequential(text: str, config: Dict[str, Dict[str, tuple]], order: Sequence[str]) -> Optional[str]:
+    """Прежний способ: проверки списков одна за другой"""
+    lowered = text.lower().strip()
+    for name in order:
+        if lowered in config[name].get("phrases", ()):
+            return name
+    for name in order:
+        if any(stem in lowered for stem in config[name].get("stems", ())):
+            return name
+    return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк распознавания намерений")
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--extra", type=int, nargs="+", default=[0, 20, 100], help="Синтетических намерений")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{args.messages} сообщений")
+    print(f"{'намерений':>10}{'последовательно, мкс':>23}{'IntentMatcher, мкс':>21}{'ускорение':>11}")
+    for extra in args.extra:
+        rng = random.Random(args.seed)
+        config = make_intents(extra, rng)
+        corpus = make_corpus(config, args.messages, rng)
+        order = list(config)
+        matcher = intents.IntentMatcher(config)
+        matcher.warm_up(order)
+
+        started = time.perf_counter()
+        expected = [sequential(text, config, order) for text in corpus]
+        baseline = time.perf_counter() - started
+
+        started = time.perf_counter()
+        actual = [matcher.classify(text, order) for text in corpus]
+        compiled = time.perf_counter() - started
+
+        mismatches = sum(1 for a, b in zip(expected, actual) if a != b)
+        if mismatches:
+            print(f"Расхождений с последовательной проверкой: {mismatches}")
+        per_message = 1e6 / args.messages
+        print(
+            f"{len(config):>10}{baseline * per_message:>23.2f}{compiled * per_message:>21.2f}"
+            f"{baseline / compiled:>10.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Бенчмарк сжатия JSON колонок goal_scenarios
+
+Заполняет временную БД сценариями в прежнем формате (JSON текстом) с
+историей диалога разной длины, затем пересжимает колонки миграцией
+database.compress_scenario_json в zlib и zstd (если установлен zstandard).
+Для каждого формата печатает:
+- размер файла БД после VACUUM, средний размер JSON колонок строки и долю
+  строк, которым нужны overflow страницы;
+- время get_scenario_state (новое соединение на вызов, как в боте);
+- время чтения и распаковки строки по уже открытому соединению (без
+  накладных расходов на соединение видна стоимость распаковки).
+
+Текст истории собирается из словаря русских слов, поэтому степень сжатия
+на реальных диалогах может отличаться.
+
+Запуск: python benchmarks/bench_json_compression.py --scenarios 100000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import database
+import tenancy
+
+BOT_ID = 1001
+WORDS = (
+    "цель неделя план результат критерий успех каждый день месяц книга бег тренировка спорт работа "
+    "проект деньги накопить прочитать выучить английский слово минута час утро вечер привычка "
+    "задача шаг первый второй третий помочь понять сделать начать закончить хорошо отлично давай "
+    "сформулируем измеримый конкретный срок прогресс отметка дневник семья здоровье вес килограмм "
+    "курс экзамен сдать найти новый запустить канал блог ремонт кухня путешествие поездка море горы "
+    "медитация сон вода питание зал бассейн велосипед километр марафон полумарафон рубль тысяча"
+).split()
+GOALS = [
+    "Пробежать полумарафон", "Выучить 500 английских слов", "Прочитать 12 книг",
+    "Накопить 300 тысяч рублей", "Сбросить 6 кг", "Запустить телеграм-канал",
+    "Сдать экзамен на права", "Медитировать каждый день", "Сделать ремонт на кухне",
+    "Найти новую работу"
+]
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def make_history(rng: random.Random) -> List[Dict[str, str]]:
+    """История диалога: от 2 до 20 сообщений по 1-6 предложений"""
+    return [
+        {
+            "role": "user" if i % 2 else "assistant",
+            "content": " ".join(_sentence(rng, rng.randint(5, 14)) for _ in range(rng.randint(1, 6)))
+        }
+        for i in range(rng.randint(2, 20))
+    ]
+
+
+def populate(path: str, scenarios: int, seed: int = 1) -> None:
+    """Сценарии в прежнем формате: JSON колонки текстом"""
+    rng = random.Random(seed)
+    now = datetime.now()
+    with sqlite3.connect(path) as db:
+        db.executemany(
+            "INSERT INTO goal_scenarios (bot_id, user_id, stage, all_goals, selected_goals, current_goal_index, "
+            "conversation_history, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                (
+                    BOT_ID, user_id, "defining_success_criteria",
+                    json.dumps(rng.sample(GOALS, rng.randint(3, 10)), ensure_ascii=False),
+                    json.dumps(
+                        [{"text": goal, "success_criteria": _sentence(rng, 8)} for goal in rng.sample(GOALS, 3)],
+                        ensure_ascii=False
+                    ),
+                    rng.randint(0, 2),
+                    json.dumps(make_history(rng), ensure_ascii=False),
+                    now
+                )
+                for user_id in range(1, scenarios + 1)
+            )
+        )
+        db.commit()
+
+
+def column_bytes(path: str) -> Tuple[float, float]:
+    """
+    Средний размер JSON колонок строки в байтах и доля строк (%), которые не
+    помещаются в лист B-дерева и занимают overflow страницы (лишнее чтение с диска)
+    """
+    with sqlite3.connect(path) as db:
+        page_size = db.execute("PRAGMA page_size").fetchone()[0]
+        # Остальные колонки и заголовок записи - около 100 байт
+        total, overflow, rows = db.execute(
+            "SELECT SUM(size), SUM(size + 100 > ?), COUNT(*) FROM ("
+            "SELECT LENGTH(CAST(all_goals AS BLOB)) + LENGTH(CAST(selected_goals AS BLOB)) "
+            "+ LENGTH(CAST(conversation_history AS BLOB)) AS size FROM goal_scenarios)",
+            (page_size - 35,)
+        ).fetchone()
+    return total / rows, overflow / rows * 100
+
+
+def file_size(path: str) -> float:
+    """Размер файла БД в МБ после VACUUM"""
+    with sqlite3.connect(path) as db:
+        db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        db.execute("VACUUM")
+    return os.path.getsize(path) / 2 ** 20
+
+
+async def read_latency(ids: List[int]) -> float:
+    """Медиана времени get_scenario_state, мкс"""
+    samples = []
+    for user_id in ids:
+        started = time.perf_counter()
+        await database.get_scenario_state(user_id)
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1e6
+
+
+def decode_latency(path: str, ids: List[int]) -> float:
+    """Среднее время чтения и распаковки строки по открытому соединению, мкс"""
+    with sqlite3.connect(path) as db:
+        started = time.perf_counter()
+        for user_id in ids:
+            row = db.execute(
+                "SELECT all_goals, selected_goals, conversation_history FROM goal_scenarios "
+                "WHERE bot_id = ? AND user_id = ?", (BOT_ID, user_id)
+            ).fetchone()
+            for value in row:
+                database.decode_json(value, [])
+        return (time.perf_counter() - started) / len(ids) * 1e6
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк сжатия JSON колонок сценариев")
+    parser.add_argument("--scenarios", type=int, default=100_000)
+    parser.add_argument("--reads", type=int, default=2000)
+    args = parser.parse_args()
+
+    codecs = ["zlib"] + (["zstd"] if database.zstandard else [])
+    tenancy.current_bot_id.set(BOT_ID)
+    rng = random.Random(2)
+    ids = [rng.randint(1, args.scenarios) for _ in range(args.reads)]
+    with tempfile.TemporaryDirectory() as directory:
+        database.DB_NAME = os.path.join(directory, "bench.db")
+        await database.init_db(legacy_bot_id=BOT_ID)
+        populate(database.DB_NAME, args.scenarios)
+
+        print(f"{args.scenarios} сценариев, {args.reads} чтений")
+        print(
+            f"{'формат':>8}{'файл, МБ':>10}{'JSON, байт/стр':>16}{'overflow, %':>13}"
+            f"{'get_scenario_state, мкс':>25}{'чтение+распаковка, мкс':>24}"
+        )
+        for codec in ["text"] + codecs:
+            migration = ""
+            if codec != "text":
+                database.JSON_CODEC = codec
+                started = time.perf_counter()
+                await database.compress_scenario_json()
+                migration = f"   (миграция {time.perf_counter() - started:.1f} с)"
+            size = file_size(database.DB_NAME)
+            row_bytes, overflow = column_bytes(database.DB_NAME)
+            print(
+                f"{codec:>8}{size:>10.1f}{row_bytes:>16.0f}{overflow:>13.1f}"
+                f"{await read_latency(ids):>25.1f}{decode_latency(database.DB_NAME, ids):>24.1f}{migration}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,67 @@
+"""
+Микробенчмарк диспетчеризации кнопок меню
+
+Сравнивает стоимость маршрутизации одного сообщения при последовательной
+проверке фильтров `F.text == "..."` (как это делает aiogram) и при поиске
+в словаре MenuDispatcher, в зависимости от количества кнопок.
+
+Запуск: python benchmarks/bench_menu_dispatch.py
+"""
+import os
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import F
+from aiogram.types import Chat, Message
+
+from menu_dispatch import MenuDispatcher
+
+ITEM_COUNTS = [5, 10, 25, 50, 100, 250]
+ITERATIONS = 20000
+
+
+async def _noop(message: Message) -> None:
+    pass
+
+
+def bench(items: int) -> tuple[float, float]:
+    """Вернуть стоимость одного обновления (мкс) для фильтров и для словаря"""
+    texts = [f"Кнопка меню №{i}" for i in range(items)]
+    filters = [F.text == text for text in texts]
+    menu = MenuDispatcher()
+    for text in texts:
+        menu.button(text)(_noop)
+
+    # Худший случай для фильтров - последняя кнопка или текст не из меню
+    message = Message(
+        message_id=1,
+        date=datetime.now(),
+        chat=Chat(id=1, type="private"),
+        text="Произвольный текст пользователя"
+    )
+
+    def linear():
+        for magic in filters:
+            if magic.resolve(message):
+                return magic
+
+    def hashed():
+        return menu.resolve(message.text)
+
+    linear_us = timeit.timeit(linear, number=ITERATIONS) / ITERATIONS * 1e6
+    hashed_us = timeit.timeit(hashed, number=ITERATIONS) / ITERATIONS * 1e6
+    return linear_us, hashed_us
+
+
+def main() -> None:
+    print(f"{'кнопок':>8} {'фильтры, мкс':>14} {'словарь, мкс':>14} {'ускорение':>10}")
+    for items in ITEM_COUNTS:
+        linear_us, hashed_us = bench(items)
+        print(f"{items:>8} {linear_us:>14.2f} {hashed_us:>14.3f} {linear_us / hashed_us:>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Бенчмарк памяти и соединений: N ботов отдельными процессами и в одном процессе
+
+Запускает тестовый Bot API (benchmarks/fake_bot_api.py) и бота в двух режимах:
+N процессов `python bot.py` с BOT_TOKEN и один процесс с BOT_TOKENS из N
+токенов. Когда все боты начали долгий опрос, считается суммарная резидентная
+память процессов (Linux, /proc) и количество соединений, открытых с Bot API.
+
+Запуск: python benchmarks/bench_multibot.py --bots 1 5 10
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from typing import List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _stats(port: int) -> dict:
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/stats") as response:
+        return json.loads(response.read())
+
+
+def _rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def _start_bot(tokens: List[str], port: int, workdir: str) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        BOT_TOKENS=",".join(tokens),
+        BOT_TOKEN="",
+        TELEGRAM_API_URL=f"http://127.0.0.1:{port}",
+        OPENAI_API_KEY="",
+        PRECOMPUTE_PROMPTS="0",
+        METRICS_PORT=""
+    )
+    return subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "bot.py")],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+def run(bots: int, shared: bool, port: int, settle: float, timeout: float = 120) -> dict:
+    # Токены уникальны для каждого запуска, чтобы отличать начавших опрос ботов
+    tokens = [f"{100 + i}:{'shared' if shared else 'separate'}{bots}" for i in range(bots)]
+    groups = [tokens] if shared else [[token] for token in tokens]
+    before = _stats(port)
+    with tempfile.TemporaryDirectory() as workdir:
+        processes = []
+        for i, group in enumerate(groups):
+            path = os.path.join(workdir, str(i))
+            os.makedirs(path)
+            processes.append(_start_bot(group, port, path))
+        deadline = time.monotonic() + timeout
+        while set(tokens) - set(_stats(port)["polling"]) and time.monotonic() < deadline:
+            time.sleep(0.2)
+        time.sleep(settle)
+        rss = sum(_rss_mb(process.pid) for process in processes)
+        for process in processes:
+            process.send_signal(signal.SIGTERM)
+        for process in processes:
+            process.wait()
+    after = _stats(port)
+    return {"processes": len(groups), "rss_mb": rss, "connections": after["connections"] - before["connections"]}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк нескольких ботов в одном процессе")
+    parser.add_argument("--port", type=int, default=8092)
+    parser.add_argument("--bots", type=int, nargs="+", default=[1, 5, 10])
+    parser.add_argument("--settle", type=float, default=3, help="Пауза после начала опроса всеми ботами, с")
+    args = parser.parse_args()
+
+    server = subprocess.Popen([
+        sys.executable, os.path.join(ROOT, "benchmarks", "fake_bot_api.py"),
+        "--port", str(args.port), "--latency-ms", "5", "--connect-cost-ms", "0"
+    ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(50):
+            try:
+                _stats(args.port)
+                break
+            except OSError:
+                time.sleep(0.1)
+
+        print(f"{'ботов':>6}{'режим':>14}{'процессов':>11}{'память, МБ':>12}{'соединений':>12}")
+        for bots in args.bots:
+            for shared in (False, True):
+                result = run(bots, shared, args.port, args.settle)
+                mode = "один процесс" if shared else "по процессу"
+                print(
+                    f"{bots:>6}{mode:>14}{result['processes']:>11}"
+                    f"{result['rss_mb']:>12.1f}{result['connections']:>12}"
+                )
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
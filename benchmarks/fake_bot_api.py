@@ -0,0 +1,92 @@
+"""
+Локальный тестовый сервер Telegram Bot API
+
+Отвечает на POST /bot{token}/{method}: sendMessage возвращает сообщение,
+getMe - бота, getUpdates ждет таймаут долгого опроса и возвращает пустой
+список, остальные методы - true. Задержка ответа и стоимость установки
+нового соединения (имитация TLS рукопожатия с api.telegram.org) настраиваются.
+
+Запуск:
+    python benchmarks/fake_bot_api.py --port 8081 --latency-ms 30 --connect-cost-ms 150
+    TELEGRAM_API_URL=http://127.0.0.1:8081 BOT_TOKEN=1:test python bot.py
+"""
+import argparse
+import asyncio
+import time
+from typing import Optional
+
+from aiohttp import web
+
+
+class FakeBotAPI:
+    """Обработчик тестового Bot API"""
+
+    def __init__(self, latency_ms: float, connect_cost_ms: float):
+        self.latency = latency_ms / 1000
+        self.connect_cost = connect_cost_ms / 1000
+        self.connections = 0
+        self.requests = 0
+        self._transports = set()
+        self._polling = set()
+        self._message_id = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        transport = id(request.transport)
+        if transport not in self._transports:
+            # Первый запрос в соединении оплачивает его установку
+            self._transports.add(transport)
+            self.connections += 1
+            await asyncio.sleep(self.connect_cost)
+
+        method = request.match_info["method"].lower()
+        params = dict(await request.post()) if request.can_read_body else {}
+        if method == "getupdates":
+            self._polling.add(request.match_info["token"])
+            await asyncio.sleep(float(params.get("timeout", 0)))
+            return web.json_response({"ok": True, "result": []})
+
+        await asyncio.sleep(self.latency)
+        if method == "getme":
+            result = {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+        elif method == "sendmessage":
+            self._message_id += 1
+            result = {
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+                "text": params.get("text", "")
+            }
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "connections": self.connections,
+            "requests": self.requests,
+            "polling": sorted(self._polling)
+        })
+
+
+def create_app(latency_ms: float = 30, connect_cost_ms: float = 150) -> web.Application:
+    """Создать приложение тестового сервера"""
+    api = FakeBotAPI(latency_ms, connect_cost_ms)
+    app = web.Application()
+    app["api"] = api
+    app.router.add_post("/bot{token}/{method}", api.handle)
+    app.router.add_get("/stats", api.stats)
+    return app
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Тестовый сервер Telegram Bot API")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=30)
+    parser.add_argument("--connect-cost-ms", type=float, default=150)
+    args = parser.parse_args(argv)
+    web.run_app(create_app(args.latency_ms, args.connect_cost_ms), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
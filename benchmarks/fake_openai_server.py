@@ -0,0 +1,98 @@
+"""
+Локальный тестовый OpenAI-совместимый сервер
+
+Отвечает на POST /v1/chat/completions и GET /v1/models/{model} с настраиваемой
+задержкой (логнормальное распределение с редкими "хвостами"), чтобы проверять
+генерацию, хеджирование и выбор модели без реального API.
+
+Запуск:
+    python benchmarks/fake_openai_server.py --port 8089 --median-ms 300 --tail-ms 3000 --tail-rate 0.05
+    OPENAI_API_KEY=test OPENAI_BASE_URL=http://127.0.0.1:8089/v1 python precompute_prompts.py
+"""
+import argparse
+import asyncio
+import math
+import random
+import time
+from typing import Optional
+
+from aiohttp import web
+
+
+class FakeOpenAI:
+    """Обработчики тестового сервера"""
+
+    def __init__(self, median_ms: float, tail_ms: float, tail_rate: float, error_rate: float):
+        self.median_ms = median_ms
+        self.tail_ms = tail_ms
+        self.tail_rate = tail_rate
+        self.error_rate = error_rate
+        self.requests = 0
+
+    def _delay(self) -> float:
+        if random.random() < self.tail_rate:
+            return self.tail_ms / 1000
+        return random.lognormvariate(math.log(self.median_ms / 1000), 0.3)
+
+    async def chat_completions(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        self.requests += 1
+        await asyncio.sleep(self._delay())
+        if random.random() < self.error_rate:
+            return web.json_response({"error": {"message": "fake server error"}}, status=500)
+        prompt = body["messages"][-1]["content"]
+        content = f"Как ты поймешь, что цель достигнута? (тестовый ответ #{self.requests}, модель {body['model']})"
+        return web.json_response({
+            "id": f"chatcmpl-fake-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": len(prompt) // 3, "completion_tokens": len(content) // 3,
+                      "total_tokens": (len(prompt) + len(content)) // 3}
+        })
+
+    async def model(self, request: web.Request) -> web.Response:
+        return web.json_response({"id": request.match_info["model"], "object": "model", "owned_by": "fake"})
+
+
+# Ключ приложения, по которому доступны обработчики (например, счетчик запросов в тестах)
+FAKE = web.AppKey("fake", FakeOpenAI)
+
+
+def create_app(
+    median_ms: float = 300,
+    tail_ms: float = 3000,
+    tail_rate: float = 0.05,
+    error_rate: float = 0.0
+) -> web.Application:
+    """Создать приложение тестового сервера"""
+    fake = FakeOpenAI(median_ms, tail_ms, tail_rate, error_rate)
+    app = web.Application()
+    app[FAKE] = fake
+    app.router.add_post("/v1/chat/completions", fake.chat_completions)
+    app.router.add_get("/v1/models/{model}", fake.model)
+    return app
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Тестовый OpenAI-совместимый сервер")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--median-ms", type=float, default=300)
+    parser.add_argument("--tail-ms", type=float, default=3000)
+    parser.add_argument("--tail-rate", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args(argv)
+    web.run_app(
+        create_app(args.median_ms, args.tail_ms, args.tail_rate, args.error_rate),
+        host="127.0.0.1",
+        port=args.port
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,417 @@
+"""
+Набор микробенчмарков горячих путей сценария и БД с контролем регрессий
+
+Замеряются:
+- goal_scenario: разбор ввода и выбора целей, сборка сообщений и клавиатуры,
+  ScenarioState.to_dict/from_dict;
+- database: все публичные функции модуля на временной БД, заполненной
+  синтетическими пользователями, сценариями, событиями и т.д. (--users,
+  например 10000 100000 1000000).
+
+Каждый замер - медиана нескольких серий (--repeat); число вызовов в серии
+подбирается так, чтобы серия шла не меньше --min-time секунд. Функции,
+которые расходуют данные (удаление, архивация, чистка), вызываются на новых
+строках и не больше, чем их заполнено.
+
+Результаты сохраняются в JSON (--save, по умолчанию в benchmarks/baselines/)
+и сравниваются с сохраненной базой (--compare): замедление больше --threshold
+помечается как регрессия, и скрипт завершается с кодом 1.
+
+Запуск:
+    python benchmarks/microbench.py --users 10000 100000 --save
+    python benchmarks/microbench.py --users 10000 100000 --compare benchmarks/baselines/<файл>.json
+    python benchmarks/microbench.py --results new.json --compare old.json  # сравнить два файла
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import database
+import tenancy
+from goal_scenario import Goal, GoalSettingScenario, ScenarioStage, ScenarioState, build_criteria_user_prompt
+
+BASELINES_DIR = os.path.join(ROOT, "benchmarks", "baselines")
+BOT_ID = 1001
+
+GOALS = [
+    "Пробежать полумарафон", "Выучить 500 английских слов", "Прочитать 12 книг",
+    "Накопить 300 тысяч рублей", "Сбросить 6 кг", "Запустить телеграм-канал",
+    "Сдать экзамен на права", "Медитировать каждый день", "Сделать ремонт на кухне",
+    "Найти новую работу"
+]
+HISTORY = [
+    {"role": "assistant", "content": "Давай сформулируем критерий успеха для цели «Пробежать полумарафон»."},
+    {"role": "user", "content": "Пробегу 21 км быстрее двух с половиной часов"},
+    {"role": "assistant", "content": "Отлично! Критерий измеримый. Переходим к следующей цели."},
+    {"role": "user", "content": "Прочитаю 12 книг, по одной в месяц, и напишу по каждой короткий конспект"},
+]
+STAGES = [stage.value for stage in ScenarioStage if stage is not ScenarioStage.INTRODUCTION]
+
+
+@dataclass
+class Case:
+    """Замеряемая функция: fn(i) вызывается с номером вызова (синхронная или корутина)"""
+    name: str
+    fn: Callable[[int], Any]
+    # Сколько вызовов функции хватит заполненных данных (None - без ограничения)
+    budget: Optional[int] = None
+
+
+def make_state(user_id: int = 1) -> ScenarioState:
+    """Типичное состояние сценария на этапе критериев успеха"""
+    return ScenarioState(
+        user_id=user_id,
+        stage=ScenarioStage.DEFINING_SUCCESS_CRITERIA,
+        all_goals=list(GOALS),
+        selected_goals=[
+            Goal(text=GOALS[0], success_criteria="Пробегу 21 км быстрее двух с половиной часов"),
+            Goal(text=GOALS[2], success_criteria="По одной книге в месяц"),
+            Goal(text=GOALS[3]),
+        ],
+        current_goal_index=2,
+        conversation_history=list(HISTORY)
+    )
+
+
+# ========== goal_scenario ==========
+
+def scenario_cases() -> List[Case]:
+    scenario = GoalSettingScenario()
+    state = make_state()
+    state_dict = state.to_dict()
+    five = GOALS[:5]
+    selected = state.selected_goals
+    return [
+        Case("scenario.process_goals_input[add]", lambda i: scenario.process_goals_input("Выучить испанский", list(five))),
+        Case("scenario.process_goals_input[multiline]", lambda i: scenario.process_goals_input("\n".join(GOALS), [])),
+        Case("scenario.process_goals_input[done]", lambda i: scenario.process_goals_input("Готово!", list(five))),
+        Case("scenario.process_goals_selection[valid]", lambda i: scenario.process_goals_selection("1, 4, 7", GOALS)),
+        Case("scenario.process_goals_selection[invalid]", lambda i: scenario.process_goals_selection("первую и третью", GOALS)),
+        Case("scenario.render.introduction", lambda i: scenario.get_introduction_message()),
+        Case("scenario.render.goals_selection", lambda i: scenario.get_goals_selection_message(GOALS, inline=True)),
+        Case("scenario.render.goals_keyboard", lambda i: scenario.get_goals_selection_keyboard(GOALS, mask=0b101)),
+        Case("scenario.render.criteria_prompt", lambda i: build_criteria_user_prompt(GOALS[0], 1, 3)),
+        Case("scenario.render.finalization", lambda i: scenario.get_finalization_message(selected)),
+        Case("scenario.state.to_dict", lambda i: state.to_dict()),
+        Case("scenario.state.from_dict", lambda i: ScenarioState.from_dict(state_dict)),
+    ]
+
+
+# ========== database ==========
+
+def populate(path: str, users: int, seed: int = 1) -> Dict[str, int]:
+    """
+    Заполнение БД синтетическими данными напрямую через sqlite3
+
+    Returns:
+        Количество строк в наполненных таблицах (для бюджетов расходующих функций)
+    """
+    rng = random.Random(seed)
+    now = datetime.now()
+    # JSON колонки - в текущем формате хранения (см. database.encode_json)
+    history = database.encode_json(HISTORY * 3)
+    goal_sets = [database.encode_json(rng.sample(GOALS, rng.randint(3, 10))) for _ in range(64)]
+    selected = database.encode_json(make_state().to_dict()["selected_goals"])
+    counts = {"users": users}
+    with sqlite3.connect(path) as db:
+        db.executemany(
+            "INSERT INTO users (bot_id, user_id, username, name, age, city, interests, is_active, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                (BOT_ID, user_id, f"user{user_id}", "Пользователь", 18 + user_id % 50, "Москва",
+                 "спорт, книги, путешествия", int(user_id % 20 != 0), now, now)
+                for user_id in range(1, users + 1)
+            )
+        )
+        # Сценарии у 80% пользователей, последняя активность - за последние полгода
+        db.executemany(
+            "INSERT INTO goal_scenarios (bot_id, user_id, stage, all_goals, selected_goals, current_goal_index, "
+            "conversation_history, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                (BOT_ID, user_id, rng.choice(STAGES), rng.choice(goal_sets), selected, user_id % 3, history,
+                 now - timedelta(days=180), now - timedelta(minutes=rng.randrange(180 * 24 * 60)))
+                for user_id in range(1, users + 1) if user_id % 5
+            )
+        )
+        counts["completed_old"] = db.execute(
+            "SELECT COUNT(*) FROM goal_scenarios WHERE stage = ? AND updated_at < ?",
+            (ScenarioStage.COMPLETED.value, now - timedelta(days=30))
+        ).fetchone()[0]
+        # Журнал событий: по одному событию на пользователя за последние 120 дней
+        db.executemany(
+            "INSERT INTO scenario_events (created_at, bot_id, user_id, kind, name, detail) VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                (now - timedelta(minutes=rng.randrange(120 * 24 * 60)), BOT_ID, user_id, "stage", rng.choice(STAGES), None)
+                for user_id in range(1, users + 1)
+            )
+        )
+        counts["old_events"] = db.execute(
+            "SELECT COUNT(*) FROM scenario_events WHERE created_at < ?", (now - timedelta(days=90),)
+        ).fetchone()[0]
+        db.executemany(
+            "INSERT INTO scenario_daily_stats (day, bot_id, kind, name, count) VALUES (?, ?, ?, ?, ?)",
+            (
+                ((now - timedelta(days=day)).date().isoformat(), BOT_ID, "stage", stage, rng.randrange(1000))
+                for day in range(120) for stage in STAGES
+            )
+        )
+        counts["fsm_spill"] = min(users, 20_000)
+        db.executemany(
+            "INSERT INTO fsm_spill (storage_key, state, data) VALUES (?, ?, ?)",
+            ((f"fsm:{i}", "GoalSetting:collecting", '{"goals": []}') for i in range(counts["fsm_spill"]))
+        )
+        db.executemany(
+            "INSERT INTO processed_updates (bot_id, update_id) VALUES (?, ?)",
+            ((BOT_ID, update_id) for update_id in range(1, 10_001))
+        )
+        db.executemany(
+            "INSERT INTO criteria_prompts (goal_key, variant, text) VALUES (?, ?, ?)",
+            ((f"цель {i}", variant, "Как ты поймешь, что цель достигнута?") for i in range(300) for variant in range(3))
+        )
+        db.execute("INSERT INTO broadcasts (bot_id, text) VALUES (?, ?)", (BOT_ID, "Новости"))
+        db.commit()
+    return counts
+
+
+def database_cases(users: int, counts: Dict[str, int]) -> List[Case]:
+    rng = random.Random(2)
+    ids = [rng.randint(1, users) for _ in range(4096)]
+
+    def uid(i: int) -> int:
+        return ids[i % len(ids)]
+
+    state = make_state().to_dict()
+    now = datetime.now()
+    events = [(now, BOT_ID, uid(i), "stage", STAGES[i % len(STAGES)], None) for i in range(100)]
+    rollups = [((now.date().isoformat(), BOT_ID, "stage", stage), 20) for stage in STAGES]
+    records = [(f"bench:{i}", "GoalSetting:collecting", '{"goals": []}') for i in range(100)]
+
+    async def drain(iterator) -> None:
+        async for _ in iterator:
+            pass
+
+    def case(name: str, fn: Callable[[int], Any], budget: Optional[int] = None) -> Case:
+        return Case(f"db.{name}[users={users}]", fn, budget)
+
+    return [
+        # Чтение
+        case("init_db", lambda i: database.init_db(legacy_bot_id=BOT_ID)),
+        case("warm_up", lambda i: database.warm_up()),
+        case("get_user", lambda i: database.get_user(uid(i))),
+        case("get_total_users", lambda i: database.get_total_users()),
+        case("get_scenario_state", lambda i: database.get_scenario_state(uid(i))),
+        case("get_active_user_ids", lambda i: database.get_active_user_ids(uid(i), 1000)),
+        case("get_broadcast", lambda i: database.get_broadcast(1)),
+        case("get_running_broadcasts", lambda i: database.get_running_broadcasts()),
+        case("get_idle_scenarios", lambda i: database.get_idle_scenarios(
+            ScenarioStage.COLLECTING_GOALS.value, now - timedelta(days=1), None, 100
+        )),
+        case("get_criteria_prompts", lambda i: database.get_criteria_prompts()),
+        case("get_processed_updates", lambda i: database.get_processed_updates(BOT_ID, 1000)),
+        case("get_daily_stats", lambda i: database.get_daily_stats((now - timedelta(days=30)).date().isoformat())),
+        case("iter_scenario_goals", lambda i: drain(database.iter_scenario_goals())),
+        case("iter_users_with_scenarios", lambda i: drain(database.iter_users_with_scenarios(with_history=True))),
+        # Запись
+        case("add_user", lambda i: database.add_user(uid(i), "user", "Пользователь", 30, "Казань", "книги")),
+        case("save_scenario_state", lambda i: database.save_scenario_state(uid(i), state)),
+        case("set_user_active", lambda i: database.set_user_active(uid(i // 2), i % 2 == 1)),
+        case("mark_scenarios_nudged", lambda i: database.mark_scenarios_nudged(ids[i % 40 * 100:i % 40 * 100 + 100])),
+        case("create_broadcast", lambda i: database.create_broadcast("Новости")),
+        case("update_broadcast", lambda i: database.update_broadcast(1, last_user_id=i, sent=i)),
+        case("save_criteria_prompts", lambda i: database.save_criteria_prompts(f"цель {i % 300}", ["а", "б", "в"])),
+        case("spill_fsm_records", lambda i: database.spill_fsm_records(records)),
+        case("save_processed_updates", lambda i: database.save_processed_updates(
+            BOT_ID, list(range(10_001 + i * 100, 10_101 + i * 100)), i * 100
+        )),
+        case("save_events", lambda i: database.save_events(events, rollups)),
+        # Расходуют данные: каждый вызов работает с новыми строками
+        case("pop_fsm_record", lambda i: database.pop_fsm_record(f"fsm:{i}"), counts["fsm_spill"]),
+        case("delete_scenario_state", lambda i: database.delete_scenario_state(i + 1), users),
+        case("delete_user", lambda i: database.delete_user(i + 1), users),
+        case("archive_scenarios_batch", lambda i: database.archive_scenarios_batch(
+            ScenarioStage.COMPLETED.value, now - timedelta(days=30), 100
+        ), counts["completed_old"] // 100),
+        case("prune_events", lambda i: database.prune_events(now - timedelta(days=90), 100), counts["old_events"] // 100),
+        # Обслуживание
+        case("incremental_vacuum", lambda i: database.incremental_vacuum(1000)),
+        case("close", lambda i: database.close()),
+        case("vacuum", lambda i: database.vacuum(), 5),
+    ]
+
+
+# ========== Замеры ==========
+
+async def _time_calls(fn: Callable[[int], Any], start: int, number: int) -> float:
+    """Время number вызовов fn(start), fn(start + 1), ... (корутины ожидаются)"""
+    started = time.perf_counter()
+    for i in range(start, start + number):
+        result = fn(i)
+        if asyncio.iscoroutine(result):
+            await result
+    return time.perf_counter() - started
+
+
+async def measure(case: Case, repeat: int, min_time: float) -> Dict[str, Any]:
+    """
+    Медиана и минимум времени одного вызова по repeat сериям
+
+    Число вызовов в серии удваивается, пока серия не займет min_time; для
+    расходующих функций серии ограничены бюджетом case.budget.
+    """
+    # Прогревочный вызов: холодный кеш страниц не должен сокращать серии
+    await _time_calls(case.fn, 0, 1)
+    calls = 1
+    number = 1
+    # Подбор числа вызовов
+    while True:
+        elapsed = await _time_calls(case.fn, calls, number)
+        calls += number
+        if elapsed >= min_time:
+            break
+        if case.budget is not None and calls + number * 2 * (repeat + 1) > case.budget:
+            break
+        number *= 2
+    if case.budget is not None:
+        number = max(1, min(number, (case.budget - calls) // repeat))
+        repeat = max(1, min(repeat, case.budget - calls))
+    samples = []
+    for _ in range(repeat):
+        samples.append(await _time_calls(case.fn, calls, number) / number)
+        calls += number
+    return {"per_call": statistics.median(samples), "best": min(samples), "number": number, "samples": len(samples)}
+
+
+async def run_cases(cases: List[Case], repeat: int, min_time: float, results: Dict[str, Dict[str, Any]]) -> None:
+    for case in cases:
+        result = results[case.name] = await measure(case, repeat, min_time)
+        print(f"{case.name:<58}{result['per_call'] * 1e6:>14.1f} мкс  (x{result['number']}, серий {result['samples']})")
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Dict[str, Any]]:
+    """Выполнить все замеры, отобранные --only"""
+    results: Dict[str, Dict[str, Any]] = {}
+
+    def selected(cases: List[Case]) -> List[Case]:
+        return [case for case in cases if not args.only or any(part in case.name for part in args.only)]
+
+    await run_cases(selected(scenario_cases()), args.repeat, args.min_time, results)
+
+    tenancy.current_bot_id.set(BOT_ID)
+    for users in args.users:
+        with tempfile.TemporaryDirectory() as directory:
+            database.DB_NAME = os.path.join(directory, "bench.db")
+            await database.init_db(legacy_bot_id=BOT_ID)
+            started = time.perf_counter()
+            counts = populate(database.DB_NAME, users)
+            size = os.path.getsize(database.DB_NAME) / 2 ** 20
+            print(f"\nБД: {users} пользователей, {size:.0f} МБ, заполнена за {time.perf_counter() - started:.1f} с")
+            await run_cases(selected(database_cases(users, counts)), args.repeat, args.min_time, results)
+    return results
+
+
+def metadata() -> Dict[str, str]:
+    """Окружение замера: версии, платформа, коммит"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = ""
+    return {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[str]:
+    """
+    Сравнить результаты с базой и напечатать таблицу изменений
+
+    Returns:
+        Имена замеров, замедлившихся больше чем на threshold (доля)
+    """
+    old, new = baseline["results"], current["results"]
+    print(f"\nСравнение с базой {baseline['meta'].get('commit') or ''} от {baseline['meta'].get('created_at')}")
+    print(f"{'замер':<58}{'база, мкс':>14}{'сейчас, мкс':>14}{'изменение':>11}")
+    regressions = []
+    for name in new:
+        if name not in old:
+            continue
+        change = new[name]["per_call"] / old[name]["per_call"] - 1
+        mark = ""
+        if change > threshold:
+            regressions.append(name)
+            mark = "  РЕГРЕССИЯ"
+        elif change < -threshold:
+            mark = "  ускорение"
+        print(
+            f"{name:<58}{old[name]['per_call'] * 1e6:>14.1f}{new[name]['per_call'] * 1e6:>14.1f}"
+            f"{change * 100:>+10.1f}%{mark}"
+        )
+    missing = sum(1 for name in old if name not in new)
+    if missing:
+        print(f"Замеров базы, которых нет в текущих результатах: {missing}")
+    if regressions:
+        print(f"\nРегрессий (> {threshold * 100:.0f}%): {len(regressions)}")
+    else:
+        print(f"\nРегрессий (> {threshold * 100:.0f}%) нет")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Микробенчмарки сценария и БД с контролем регрессий")
+    parser.add_argument("--users", type=int, nargs="*", default=[10_000, 100_000], help="Размеры БД (пользователей)")
+    parser.add_argument("--only", nargs="+", help="Только замеры, имя которых содержит одну из подстрок")
+    parser.add_argument("--repeat", type=int, default=5, help="Серий на замер")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Минимальная длительность серии, с")
+    parser.add_argument("--save", nargs="?", const="", help="Сохранить результаты в JSON (по умолчанию в baselines/)")
+    parser.add_argument("--compare", help="JSON базы для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Допустимое замедление (доля)")
+    parser.add_argument("--results", help="Взять текущие результаты из JSON вместо замеров")
+    args = parser.parse_args()
+
+    if args.results:
+        with open(args.results, encoding="utf-8") as file:
+            current = json.load(file)
+    else:
+        current = {"meta": metadata(), "results": asyncio.run(run(args))}
+        current["meta"]["users"] = args.users
+
+    if args.save is not None:
+        path = args.save
+        if not path:
+            os.makedirs(BASELINES_DIR, exist_ok=True)
+            stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+            path = os.path.join(BASELINES_DIR, f"{stamp}-{current['meta']['commit'] or 'local'}.json")
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(current, file, ensure_ascii=False, indent=2)
+        print(f"\nРезультаты сохранены: {path}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if compare(baseline, current, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,32 +3,62 @@ import logging
 import sys
 from os import getenv
 
+# Модуль запуска импортируется до тяжелых зависимостей, чтобы замерить время их импорта
+import startup
+
 from aiogram import Bot, Dispatcher, F, Router
 from aiogram.enums import ParseMode
 from aiogram.filters import CommandStart, Command
-from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
+from aiogram.types import CallbackQuery, Message
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
 from dotenv import load_dotenv
 
+import admin
+import bot_session
+import broadcast
 import database
+import events
+import fsm_storage
 import goal_scenario
-from goal_scenario import ScenarioStage, ScenarioState, Goal
-from typing import Optional
+import history_manager
+import intents
+import lifecycle
+import loop_monitor
+import maintenance
+import metrics
+import payloads
+import precompute_prompts
+import prompt_cache
+import reminders
+import tenancy
+import update_journal
+from menu_dispatch import MenuDispatcher
+from goal_scenario import ScenarioStage, ScenarioState, Goal, GoalSelectionCallback, goals_version
+from typing import List, Optional
 
 # Загрузка переменных окружения
 load_dotenv()
-TOKEN = getenv("BOT_TOKEN")
+# Токены ботов: BOT_TOKEN или BOT_TOKENS для нескольких брендированных копий в одном процессе
+TOKENS = tenancy.load_tokens()
+# Выбор приоритетных целей кнопками (INLINE_GOAL_SELECTION=0 - только ввод номеров)
+INLINE_GOAL_SELECTION = getenv("INLINE_GOAL_SELECTION", "1") != "0"
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Инициализация бота и диспетчера
-bot = Bot(token=TOKEN, parse_mode=ParseMode.HTML)
-dp = Dispatcher(storage=MemoryStorage())
+# Инициализация ботов и диспетчера: боты используют общие роутеры и общий пул соединений с Bot API
+session = bot_session.create_session()
+bots = [Bot(token=token, parse_mode=ParseMode.HTML, session=session) for token in TOKENS]
+# FSM контексты неактивных пользователей вытесняются из памяти (см. fsm_storage.py)
+storage = fsm_storage.create_storage()
+dp = Dispatcher(storage=storage)
 router = Router()
+menu = MenuDispatcher()
+journal = update_journal.create_middleware()
+# Корректная остановка по SIGTERM: ожидание обработчиков и запись буферов (см. lifecycle.py)
+shutdown = lifecycle.create_lifecycle()
 
 
 # Состояния для сбора информации о пользователе
@@ -39,6 +69,10 @@ class UserRegistration(StatesGroup):
     waiting_for_interests = State()
 
 
+# Во время регистрации любой текст (в том числе текст кнопок) - это ответ пользователя
+menu.skip_state(*UserRegistration.__all_states__)
+
+
 # Состояния для сценария целеполагания
 class GoalScenario(StatesGroup):
     collecting_goals = State()
@@ -47,19 +81,9 @@ class GoalScenario(StatesGroup):
     finalization = State()
 
 
-# Клавиатура главного меню
+# Клавиатура главного меню (создается один раз в модуле payloads)
 def get_main_menu():
-    keyboard = ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="📋 Мой профиль"), KeyboardButton(text="✏️ Редактировать профиль")],
-            [KeyboardButton(text="🎯 Целеполагание на 12 недель")],
-            [KeyboardButton(text="ℹ️ Информация"), KeyboardButton(text="❓ Помощь")],
-            [KeyboardButton(text="📊 Статистика бота")]
-        ],
-        resize_keyboard=True,
-        input_field_placeholder="Выберите пункт меню..."
-    )
-    return keyboard
+    return payloads.MAIN_MENU
 
 
 # Инициализация сценария целеполагания (ленивая загрузка)
@@ -88,7 +112,9 @@ async def command_start_handler(message: Message, state: FSMContext) -> None:
     user = await database.get_user(user_id)
     
     if user:
-        # Пользователь уже зарегистрирован
+        # Пользователь уже зарегистрирован; если он ранее блокировал бота, снова включаем рассылки
+        if not user.get('is_active', 1):
+            await database.set_user_active(user_id, True)
         await message.answer(
             f"👋 С возвращением, <b>{user['name']}</b>!\n\n"
             f"Рад снова видеть тебя! Используй меню ниже для навигации.",
@@ -102,7 +128,7 @@ async def command_start_handler(message: Message, state: FSMContext) -> None:
             f"Я помогу тебе познакомиться с нашим сообществом. "
             f"Для начала давай соберем немного информации о тебе.\n\n"
             f"<b>Как тебя зовут?</b> (Введи свое имя)",
-            reply_markup=ReplyKeyboardRemove()
+            reply_markup=payloads.REMOVE_KEYBOARD
         )
         await state.set_state(UserRegistration.waiting_for_name)
 
@@ -186,7 +212,7 @@ async def process_interests(message: Message, state: FSMContext) -> None:
 
 
 # Обработчик кнопки "Мой профиль"
-@router.message(F.text == "📋 Мой профиль")
+@menu.button("📋 Мой профиль")
 async def show_profile(message: Message) -> None:
     user_id = message.from_user.id
     user = await database.get_user(user_id)
@@ -206,60 +232,30 @@ async def show_profile(message: Message) -> None:
 
 
 # Обработчик кнопки "Редактировать профиль"
-@router.message(F.text == "✏️ Редактировать профиль")
+@menu.button("✏️ Редактировать профиль")
 async def edit_profile(message: Message, state: FSMContext) -> None:
     await message.answer(
         "🔄 Начинаем обновление профиля!\n\n"
         "<b>Как тебя зовут?</b> (Введи новое имя)",
-        reply_markup=ReplyKeyboardRemove()
+        reply_markup=payloads.REMOVE_KEYBOARD
     )
     await state.set_state(UserRegistration.waiting_for_name)
 
 
 # Обработчик кнопки "Информация"
-@router.message(F.text == "ℹ️ Информация")
+@menu.button("ℹ️ Информация")
 async def show_info(message: Message) -> None:
-    await message.answer(
-        "ℹ️ <b>О боте</b>\n\n"
-        "Этот бот создан для управления сообществом и общения с участниками.\n\n"
-        "<b>Возможности:</b>\n"
-        "• Регистрация новых участников\n"
-        "• Управление профилем\n"
-        "• 🎯 Целеполагание на 12 недель - цифровой ассистент для постановки и достижения целей\n"
-        "• Просмотр статистики\n"
-        "• Получение помощи\n\n"
-        "💡 Используй меню для навигации по боту!"
-    )
+    await message.answer(payloads.registry.text("info"))
 
 
 # Обработчик кнопки "Помощь"
-@router.message(F.text == "❓ Помощь")
+@menu.button("❓ Помощь")
 async def show_help(message: Message) -> None:
-    await message.answer(
-        "❓ <b>Помощь</b>\n\n"
-        "<b>Доступные команды:</b>\n"
-        "/start - Начать работу с ботом\n"
-        "/help - Показать это сообщение\n"
-        "/menu - Показать главное меню\n\n"
-        "<b>Кнопки меню:</b>\n"
-        "📋 <b>Мой профиль</b> - Просмотр твоего профиля\n"
-        "✏️ <b>Редактировать профиль</b> - Изменение данных профиля\n"
-        "🎯 <b>Целеполагание на 12 недель</b> - Начать сценарий постановки и планирования целей\n"
-        "ℹ️ <b>Информация</b> - Информация о боте\n"
-        "❓ <b>Помощь</b> - Это сообщение\n"
-        "📊 <b>Статистика бота</b> - Общая статистика\n\n"
-        "<b>О сценарии целеполагания:</b>\n"
-        "Сценарий поможет тебе:\n"
-        "• Сформулировать до 10 целей на 12 недель\n"
-        "• Выбрать 3 самые важные\n"
-        "• Определить критерии успеха\n"
-        "• Получить инструкцию по планированию\n\n"
-        "❔ Если у тебя есть вопросы, обратись к администратору."
-    )
+    await message.answer(payloads.registry.text("help"))
 
 
 # Обработчик кнопки "Статистика бота"
-@router.message(F.text == "📊 Статистика бота")
+@menu.button("📊 Статистика бота")
 async def show_stats(message: Message) -> None:
     total_users = await database.get_total_users()
     await message.answer(
@@ -295,13 +291,40 @@ async def load_scenario_state(user_id: int) -> Optional[ScenarioState]:
     return None
 
 
+async def ask_success_criteria(scenario_state: ScenarioState) -> str:
+    """
+    Запрос критерия успеха для текущей цели
+
+    В LLM передается история диалога сценария; сам запрос добавляется в историю
+    как реплика ассистента (сохраняется вместе с состоянием).
+    """
+    current_goal = scenario_state.selected_goals[scenario_state.current_goal_index]
+    criteria_prompt = await get_scenario_manager().get_success_criteria_prompt(
+        current_goal.text,
+        scenario_state.current_goal_index + 1,
+        len(scenario_state.selected_goals),
+        conversation_history=scenario_state.conversation_history,
+        user_id=scenario_state.user_id
+    )
+    scenario_state.conversation_history.append({"role": "assistant", "content": criteria_prompt})
+    return criteria_prompt
+
+
 async def save_scenario_state_to_db(state: ScenarioState):
     """Сохранение состояния сценария в БД"""
+    state.conversation_history = history_manager.get_history_manager().compact(
+        state.user_id,
+        state.conversation_history
+    )
     await database.save_scenario_state(state.user_id, state.to_dict())
+    # Переход на новый этап (в том числе начало и завершение сценария) - событие для воронки
+    if state.stage != state.saved_stage:
+        events.log.record(events.STAGE, state.stage.value, user_id=state.user_id)
+        state.saved_stage = state.stage
 
 
 # Запуск сценария целеполагания
-@router.message(F.text == "🎯 Целеполагание на 12 недель")
+@menu.button("🎯 Целеполагание на 12 недель")
 async def start_goal_scenario(message: Message, state: FSMContext) -> None:
     """Начало сценария целеполагания"""
     user_id = message.from_user.id
@@ -313,7 +336,7 @@ async def start_goal_scenario(message: Message, state: FSMContext) -> None:
             "⚠️ У тебя есть незавершенный сценарий. Хочешь продолжить с того места, где остановился, "
             "или начать заново?\n\n"
             "Напиши <b>\"Продолжить\"</b> или <b>\"Начать заново\"</b>",
-            reply_markup=ReplyKeyboardRemove()
+            reply_markup=payloads.REMOVE_KEYBOARD
         )
         await state.set_state(GoalScenario.collecting_goals)
         await state.update_data(action="continue_or_restart")
@@ -334,7 +357,7 @@ async def start_goal_scenario(message: Message, state: FSMContext) -> None:
     
     scenario_manager = get_scenario_manager()
     intro_message = scenario_manager.get_introduction_message()
-    await message.answer(intro_message, reply_markup=ReplyKeyboardRemove())
+    await message.answer(intro_message, reply_markup=payloads.REMOVE_KEYBOARD)
 
 
 # Обработка ввода целей
@@ -352,20 +375,21 @@ async def handle_goals_collection(message: Message, state: FSMContext) -> None:
     # Проверка на продолжение или перезапуск
     state_data = await state.get_data()
     if state_data.get("action") == "continue_or_restart":
-        user_input_lower = message.text.lower().strip()
-        if user_input_lower in ["продолжить", "продолжать"]:
+        intent = intents.matcher.classify(message.text, intents.CONTINUE_OR_RESTART)
+        if intent == "continue":
             # Восстанавливаем состояние
             await message.answer(
                 "✅ Продолжаем сценарий с того места, где остановились!",
-                reply_markup=ReplyKeyboardRemove()
+                reply_markup=payloads.REMOVE_KEYBOARD
             )
             await state.update_data(action=None)
             # Продолжаем с текущего этапа
             await continue_scenario_from_stage(message, scenario_state, state)
             return
-        elif user_input_lower in ["начать заново", "заново", "новый"]:
+        elif intent == "restart":
             # Удаляем старое состояние
             await database.delete_scenario_state(user_id)
+            history_manager.get_history_manager().forget(user_id)
             scenario_state = ScenarioState(
                 user_id=user_id,
                 stage=ScenarioStage.COLLECTING_GOALS,
@@ -378,7 +402,7 @@ async def handle_goals_collection(message: Message, state: FSMContext) -> None:
             scenario_manager = get_scenario_manager()
             await message.answer(
                 scenario_manager.get_introduction_message(),
-                reply_markup=ReplyKeyboardRemove()
+                reply_markup=payloads.REMOVE_KEYBOARD
             )
             await state.update_data(action=None)
             return
@@ -400,9 +424,7 @@ async def handle_goals_collection(message: Message, state: FSMContext) -> None:
         scenario_state.stage = ScenarioStage.SELECTING_GOALS
         await save_scenario_state_to_db(scenario_state)
         await state.set_state(GoalScenario.selecting_goals)
-        scenario_manager = get_scenario_manager()
-        selection_message = scenario_manager.get_goals_selection_message(scenario_state.all_goals)
-        await message.answer(selection_message)
+        await send_goals_selection(message, scenario_state.all_goals)
 
 
 # Обработка выбора целей
@@ -426,22 +448,112 @@ async def handle_goals_selection(message: Message, state: FSMContext) -> None:
     await message.answer(response_msg)
     
     if success:
-        # Сохраняем выбранные цели
-        scenario_state.selected_goals = [Goal(text=goal) for goal in selected_goals_list]
-        scenario_state.current_goal_index = 0
-        scenario_state.stage = ScenarioStage.DEFINING_SUCCESS_CRITERIA
-        await save_scenario_state_to_db(scenario_state)
-        await state.set_state(GoalScenario.defining_success_criteria)
-        
-        # Запрашиваем критерий успеха для первой цели
-        current_goal = scenario_state.selected_goals[0]
-        scenario_manager = get_scenario_manager()
-        criteria_prompt = await scenario_manager.get_success_criteria_prompt(
-            current_goal.text,
-            1,
-            len(scenario_state.selected_goals)
+        await start_success_criteria(message, scenario_state, selected_goals_list, state)
+
+
+async def load_goal_selection(
+    callback: CallbackQuery,
+    callback_data: GoalSelectionCallback
+) -> Optional[ScenarioState]:
+    """
+    Состояние сценария для нажатия кнопки выбора целей
+
+    Если клавиатура устарела (выбор уже сделан, сценарий начат заново или
+    клавиатура построена для другого списка целей), клавиатура убирается и
+    возвращается None.
+    """
+    scenario_state = await load_scenario_state(callback.from_user.id)
+    if (
+        not scenario_state
+        or scenario_state.stage != ScenarioStage.SELECTING_GOALS
+        or goals_version(scenario_state.all_goals) != callback_data.version
+    ):
+        await callback.answer("Этот выбор уже неактуален.")
+        await callback.message.edit_reply_markup(reply_markup=None)
+        return None
+    return scenario_state
+
+
+# Кнопка-переключатель цели в выборе целей
+@router.callback_query(GoalSelectionCallback.filter(F.action == "t"))
+async def handle_goal_toggle(
+    callback: CallbackQuery,
+    callback_data: GoalSelectionCallback
+) -> None:
+    """Переключение цели: клавиатура пересобирается из сохраненных целей и маски, БД не изменяется"""
+    scenario_state = await load_goal_selection(callback, callback_data)
+    if not scenario_state:
+        return
+    
+    scenario_manager = get_scenario_manager()
+    mask, warning = scenario_manager.toggle_goal_selection(callback_data.mask, callback_data.index)
+    if warning:
+        await callback.answer(warning)
+        return
+    
+    await callback.message.edit_reply_markup(
+        reply_markup=scenario_manager.get_goals_selection_keyboard(scenario_state.all_goals, mask)
+    )
+    await callback.answer()
+
+
+# Кнопка подтверждения выбора целей
+@router.callback_query(GoalSelectionCallback.filter(F.action == "c"))
+async def handle_goals_confirm(
+    callback: CallbackQuery,
+    callback_data: GoalSelectionCallback,
+    state: FSMContext
+) -> None:
+    """Подтверждение выбора целей кнопкой"""
+    scenario_state = await load_goal_selection(callback, callback_data)
+    if not scenario_state:
+        return
+    
+    scenario_manager = get_scenario_manager()
+    response_msg, selected_goals_list, success = scenario_manager.confirm_goals_selection(
+        callback_data.mask,
+        scenario_state.all_goals
+    )
+    if not success:
+        await callback.answer(response_msg)
+        return
+    
+    await callback.answer()
+    await callback.message.edit_text(response_msg)
+    await start_success_criteria(callback.message, scenario_state, selected_goals_list, state)
+
+
+async def send_goals_selection(message: Message, goals: List[str]) -> None:
+    """Отправка сообщения выбора целей (с клавиатурой, если включен выбор кнопками)"""
+    scenario_manager = get_scenario_manager()
+    if INLINE_GOAL_SELECTION:
+        await message.answer(
+            scenario_manager.get_goals_selection_message(goals, inline=True),
+            reply_markup=scenario_manager.get_goals_selection_keyboard(goals)
+        )
+    else:
+        await message.answer(
+            scenario_manager.get_goals_selection_message(goals),
+            reply_markup=payloads.REMOVE_KEYBOARD
         )
-        await message.answer(criteria_prompt)
+
+
+async def start_success_criteria(
+    message: Message,
+    scenario_state: ScenarioState,
+    selected_goals_list: List[str],
+    state: FSMContext
+) -> None:
+    """Сохранение выбранных целей и переход к определению критериев успеха"""
+    scenario_state.selected_goals = [Goal(text=goal) for goal in selected_goals_list]
+    scenario_state.current_goal_index = 0
+    scenario_state.stage = ScenarioStage.DEFINING_SUCCESS_CRITERIA
+    
+    # Запрашиваем критерий успеха для первой цели
+    criteria_prompt = await ask_success_criteria(scenario_state)
+    await save_scenario_state_to_db(scenario_state)
+    await state.set_state(GoalScenario.defining_success_criteria)
+    await message.answer(criteria_prompt)
 
 
 # Обработка определения критериев успеха
@@ -460,21 +572,15 @@ async def handle_success_criteria(message: Message, state: FSMContext) -> None:
     current_goal = scenario_state.selected_goals[scenario_state.current_goal_index]
     current_goal.success_criteria = message.text
     scenario_state.selected_goals[scenario_state.current_goal_index] = current_goal
+    scenario_state.conversation_history.append({"role": "user", "content": message.text})
     
     scenario_state.current_goal_index += 1
     
     # Проверяем, все ли цели обработаны
     if scenario_state.current_goal_index < len(scenario_state.selected_goals):
         # Запрашиваем критерий для следующей цели
-        next_goal = scenario_state.selected_goals[scenario_state.current_goal_index]
+        criteria_prompt = await ask_success_criteria(scenario_state)
         await save_scenario_state_to_db(scenario_state)
-        
-        scenario_manager = get_scenario_manager()
-        criteria_prompt = await scenario_manager.get_success_criteria_prompt(
-            next_goal.text,
-            scenario_state.current_goal_index + 1,
-            len(scenario_state.selected_goals)
-        )
         await message.answer(f"✅ Критерий успеха сохранен!\n\n{criteria_prompt}")
     else:
         # Все цели обработаны, переходим к инструкции по планированию
@@ -507,10 +613,10 @@ async def handle_finalization(message: Message, state: FSMContext) -> None:
         await state.clear()
         return
     
-    user_input_lower = message.text.lower().strip()
+    intent = intents.matcher.classify(message.text, intents.FINALIZATION)
     
     # Проверка на запрос декомпозиции целей
-    if any(word in user_input_lower for word in ["декомпозир", "задания", "разбить", "план", "задачи"]):
+    if intent == "decompose":
         await message.answer(
             "🎯 Отличная идея! Декомпозиция целей поможет тебе создать конкретный план действий.\n\n"
             "В разработке: функция автоматической декомпозиции целей на задания. "
@@ -524,7 +630,7 @@ async def handle_finalization(message: Message, state: FSMContext) -> None:
         return
     
     # Проверка на запрос консультации коуча
-    if any(word in user_input_lower for word in ["коуч", "консультац", "помощь", "поддержка"]):
+    if intent == "coach":
         await message.answer(
             "💼 Консультация коуча - это отличный следующий шаг!\n\n"
             "В разработке: функция подключения к профессиональным коучам. "
@@ -548,6 +654,22 @@ async def handle_finalization(message: Message, state: FSMContext) -> None:
     await state.clear()
 
 
+# Кнопка "Продолжить" из напоминания о брошенном сценарии
+@router.callback_query(F.data == payloads.NUDGE_CONTINUE)
+async def handle_nudge_continue(callback: CallbackQuery, state: FSMContext) -> None:
+    """Продолжение сценария по кнопке из напоминания"""
+    await callback.answer()
+    scenario_state = await load_scenario_state(callback.from_user.id)
+    if not scenario_state or scenario_state.stage == ScenarioStage.COMPLETED:
+        await callback.message.answer(
+            "Сценарий уже завершен. Хочешь начать новый? Нажми кнопку в меню.",
+            reply_markup=get_main_menu()
+        )
+        return
+    await state.update_data(action=None)
+    await continue_scenario_from_stage(callback.message, scenario_state, state)
+
+
 async def continue_scenario_from_stage(message: Message, scenario_state: ScenarioState, state: FSMContext):
     """Продолжение сценария с текущего этапа"""
     if scenario_state.stage == ScenarioStage.COLLECTING_GOALS:
@@ -556,44 +678,35 @@ async def continue_scenario_from_stage(message: Message, scenario_state: Scenari
             await message.answer(
                 f"Ты уже ввел {len(scenario_state.all_goals)} {'целей' if len(scenario_state.all_goals) > 1 else 'цель'}. "
                 "Продолжай вводить цели или напиши <b>\"Готово\"</b>.",
-                reply_markup=ReplyKeyboardRemove()
+                reply_markup=payloads.REMOVE_KEYBOARD
             )
         else:
             scenario_manager = get_scenario_manager()
             await message.answer(
                 scenario_manager.get_introduction_message(),
-                reply_markup=ReplyKeyboardRemove()
+                reply_markup=payloads.REMOVE_KEYBOARD
             )
     elif scenario_state.stage == ScenarioStage.SELECTING_GOALS:
         await state.set_state(GoalScenario.selecting_goals)
-        scenario_manager = get_scenario_manager()
-        await message.answer(
-            scenario_manager.get_goals_selection_message(scenario_state.all_goals),
-            reply_markup=ReplyKeyboardRemove()
-        )
+        await send_goals_selection(message, scenario_state.all_goals)
     elif scenario_state.stage == ScenarioStage.DEFINING_SUCCESS_CRITERIA:
         await state.set_state(GoalScenario.defining_success_criteria)
-        current_goal = scenario_state.selected_goals[scenario_state.current_goal_index]
-        scenario_manager = get_scenario_manager()
-        criteria_prompt = await scenario_manager.get_success_criteria_prompt(
-            current_goal.text,
-            scenario_state.current_goal_index + 1,
-            len(scenario_state.selected_goals)
-        )
-        await message.answer(criteria_prompt, reply_markup=ReplyKeyboardRemove())
+        criteria_prompt = await ask_success_criteria(scenario_state)
+        await save_scenario_state_to_db(scenario_state)
+        await message.answer(criteria_prompt, reply_markup=payloads.REMOVE_KEYBOARD)
     elif scenario_state.stage == ScenarioStage.PLANNING_INSTRUCTION:
         await state.set_state(GoalScenario.finalization)
         scenario_manager = get_scenario_manager()
         await message.answer(
             scenario_manager.get_finalization_message(scenario_state.selected_goals),
-            reply_markup=ReplyKeyboardRemove()
+            reply_markup=payloads.REMOVE_KEYBOARD
         )
     elif scenario_state.stage == ScenarioStage.FINALIZATION:
         await state.set_state(GoalScenario.finalization)
         scenario_manager = get_scenario_manager()
         await message.answer(
             scenario_manager.get_finalization_message(scenario_state.selected_goals),
-            reply_markup=ReplyKeyboardRemove()
+            reply_markup=payloads.REMOVE_KEYBOARD
         )
     else:
         # Сценарий завершен или ошибка
@@ -604,16 +717,123 @@ async def continue_scenario_from_stage(message: Message, scenario_state: Scenari
         await state.clear()
 
 
+async def check_bots() -> None:
+    """Проверка токенов и соединения с Telegram для всех ботов"""
+    for me in await asyncio.gather(*(bot.get_me() for bot in bots)):
+        logger.info(f"Бот @{me.username} (ID {me.id}) готов")
+
+
+async def warm_up_llm() -> None:
+    """Прогрев менеджера сценария и LLM клиента"""
+    # Создание SDK синхронное и тяжелое, поэтому выполняется в отдельном потоке
+    scenario_manager = await asyncio.to_thread(get_scenario_manager)
+    if scenario_manager.llm is not None:
+        await scenario_manager.llm.warm_up()
+
+
+def setup_dispatcher() -> None:
+    """Регистрация роутеров, диспетчера кнопок меню и middleware метрик"""
+    # Команды администратора проверяются раньше обработчиков состояний FSM
+    dp.include_router(admin.router)
+    dp.include_router(router)
+    menu.setup(dp)
+    
+    # Запросы к БД выполняются от имени бота, получившего обновление
+    dp.update.outer_middleware(tenancy.TenantMiddleware())
+    
+    # Обработчики, выполняющиеся в момент остановки, дожидаются завершения
+    dp.update.outer_middleware(shutdown.tracker)
+    
+    # Повторно доставленные обновления пропускаются до запуска обработчиков
+    dp.update.outer_middleware(journal)
+    
+    # Метрики: счетчик обновлений и время обработчиков
+    dp.update.outer_middleware(metrics.UpdateCounterMiddleware())
+    for handlers_router in (admin.router, router):
+        handlers_router.message.middleware(metrics.HandlerMetricsMiddleware())
+        handlers_router.callback_query.middleware(metrics.HandlerMetricsMiddleware())
+
+
 async def main() -> None:
-    # Инициализация базы данных
-    await database.init_db()
+    if not bots:
+        raise ValueError("BOT_TOKEN не найден. Укажите BOT_TOKEN или BOT_TOKENS в .env файле.")
+    
+    # Инициализация базы данных (данные до разделения по ботам переходят первому боту)
+    await database.init_db(legacy_bot_id=bots[0].id)
+    
+    setup_dispatcher()
+    
+    # HTTP эндпоинт /metrics и /ready запускается до прогрева, чтобы хостинг видел статус запуска
+    metrics_port = getenv("METRICS_PORT")
+    metrics_runner = None
+    if metrics_port:
+        metrics_runner = await metrics.start_server(
+            getenv("METRICS_HOST", "0.0.0.0"),
+            int(metrics_port),
+            ready=startup.pipeline.is_ready
+        )
     
-    # Регистрация роутера
-    dp.include_router(router)
+    # Мониторинг задержки цикла событий и блокирующих вызовов (LOOP_MONITOR=0 отключает)
+    monitor = None
+    if getenv("LOOP_MONITOR", "1") != "0":
+        monitor = loop_monitor.LoopMonitor(
+            threshold=float(getenv("LOOP_BLOCK_THRESHOLD_MS", "100")) / 1000
+        )
+        monitor.start()
+    
+    # Параллельный прогрев БД, LLM клиента и сессии Telegram до приема обновлений
+    startup.pipeline.add_step("database", database.warm_up)
+    startup.pipeline.add_step("llm", warm_up_llm)
+    startup.pipeline.add_step("telegram", check_bots)
+    startup.pipeline.add_step("criteria_prompts", prompt_cache.load)
+    await startup.pipeline.run()
+    
+    # Продолжение рассылок, прерванных перезапуском
+    await broadcast.engine.resume_unfinished(*bots)
     
-    # Запуск бота
-    logger.info("Бот запущен!")
-    await dp.start_polling(bot)
+    # Периодическое вытеснение неактивных FSM контекстов
+    storage.start()
+    
+    # Пакетная запись журнала событий для аналитики воронки
+    events.log.start()
+    
+    jobs = []
+    # Фоновая архивация старых сценариев и очистка файла БД (MAINTENANCE=0 отключает)
+    if getenv("MAINTENANCE", "1") != "0":
+        jobs.append(maintenance.create_job())
+        jobs[-1].start()
+    
+    # Предварительная генерация запросов критерия успеха для популярных целей (PRECOMPUTE_PROMPTS=0 отключает)
+    scenario_manager = get_scenario_manager()
+    if getenv("PRECOMPUTE_PROMPTS", "1") != "0" and scenario_manager.llm is not None:
+        jobs.append(precompute_prompts.create_job(scenario_manager.llm))
+        jobs[-1].start()
+    
+    # Напоминания о брошенных сценариях (NUDGES=0 отключает)
+    if getenv("NUDGES", "1") != "0":
+        jobs.append(reminders.create_job())
+        jobs[-1].start(*bots)
+    
+    # Порядок остановки: текущие порции рассылок дорассылаются вместе с обработчиками,
+    # затем фоновые задачи, запись буферов в БД и закрытие соединений
+    shutdown.add_drain_task("broadcasts", broadcast.engine.stop)
+    for job in jobs:
+        shutdown.add_shutdown_step(type(job).__name__, job.stop)
+    shutdown.add_shutdown_step("update_journal", journal.close)
+    shutdown.add_shutdown_step("events", events.log.close)
+    shutdown.add_shutdown_step("fsm", storage.flush)
+    shutdown.add_shutdown_step("database", database.close)
+    if scenario_manager.llm is not None:
+        shutdown.add_shutdown_step("llm", scenario_manager.llm.close)
+    if metrics_runner is not None:
+        shutdown.add_shutdown_step("metrics", metrics_runner.cleanup)
+    if monitor is not None:
+        shutdown.add_shutdown_step("loop_monitor", monitor.stop)
+    shutdown.add_shutdown_step("telegram", session.close)
+    
+    # Запуск ботов
+    logger.info(f"Бот запущен! Ботов в процессе: {len(bots)}")
+    await shutdown.run_polling(dp, *bots)
 
 
 if __name__ == "__main__":
@@ -621,4 +841,3 @@ if __name__ == "__main__":
         asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("Бот остановлен!")
-
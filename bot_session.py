@@ -0,0 +1,132 @@
+"""
+Настроенная HTTP сессия клиента Telegram Bot API
+
+Стандартная сессия aiogram создает соединения с настройками aiohttp по
+умолчанию: кеш DNS на 10 секунд, keep-alive 15 секунд и общий таймаут
+60 секунд для всех методов. Здесь размер пула, кеш DNS, keep-alive и
+таймауты задаются явно, причем таймаут долгого опроса (getUpdates)
+отделен от таймаута отправки сообщений. Открытые и переиспользованные
+соединения считаются в метриках.
+
+Адрес API можно заменить (TELEGRAM_API_URL), например на локальный
+тестовый сервер из benchmarks/fake_bot_api.py.
+"""
+import os
+from typing import Optional
+
+from aiohttp import ClientSession, ClientTimeout, TraceConfig
+from aiohttp.hdrs import USER_AGENT
+from aiohttp.http import SERVER_SOFTWARE
+
+from aiogram import Bot, __version__
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.methods import GetUpdates, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+import metrics
+
+BOT_API_CONNECTIONS = metrics.registry.counter(
+    "bot_api_connections_total",
+    "Соединения с Bot API: opened - новые, reused - взятые из пула",
+    ("event",)
+)
+BOT_API_LATENCY = metrics.registry.histogram(
+    "bot_api_request_seconds",
+    "Время запросов к Bot API по методам",
+    ("method",)
+)
+
+
+async def _on_connection_create(session, context, params) -> None:
+    BOT_API_CONNECTIONS.inc(event="opened")
+
+
+async def _on_connection_reuse(session, context, params) -> None:
+    BOT_API_CONNECTIONS.inc(event="reused")
+
+
+def _trace_config() -> TraceConfig:
+    trace_config = TraceConfig()
+    trace_config.on_connection_create_end.append(_on_connection_create)
+    trace_config.on_connection_reuseconn.append(_on_connection_reuse)
+    return trace_config
+
+
+class TunedAiohttpSession(AiohttpSession):
+    """Сессия aiogram с настроенным пулом соединений, таймаутами и метриками"""
+
+    def __init__(
+        self,
+        pool_size: int = 100,
+        pool_size_per_host: int = 0,
+        dns_ttl: float = 300,
+        keepalive: float = 60,
+        send_timeout: float = 15,
+        connect_timeout: float = 5,
+        poll_timeout_margin: float = 10,
+        api_url: Optional[str] = None
+    ):
+        """
+        Инициализация сессии
+
+        Args:
+            pool_size: Максимальное количество соединений
+            pool_size_per_host: Максимум соединений к одному хосту (0 - без ограничения)
+            dns_ttl: Время кеширования DNS в секундах
+            keepalive: Сколько секунд держать простаивающее соединение открытым
+            send_timeout: Общий таймаут запросов, кроме долгого опроса
+            connect_timeout: Таймаут установки соединения
+            poll_timeout_margin: Запас сверх таймаута долгого опроса getUpdates
+            api_url: Адрес Bot API (например, локального тестового сервера)
+        """
+        kwargs = {}
+        if api_url:
+            kwargs["api"] = TelegramAPIServer.from_base(api_url)
+        # Таймаут сессии aiogram прибавляет к таймауту долгого опроса getUpdates
+        super().__init__(timeout=poll_timeout_margin, **kwargs)
+        self._connector_init.update(
+            limit=pool_size,
+            limit_per_host=pool_size_per_host,
+            ttl_dns_cache=dns_ttl,
+            keepalive_timeout=keepalive
+        )
+        self.send_timeout = ClientTimeout(total=send_timeout, connect=connect_timeout)
+
+    async def create_session(self) -> ClientSession:
+        if self._should_reset_connector:
+            await self.close()
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(
+                connector=self._connector_type(**self._connector_init),
+                headers={USER_AGENT: f"{SERVER_SOFTWARE} aiogram/{__version__}"},
+                trace_configs=[_trace_config()]
+            )
+            self._should_reset_connector = False
+        return self._session
+
+    async def make_request(
+        self,
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+        timeout: Optional[int] = None
+    ) -> TelegramType:
+        request_timeout = timeout
+        if request_timeout is None and not isinstance(method, GetUpdates):
+            request_timeout = self.send_timeout
+        with BOT_API_LATENCY.time(method=method.__api_method__):
+            return await super().make_request(bot, method, request_timeout)
+
+
+def create_session() -> TunedAiohttpSession:
+    """Создать сессию с настройками из переменных окружения"""
+    return TunedAiohttpSession(
+        pool_size=int(os.getenv("BOT_POOL_SIZE", "100")),
+        pool_size_per_host=int(os.getenv("BOT_POOL_SIZE_PER_HOST", "0")),
+        dns_ttl=float(os.getenv("BOT_DNS_TTL", "300")),
+        keepalive=float(os.getenv("BOT_KEEPALIVE_SECONDS", "60")),
+        send_timeout=float(os.getenv("BOT_SEND_TIMEOUT", "15")),
+        connect_timeout=float(os.getenv("BOT_CONNECT_TIMEOUT", "5")),
+        poll_timeout_margin=float(os.getenv("BOT_POLL_TIMEOUT_MARGIN", "10")),
+        api_url=os.getenv("TELEGRAM_API_URL")
+    )
@@ -0,0 +1,232 @@
+"""
+Модуль массовой рассылки сообщений всем пользователям
+
+ID пользователей читаются из БД порциями (пагинация по ключу), сообщения
+отправляются через token bucket каждого бота и per-chat token bucket с учетом
+RetryAfter. Порция отправляется частями, и прогресс сохраняется в таблицу
+broadcasts после каждой части, поэтому прерванная рассылка продолжается с
+места остановки, повторно отправляя не больше одной части. Пользователи,
+заблокировавшие бота, помечаются неактивными. Если чтение пользователей или
+сохранение прогресса завершается ошибкой, рассылка получает статус failed.
+"""
+import asyncio
+import logging
+import os
+from typing import Dict, List
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+import database
+import metrics
+import tenancy
+from rate_limit import KeyedTokenBucket
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_MESSAGES = metrics.registry.counter(
+    "bot_broadcast_messages_total",
+    "Результаты отправки сообщений рассылки",
+    ("result",)
+)
+
+# Сколько раз повторять отправку одному пользователю после RetryAfter
+MAX_RETRIES = 3
+
+
+class BroadcastEngine:
+    """Движок массовой рассылки"""
+
+    def __init__(
+        self,
+        rate: float = 25,
+        per_chat_rate: float = 1,
+        batch_size: int = 500,
+        concurrency: int = 25,
+        save_every: int = 50
+    ):
+        """
+        Инициализация движка
+
+        Args:
+            rate: Лимит сообщений в секунду для каждого бота (Telegram допускает около 30)
+            per_chat_rate: Лимит сообщений в секунду в один чат
+            batch_size: Размер порции ID пользователей, читаемой из БД
+            concurrency: Максимальное количество одновременных запросов к Telegram
+            save_every: Через сколько отправленных сообщений сохранять прогресс
+        """
+        # Лимиты Telegram действуют на токен бота, поэтому bucket у каждого бота свой
+        self.rate_limiter = KeyedTokenBucket(rate)
+        self.chat_limiter = KeyedTokenBucket(per_chat_rate)
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.save_every = save_every
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._stopping = False
+
+    def is_running(self, broadcast_id: int) -> bool:
+        """Выполняется ли рассылка в этом процессе"""
+        task = self._tasks.get(broadcast_id)
+        return task is not None and not task.done()
+
+    async def start(self, bot: Bot, text: str) -> int:
+        """
+        Создать и запустить рассылку
+
+        Returns:
+            ID рассылки
+        """
+        broadcast_id = await database.create_broadcast(text)
+        self._spawn(bot, broadcast_id)
+        return broadcast_id
+
+    async def resume_unfinished(self, *bots: Bot) -> List[int]:
+        """Продолжить рассылки, прерванные перезапуском (каждую от имени ее бота)"""
+        by_id = {bot.id: bot for bot in bots}
+        resumed = []
+        for broadcast in await database.get_running_broadcasts():
+            bot = by_id.get(broadcast["bot_id"])
+            if bot is None:
+                logger.warning(f"Рассылка {broadcast['id']} не продолжена: бот {broadcast['bot_id']} не запущен")
+                continue
+            if not self.is_running(broadcast["id"]):
+                self._spawn(bot, broadcast["id"])
+                resumed.append(broadcast["id"])
+        if resumed:
+            logger.info(f"Продолжены рассылки: {resumed}")
+        return resumed
+
+    async def cancel(self, broadcast_id: int) -> bool:
+        """Отменить рассылку текущего бота"""
+        # get_broadcast ищет только среди рассылок текущего бота: чужую рассылку
+        # с тем же ID не останавливаем
+        broadcast = await database.get_broadcast(broadcast_id)
+        if broadcast is None or broadcast["status"] != "running":
+            return False
+        task = self._tasks.get(broadcast_id)
+        if task is not None and not task.done():
+            task.cancel()
+        await database.update_broadcast(broadcast_id, status="cancelled")
+        return True
+
+    async def stop(self, timeout: float) -> int:
+        """
+        Остановить рассылки при остановке бота
+
+        Текущие порции дорассылаются и сохраняются, новые не начинаются.
+        Рассылки остаются в статусе running и продолжаются после перезапуска.
+
+        Args:
+            timeout: Сколько секунд ждать завершения текущих порций
+
+        Returns:
+            Количество рассылок, прерванных по истечении срока
+        """
+        self._stopping = True
+        tasks = list(self._tasks.values())
+        if not tasks:
+            return 0
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+        return len(pending)
+
+    def _spawn(self, bot: Bot, broadcast_id: int) -> None:
+        task = asyncio.create_task(self.run(bot, broadcast_id))
+        self._tasks[broadcast_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(broadcast_id, None))
+
+    async def run(self, bot: Bot, broadcast_id: int) -> None:
+        """Выполнить рассылку с места последней сохраненной порции"""
+        tenancy.use_bot(bot)
+        try:
+            await self._run(bot, broadcast_id)
+        except Exception as e:
+            # Без явного статуса рассылка осталась бы running без задачи
+            logger.error(f"Рассылка {broadcast_id} остановлена из-за ошибки: {e}")
+            try:
+                await database.update_broadcast(broadcast_id, status="failed")
+            except Exception as update_error:
+                logger.error(f"Не удалось отметить рассылку {broadcast_id} как failed: {update_error}")
+
+    async def _run(self, bot: Bot, broadcast_id: int) -> None:
+        broadcast = await database.get_broadcast(broadcast_id)
+        if broadcast is None or broadcast["status"] != "running":
+            return
+
+        text = broadcast["text"]
+        last_user_id = broadcast["last_user_id"]
+        totals = {key: broadcast[key] for key in ("sent", "failed", "blocked")}
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def send_limited(user_id: int) -> str:
+            async with semaphore:
+                return await self._send(bot, user_id, text)
+
+        logger.info(f"Рассылка {broadcast_id} запущена с user_id > {last_user_id}")
+        while True:
+            user_ids = await database.get_active_user_ids(last_user_id, self.batch_size)
+            if not user_ids:
+                break
+            for start in range(0, len(user_ids), self.save_every):
+                # Остановка проверяется перед каждой частью: текущая часть успевает
+                # дослаться и сохраниться за время ожидания stop()
+                if self._stopping:
+                    logger.info(f"Рассылка {broadcast_id} приостановлена на user_id {last_user_id}: {totals}")
+                    return
+                chunk = user_ids[start:start + self.save_every]
+                results = await asyncio.gather(*(send_limited(user_id) for user_id in chunk))
+                for result in results:
+                    totals[result] += 1
+                last_user_id = chunk[-1]
+                await database.update_broadcast(broadcast_id, last_user_id=last_user_id, **totals)
+
+        await database.update_broadcast(broadcast_id, status="completed")
+        logger.info(f"Рассылка {broadcast_id} завершена: {totals}")
+
+    async def _send(self, bot: Bot, user_id: int, text: str) -> str:
+        """
+        Отправить сообщение одному пользователю с учетом лимитов
+
+        Returns:
+            Результат: "sent", "blocked" или "failed"
+        """
+        for _ in range(MAX_RETRIES + 1):
+            await self.chat_limiter.acquire(user_id)
+            await self.rate_limiter.acquire(bot.id)
+            try:
+                await bot.send_message(user_id, text)
+                result = "sent"
+            except TelegramRetryAfter as e:
+                # Превышен лимит: приостанавливаем все рассылки этого бота и повторяем
+                logger.warning(f"RetryAfter {e.retry_after} с при рассылке")
+                self.rate_limiter.pause(bot.id, e.retry_after)
+                BROADCAST_MESSAGES.inc(result="retry_after")
+                continue
+            except TelegramForbiddenError:
+                await database.set_user_active(user_id, False)
+                result = "blocked"
+            except TelegramBadRequest as e:
+                if "chat not found" in str(e).lower():
+                    await database.set_user_active(user_id, False)
+                    result = "blocked"
+                else:
+                    logger.warning(f"Не удалось отправить сообщение рассылки {user_id}: {e}")
+                    result = "failed"
+            except Exception as e:
+                logger.warning(f"Не удалось отправить сообщение рассылки {user_id}: {e}")
+                result = "failed"
+            BROADCAST_MESSAGES.inc(result=result)
+            return result
+        BROADCAST_MESSAGES.inc(result="failed")
+        return "failed"
+
+
+# Глобальный экземпляр движка рассылки
+engine = BroadcastEngine(
+    rate=float(os.getenv("BROADCAST_RATE", "25")),
+    batch_size=int(os.getenv("BROADCAST_BATCH_SIZE", "500")),
+    save_every=int(os.getenv("BROADCAST_SAVE_EVERY", "50"))
+)
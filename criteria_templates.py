@@ -0,0 +1,116 @@
+"""
+Локальный генератор запроса критерия успеха
+
+Используется, когда ни одна модель LLM не ответила за отведенное время и
+для цели нет заранее сгенерированного варианта. Тема цели определяется по
+ключевым словам, для нее подбираются примеры измеримых критериев.
+"""
+import random
+from typing import List, Optional, Tuple
+
+import payloads
+
+# (основы ключевых слов, примеры критериев)
+TOPICS: List[Tuple[Tuple[str, ...], Tuple[str, ...]]] = [
+    (("похуд", "лишн", "сброс", "кг", "стройн", "диет"), (
+        "похудел на 5 кг и держу вес 2 недели",
+        "талия стала меньше на 6 см",
+        "8 недель подряд без сладкого после 18:00",
+    )),
+    (("спорт", "трениров", "бег", "пробеж", "фитнес", "отжим", "подтяг", "марафон", "плава"), (
+        "пробегаю 10 км без остановки",
+        "хожу на тренировки 3 раза в неделю все 12 недель",
+        "подтягиваюсь 15 раз за подход",
+    )),
+    (("подъем", "вставать", "спать", "высып", "утром", "утра", "режим"), (
+        "встаю в 7 утра без будильника всю неделю",
+        "ложусь спать до 23:00 не менее 6 дней в неделю",
+    )),
+    (("карьер", "повышен", "должност", "работ", "зарплат", "доход", "резюме", "собеседован"), (
+        "получил новую должность",
+        "зарплата выросла на 20%",
+        "прошел 5 собеседований и получил оффер",
+    )),
+    (("деньг", "накоп", "сбереж", "долг", "кредит", "бюджет", "инвест", "финанс"), (
+        "накопил 100 000 рублей на отдельном счете",
+        "закрыл кредитную карту полностью",
+        "веду учет расходов каждый день 12 недель",
+    )),
+    (("язык", "англий", "немец", "испан", "француз", "китай", "словар"), (
+        "сдал тест на уровень B2",
+        "выучил 1000 новых слов",
+        "провел 20 разговорных занятий с носителем",
+    )),
+    (("програм", "код", "python", "разработ", "курс", "навык", "обучен", "учеб", "сертифик"), (
+        "закончил курс и получил сертификат",
+        "написал и опубликовал собственный проект",
+        "решил 100 задач на тренажере",
+    )),
+    (("книг", "прочит", "чтен"), (
+        "прочитал 12 книг - по одной в неделю",
+        "читаю 30 минут каждый день",
+    )),
+    (("бизнес", "клиент", "продаж", "проект", "запуск", "стартап", "блог", "канал"), (
+        "привлек 10 новых клиентов",
+        "запустил проект и получил первые продажи",
+        "опубликовал 24 поста - по два в неделю",
+    )),
+    (("семь", "дети", "детьми", "ребен", "отношен", "друз", "родител", "партнер"), (
+        "провожу с семьей каждое воскресенье без телефона",
+        "звоню родителям 2 раза в неделю",
+    )),
+    (("курить", "курен", "алкогол", "привычк", "медита", "стресс", "здоров"), (
+        "не курю 12 недель подряд",
+        "медитирую 10 минут каждый день",
+        "хожу 10 000 шагов в день не менее 5 дней в неделю",
+    )),
+]
+
+DEFAULT_EXAMPLES = (
+    "получил новую должность",
+    "встаю в 7 утра без будильника всю неделю",
+)
+
+
+payloads.registry.register_template("criteria_fallback", (
+    "<b>Шаг 3: Конкретизация результатов</b>\n\n"
+    "🎯 <b>Цель {goal_number} из {total_goals}: {goal}</b>\n\n"
+    "Как ты поймешь, что эта цель достигнута? "
+    "Опиши конкретный результат (количественный или качественный).\n\n"
+    "💡 Хороший критерий можно проверить: в нем есть число, срок или регулярность.\n\n"
+    "<i>{examples}</i>"
+), goal_number="", total_goals="", goal="", examples="")
+
+
+def find_examples(goal: str) -> Optional[Tuple[str, ...]]:
+    """Примеры критериев для темы цели или None, если тема не определена"""
+    text = goal.lower().replace("ё", "е")
+    best, best_hits = None, 0
+    for stems, examples in TOPICS:
+        hits = sum(1 for stem in stems if stem in text)
+        if hits > best_hits:
+            best, best_hits = examples, hits
+    return best
+
+
+def render(goal: str, goal_number: int, total_goals: int) -> str:
+    """
+    Собрать запрос критерия успеха без обращения к LLM
+
+    Args:
+        goal: Текст цели
+        goal_number: Номер цели
+        total_goals: Всего целей
+
+    Returns:
+        Сообщение с запросом критерия успеха и примерами
+    """
+    examples = find_examples(goal) or DEFAULT_EXAMPLES
+    chosen = random.sample(examples, min(2, len(examples)))
+    return payloads.registry.render(
+        "criteria_fallback",
+        goal_number=goal_number,
+        total_goals=total_goals,
+        goal=goal,
+        examples="Например: " + " или ".join(f"'{example}'" for example in chosen)
+    )
@@ -1,69 +1,337 @@
 import aiosqlite
 import json
+import os
+import zlib
 from datetime import datetime
-from typing import Optional, Dict
+from typing import Any, AsyncIterator, Optional, Dict, List, Tuple, Union
+
+from metrics import timed_query
+from tenancy import current_bot_id, default_bot_id
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 
 DB_NAME = "bot_database.db"
 
+# Сжатие JSON колонок сценария (all_goals, selected_goals, conversation_history).
+# Короткие значения хранятся как раньше - JSON текстом; длинные - BLOB с первым
+# байтом-меткой формата: zlib или zstd (если установлен пакет zstandard).
+# Чтение различает форматы по типу значения и метке, поэтому старые строки
+# читаются без миграции (пересжатие: python maintenance.py --compress-json).
+JSON_ZLIB = b"\x01"
+JSON_ZSTD = b"\x02"
+JSON_CODEC = os.getenv("DB_JSON_CODEC", "zstd" if zstandard else "zlib")
+JSON_COMPRESS_MIN_BYTES = int(os.getenv("DB_JSON_COMPRESS_MIN_BYTES", "256"))
+SCENARIO_JSON_COLUMNS = ("all_goals", "selected_goals", "conversation_history")
+
+_zstd_compressor = zstandard.ZstdCompressor(level=3) if zstandard else None
+_zstd_decompressor = zstandard.ZstdDecompressor() if zstandard else None
+
+
+def pack_json_text(text: str) -> Union[str, bytes]:
+    """
+    Упаковка JSON текста для записи в колонку
+
+    Значения короче JSON_COMPRESS_MIN_BYTES и значения, которые не уменьшаются
+    при сжатии, остаются текстом.
+    """
+    raw = text.encode("utf-8")
+    if len(raw) < JSON_COMPRESS_MIN_BYTES or JSON_CODEC not in ("zlib", "zstd"):
+        return text
+    if JSON_CODEC == "zstd" and _zstd_compressor is not None:
+        packed = JSON_ZSTD + _zstd_compressor.compress(raw)
+    else:
+        packed = JSON_ZLIB + zlib.compress(raw)
+    return packed if len(packed) < len(raw) else text
+
+
+def encode_json(value: Any) -> Union[str, bytes]:
+    """Сериализация значения в JSON и упаковка для записи в колонку"""
+    return pack_json_text(json.dumps(value, ensure_ascii=False))
+
+
+def unpack_json_text(value: Union[str, bytes, None]) -> Optional[str]:
+    """JSON текст колонки в любом формате хранения (текст, zlib, zstd)"""
+    if not isinstance(value, bytes):
+        return value
+    tag, body = value[:1], value[1:]
+    if tag == JSON_ZLIB:
+        return zlib.decompress(body).decode("utf-8")
+    if tag == JSON_ZSTD:
+        if _zstd_decompressor is None:
+            raise RuntimeError("Значение сжато zstd, но пакет zstandard не установлен")
+        return _zstd_decompressor.decompress(body).decode("utf-8")
+    raise ValueError(f"Неизвестный формат JSON колонки: {tag!r}")
+
+
+def decode_json(value: Union[str, bytes, None], default: Any = None) -> Any:
+    """Распаковка и десериализация JSON колонки (default - для пустого значения)"""
+    text = unpack_json_text(value)
+    return json.loads(text) if text else default
+
 
-async def init_db():
-    """Инициализация базы данных"""
+# Пользователи и сценарии разделяются по ID бота (см. tenancy.py)
+USERS_TABLE = """
+    CREATE TABLE IF NOT EXISTS {name} (
+        bot_id INTEGER NOT NULL DEFAULT 0,
+        user_id INTEGER NOT NULL,
+        username TEXT,
+        name TEXT NOT NULL,
+        age INTEGER NOT NULL,
+        city TEXT NOT NULL,
+        interests TEXT NOT NULL,
+        is_active INTEGER NOT NULL DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (bot_id, user_id)
+    )
+"""
+GOAL_SCENARIOS_TABLE = """
+    CREATE TABLE IF NOT EXISTS {name} (
+        bot_id INTEGER NOT NULL DEFAULT 0,
+        user_id INTEGER NOT NULL,
+        stage TEXT NOT NULL,
+        all_goals TEXT,
+        selected_goals TEXT,
+        current_goal_index INTEGER DEFAULT 0,
+        conversation_history TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        nudged_at TIMESTAMP,
+        PRIMARY KEY (bot_id, user_id),
+        FOREIGN KEY (bot_id, user_id) REFERENCES users (bot_id, user_id) ON DELETE CASCADE
+    )
+"""
+
+
+def _require_legacy_bot_id(legacy_bot_id: int, table: str) -> None:
+    """Строки, записанные до разделения по ботам, нельзя переносить без владельца"""
+    if not legacy_bot_id:
+        raise ValueError(
+            f"Таблица {table} требует миграции по ботам, но ID бота неизвестен. "
+            f"Укажите BOT_TOKEN (или BOT_TOKENS) и повторите запуск."
+        )
+
+
+async def _rebuild_with_bot_id(db: aiosqlite.Connection, table: str, schema: str, legacy_bot_id: int) -> None:
+    """
+    Миграция: пересоздание таблицы с первичным ключом (bot_id, user_id)
+
+    Существующие строки переходят боту legacy_bot_id. Миграция выполняется один
+    раз: после нее в таблице есть колонка bot_id, и повторный вызов ничего не делает.
+    """
+    async with db.execute(f"PRAGMA table_info({table})") as cursor:
+        columns = [row[1] for row in await cursor.fetchall()]
+    if "bot_id" in columns:
+        return
+    _require_legacy_bot_id(legacy_bot_id, table)
+    names = ", ".join(columns)
+    await db.execute(schema.format(name=f"{table}_new"))
+    await db.execute(
+        f"INSERT INTO {table}_new (bot_id, {names}) SELECT ?, {names} FROM {table}", (legacy_bot_id,)
+    )
+    await db.execute(f"DROP TABLE {table}")
+    await db.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+
+
+async def _add_bot_id_column(db: aiosqlite.Connection, table: str, legacy_bot_id: int) -> None:
+    """Миграция: колонка bot_id для таблицы без первичного ключа по пользователю (однократно)"""
+    async with db.execute(f"PRAGMA table_info({table})") as cursor:
+        columns = {row[1] for row in await cursor.fetchall()}
+    if "bot_id" in columns:
+        return
+    _require_legacy_bot_id(legacy_bot_id, table)
+    await db.execute(f"ALTER TABLE {table} ADD COLUMN bot_id INTEGER NOT NULL DEFAULT 0")
+    await db.execute(f"UPDATE {table} SET bot_id = ?", (legacy_bot_id,))
+
+
+async def init_db(legacy_bot_id: Optional[int] = None):
+    """
+    Инициализация базы данных
+
+    Args:
+        legacy_bot_id: ID бота, которому передаются строки, записанные до разделения
+                       данных по ботам (по умолчанию - первый токен из настроек)
+    """
+    if legacy_bot_id is None:
+        legacy_bot_id = default_bot_id()
     async with aiosqlite.connect(DB_NAME) as db:
+        # Инкрементальная очистка свободных страниц; для уже существующей БД
+        # вступает в силу только после однократного VACUUM (см. maintenance.py)
+        await db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        # WAL: читатели (выгрузки, отчеты) работают со снимком и не блокируют запись бота
+        await db.execute("PRAGMA journal_mode=WAL")
+        
+        await db.execute(USERS_TABLE.format(name="users"))
+        
+        # Таблица для хранения состояния сценария целеполагания
+        await db.execute(GOAL_SCENARIOS_TABLE.format(name="goal_scenarios"))
+        
+        # Архив старых сценариев: строка целиком в виде сжатого JSON
         await db.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                name TEXT NOT NULL,
-                age INTEGER NOT NULL,
-                city TEXT NOT NULL,
-                interests TEXT NOT NULL,
+            CREATE TABLE IF NOT EXISTS goal_scenarios_archive (
+                bot_id INTEGER NOT NULL DEFAULT 0,
+                user_id INTEGER NOT NULL,
+                stage TEXT NOT NULL,
+                updated_at TIMESTAMP,
+                archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                payload BLOB NOT NULL
+            )
+        """)
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_goal_scenarios_archive_user ON goal_scenarios_archive (user_id)"
+        )
+        
+        # Миграция: флаг активности пользователя (0, если пользователь заблокировал бота)
+        async with db.execute("PRAGMA table_info(users)") as cursor:
+            columns = {row[1] for row in await cursor.fetchall()}
+        if "is_active" not in columns:
+            await db.execute("ALTER TABLE users ADD COLUMN is_active INTEGER NOT NULL DEFAULT 1")
+        
+        # Миграция: время последнего напоминания о брошенном сценарии
+        async with db.execute("PRAGMA table_info(goal_scenarios)") as cursor:
+            columns = {row[1] for row in await cursor.fetchall()}
+        if "nudged_at" not in columns:
+            await db.execute("ALTER TABLE goal_scenarios ADD COLUMN nudged_at TIMESTAMP")
+        
+        # Таблица рассылок с прогрессом для продолжения после перезапуска
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS broadcasts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                bot_id INTEGER NOT NULL DEFAULT 0,
+                text TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'running',
+                last_user_id INTEGER NOT NULL DEFAULT 0,
+                sent INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                blocked INTEGER NOT NULL DEFAULT 0,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         """)
         
-        # Таблица для хранения состояния сценария целеполагания
+        # Заранее сгенерированные LLM варианты запроса критерия успеха для популярных целей
         await db.execute("""
-            CREATE TABLE IF NOT EXISTS goal_scenarios (
-                user_id INTEGER PRIMARY KEY,
-                stage TEXT NOT NULL,
-                all_goals TEXT,
-                selected_goals TEXT,
-                current_goal_index INTEGER DEFAULT 0,
-                conversation_history TEXT,
+            CREATE TABLE IF NOT EXISTS criteria_prompts (
+                goal_key TEXT NOT NULL,
+                variant INTEGER NOT NULL,
+                text TEXT NOT NULL,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (user_id) ON DELETE CASCADE
+                PRIMARY KEY (goal_key, variant)
+            )
+        """)
+        
+        # Время последнего запуска периодических задач (переживает перезапуск процесса)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS job_runs (
+                name TEXT PRIMARY KEY,
+                finished_at TIMESTAMP NOT NULL
+            )
+        """)
+        
+        # Вытесненные из памяти FSM контексты (см. fsm_storage.py)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS fsm_spill (
+                storage_key TEXT PRIMARY KEY,
+                state TEXT,
+                data TEXT NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        # Журнал обработанных обновлений для защиты от повторной доставки (см. update_journal.py)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS processed_updates (
+                bot_id INTEGER NOT NULL,
+                update_id INTEGER NOT NULL,
+                PRIMARY KEY (bot_id, update_id)
+            ) WITHOUT ROWID
+        """)
+        
+        # Журнал событий сценария и дневные итоги для аналитики (см. events.py)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS scenario_events (
+                id INTEGER PRIMARY KEY,
+                created_at TIMESTAMP NOT NULL,
+                bot_id INTEGER NOT NULL,
+                user_id INTEGER,
+                kind TEXT NOT NULL,
+                name TEXT NOT NULL,
+                detail TEXT
             )
         """)
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_scenario_events_created ON scenario_events (created_at)"
+        )
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS scenario_daily_stats (
+                day TEXT NOT NULL,
+                bot_id INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                name TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (bot_id, day, kind, name)
+            ) WITHOUT ROWID
+        """)
+        
+        # Миграция: разделение данных по ботам. Строки, записанные до нее,
+        # переходят первому боту один раз, при добавлении колонки bot_id
+        await _rebuild_with_bot_id(db, "users", USERS_TABLE, legacy_bot_id)
+        await _rebuild_with_bot_id(db, "goal_scenarios", GOAL_SCENARIOS_TABLE, legacy_bot_id)
+        for table in ("goal_scenarios_archive", "broadcasts"):
+            await _add_bot_id_column(db, table, legacy_bot_id)
+        
+        # Индекс для выборок по этапу и давности (архивация, напоминания)
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_goal_scenarios_stage_updated ON goal_scenarios (stage, updated_at)"
+        )
+        # Индекс для напоминаний: сценарии бота на этапе в порядке ключа пагинации
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_goal_scenarios_bot_stage_updated "
+            "ON goal_scenarios (bot_id, stage, updated_at, user_id)"
+        )
         
         await db.commit()
 
 
+@timed_query
+async def warm_up():
+    """Прогрев базы данных: открытие файла и загрузка страниц индексов в кеш ОС"""
+    async with aiosqlite.connect(DB_NAME) as db:
+        async with db.execute("SELECT COUNT(*) FROM users") as cursor:
+            await cursor.fetchone()
+        async with db.execute("SELECT COUNT(*) FROM goal_scenarios") as cursor:
+            await cursor.fetchone()
+
+
+@timed_query
 async def add_user(user_id: int, username: str, name: str, age: int, city: str, interests: str):
     """Добавление или обновление пользователя"""
     async with aiosqlite.connect(DB_NAME) as db:
         await db.execute("""
-            INSERT INTO users (user_id, username, name, age, city, interests, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            ON CONFLICT(user_id) DO UPDATE SET
+            INSERT INTO users (bot_id, user_id, username, name, age, city, interests, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(bot_id, user_id) DO UPDATE SET
                 username = excluded.username,
                 name = excluded.name,
                 age = excluded.age,
                 city = excluded.city,
                 interests = excluded.interests,
                 updated_at = excluded.updated_at
-        """, (user_id, username, name, age, city, interests, datetime.now()))
+        """, (current_bot_id.get(), user_id, username, name, age, city, interests, datetime.now()))
         await db.commit()
 
 
+@timed_query
 async def get_user(user_id: int) -> Optional[Dict]:
     """Получение пользователя по ID"""
     async with aiosqlite.connect(DB_NAME) as db:
         db.row_factory = aiosqlite.Row
         async with db.execute(
-            "SELECT * FROM users WHERE user_id = ?", (user_id,)
+            "SELECT * FROM users WHERE bot_id = ? AND user_id = ?", (current_bot_id.get(), user_id)
         ) as cursor:
             row = await cursor.fetchone()
             if row:
@@ -71,30 +339,35 @@ async def get_user(user_id: int) -> Optional[Dict]:
             return None
 
 
+@timed_query
 async def get_total_users() -> int:
     """Получение общего количества пользователей"""
     async with aiosqlite.connect(DB_NAME) as db:
-        async with db.execute("SELECT COUNT(*) FROM users") as cursor:
+        async with db.execute("SELECT COUNT(*) FROM users WHERE bot_id = ?", (current_bot_id.get(),)) as cursor:
             row = await cursor.fetchone()
             return row[0] if row else 0
 
 
+@timed_query
 async def delete_user(user_id: int):
     """Удаление пользователя"""
     async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
+        await db.execute(
+            "DELETE FROM users WHERE bot_id = ? AND user_id = ?", (current_bot_id.get(), user_id)
+        )
         await db.commit()
 
 
 # Функции для работы со сценарием целеполагания
+@timed_query
 async def save_scenario_state(user_id: int, state_data: Dict):
     """Сохранение состояния сценария целеполагания"""
     async with aiosqlite.connect(DB_NAME) as db:
         await db.execute("""
             INSERT INTO goal_scenarios 
-            (user_id, stage, all_goals, selected_goals, current_goal_index, conversation_history, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            ON CONFLICT(user_id) DO UPDATE SET
+            (bot_id, user_id, stage, all_goals, selected_goals, current_goal_index, conversation_history, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(bot_id, user_id) DO UPDATE SET
                 stage = excluded.stage,
                 all_goals = excluded.all_goals,
                 selected_goals = excluded.selected_goals,
@@ -102,38 +375,561 @@ async def save_scenario_state(user_id: int, state_data: Dict):
                 conversation_history = excluded.conversation_history,
                 updated_at = excluded.updated_at
         """, (
+            current_bot_id.get(),
             user_id,
             state_data.get("stage"),
-            json.dumps(state_data.get("all_goals", []), ensure_ascii=False),
-            json.dumps(state_data.get("selected_goals", []), ensure_ascii=False),
+            encode_json(state_data.get("all_goals", [])),
+            encode_json(state_data.get("selected_goals", [])),
             state_data.get("current_goal_index", 0),
-            json.dumps(state_data.get("conversation_history", []), ensure_ascii=False),
+            encode_json(state_data.get("conversation_history", [])),
             datetime.now()
         ))
         await db.commit()
 
 
+@timed_query
 async def get_scenario_state(user_id: int) -> Optional[Dict]:
     """Получение состояния сценария целеполагания"""
     async with aiosqlite.connect(DB_NAME) as db:
         db.row_factory = aiosqlite.Row
         async with db.execute(
-            "SELECT * FROM goal_scenarios WHERE user_id = ?", (user_id,)
+            "SELECT * FROM goal_scenarios WHERE bot_id = ? AND user_id = ?", (current_bot_id.get(), user_id)
         ) as cursor:
             row = await cursor.fetchone()
             if row:
                 state = dict(row)
-                # Десериализация JSON полей
-                state["all_goals"] = json.loads(state["all_goals"] or "[]")
-                state["selected_goals"] = json.loads(state["selected_goals"] or "[]")
-                state["conversation_history"] = json.loads(state["conversation_history"] or "[]")
+                # Распаковка и десериализация JSON полей
+                for column in SCENARIO_JSON_COLUMNS:
+                    state[column] = decode_json(state[column], [])
                 return state
             return None
 
 
+@timed_query
 async def delete_scenario_state(user_id: int):
     """Удаление состояния сценария целеполагания"""
     async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute("DELETE FROM goal_scenarios WHERE user_id = ?", (user_id,))
+        await db.execute(
+            "DELETE FROM goal_scenarios WHERE bot_id = ? AND user_id = ?", (current_bot_id.get(), user_id)
+        )
         await db.commit()
 
+
+
+# Функции для рассылок
+@timed_query
+async def get_active_user_ids(after_user_id: int, limit: int) -> List[int]:
+    """
+    Получение следующей порции ID активных пользователей
+
+    Используется пагинация по ключу (bot_id, user_id > after_user_id), поэтому каждая
+    порция читается по первичному ключу без сканирования уже пройденных строк.
+    """
+    async with aiosqlite.connect(DB_NAME) as db:
+        async with db.execute(
+            "SELECT user_id FROM users WHERE bot_id = ? AND user_id > ? AND is_active = 1 ORDER BY user_id LIMIT ?",
+            (current_bot_id.get(), after_user_id, limit)
+        ) as cursor:
+            return [row[0] for row in await cursor.fetchall()]
+
+
+@timed_query
+async def set_user_active(user_id: int, is_active: bool):
+    """Изменение флага активности пользователя"""
+    async with aiosqlite.connect(DB_NAME) as db:
+        await db.execute(
+            "UPDATE users SET is_active = ? WHERE bot_id = ? AND user_id = ? AND is_active != ?",
+            (int(is_active), current_bot_id.get(), user_id, int(is_active))
+        )
+        await db.commit()
+
+
+@timed_query
+async def create_broadcast(text: str) -> int:
+    """Создание рассылки"""
+    async with aiosqlite.connect(DB_NAME) as db:
+        cursor = await db.execute(
+            "INSERT INTO broadcasts (bot_id, text) VALUES (?, ?)", (current_bot_id.get(), text)
+        )
+        await db.commit()
+        return cursor.lastrowid
+
+
+@timed_query
+async def update_broadcast(broadcast_id: int, **fields):
+    """Обновление прогресса или статуса рассылки"""
+    allowed = {"status", "last_user_id", "sent", "failed", "blocked"}
+    fields = {key: value for key, value in fields.items() if key in allowed}
+    if not fields:
+        return
+    assignments = ", ".join(f"{key} = ?" for key in fields)
+    async with aiosqlite.connect(DB_NAME) as db:
+        await db.execute(
+            f"UPDATE broadcasts SET {assignments}, updated_at = ? WHERE id = ?",
+            (*fields.values(), datetime.now(), broadcast_id)
+        )
+        await db.commit()
+
+
+@timed_query
+async def get_broadcast(broadcast_id: int) -> Optional[Dict]:
+    """Получение рассылки текущего бота по ID"""
+    async with aiosqlite.connect(DB_NAME) as db:
+        db.row_factory = aiosqlite.Row
+        async with db.execute(
+            "SELECT * FROM broadcasts WHERE id = ? AND bot_id = ?", (broadcast_id, current_bot_id.get())
+        ) as cursor:
+            row = await cursor.fetchone()
+            return dict(row) if row else None
+
+
+@timed_query
+async def get_running_broadcasts() -> List[Dict]:
+    """Получение незавершенных рассылок всех ботов"""
+    async with aiosqlite.connect(DB_NAME) as db:
+        db.row_factory = aiosqlite.Row
+        async with db.execute("SELECT * FROM broadcasts WHERE status = 'running' ORDER BY id") as cursor:
+            return [dict(row) for row in await cursor.fetchall()]
+
+
+# Функции обслуживания БД
+@timed_query
+async def archive_scenarios_batch(stage: str, older_than: datetime, limit: int) -> int:
+    """
+    Перенос порции старых сценариев в архив
+
+    Выборка идет по индексу (stage, updated_at). Перенос и удаление выполняются
+    в одной короткой транзакции, чтобы не задерживать запись бота надолго.
+
+    Returns:
+        Количество перенесенных строк
+    """
+    async with aiosqlite.connect(DB_NAME) as db:
+        db.row_factory = aiosqlite.Row
+        # Транзакция берется сразу на запись, чтобы строки не изменились между чтением и удалением
+        await db.execute("BEGIN IMMEDIATE")
+        async with db.execute(
+            "SELECT * FROM goal_scenarios WHERE stage = ? AND updated_at < ? ORDER BY updated_at LIMIT ?",
+            (stage, older_than, limit)
+        ) as cursor:
+            rows = [dict(row) for row in await cursor.fetchall()]
+        if not rows:
+            await db.rollback()
+            return 0
+        # В архиве JSON колонки хранятся текстом внутри сжатой строки
+        for row in rows:
+            for column in SCENARIO_JSON_COLUMNS:
+                row[column] = unpack_json_text(row[column])
+        await db.executemany(
+            "INSERT INTO goal_scenarios_archive (bot_id, user_id, stage, updated_at, payload) VALUES (?, ?, ?, ?, ?)",
+            [
+                (
+                    row["bot_id"],
+                    row["user_id"],
+                    row["stage"],
+                    row["updated_at"],
+                    zlib.compress(json.dumps(row, ensure_ascii=False, default=str).encode("utf-8"))
+                )
+                for row in rows
+            ]
+        )
+        await db.executemany(
+            "DELETE FROM goal_scenarios WHERE bot_id = ? AND user_id = ?",
+            [(row["bot_id"], row["user_id"]) for row in rows]
+        )
+        await db.commit()
+        return len(rows)
+
+
+@timed_query
+async def incremental_vacuum(pages: int = 0) -> Dict[str, int]:
+    """
+    Освобождение свободных страниц файла БД (PRAGMA incremental_vacuum)
+
+    Args:
+        pages: Сколько страниц освободить (0 - все)
+
+    Returns:
+        Словарь с auto_vacuum режимом и количеством свободных страниц до и после
+    """
+    async with aiosqlite.connect(DB_NAME) as db:
+        async with db.execute("PRAGMA auto_vacuum") as cursor:
+            mode = (await cursor.fetchone())[0]
+        async with db.execute("PRAGMA freelist_count") as cursor:
+            before = (await cursor.fetchone())[0]
+        # Через execute() модуль sqlite3 делает только один шаг прагмы (одна страница),
+        # executescript() выполняет ее до конца
+        query = f"PRAGMA incremental_vacuum({int(pages)})" if pages else "PRAGMA incremental_vacuum"
+        await db.executescript(query)
+        async with db.execute("PRAGMA freelist_count") as cursor:
+            after = (await cursor.fetchone())[0]
+        return {"auto_vacuum": mode, "freelist_before": before, "freelist_after": after}
+
+
+def _stored_size(value: Union[str, bytes, None]) -> int:
+    """Размер значения колонки в байтах"""
+    if value is None:
+        return 0
+    return len(value) if isinstance(value, bytes) else len(value.encode("utf-8"))
+
+
+async def compress_scenario_json(batch_size: int = 500) -> Dict[str, int]:
+    """
+    Однократная миграция: пересжатие JSON колонок существующих сценариев
+
+    Строки переупаковываются текущим форматом (JSON_CODEC, порог
+    JSON_COMPRESS_MIN_BYTES): старый текст сжимается, при смене формата
+    значения пересжимаются. Таблица проходится порциями по первичному ключу,
+    каждая порция - в отдельной короткой транзакции; updated_at не меняется.
+    Страницы B-дерева после обновления остаются частично заполненными, поэтому
+    файл уменьшается только после полного VACUUM (см. maintenance.py).
+
+    Returns:
+        Словарь: просмотрено строк, обновлено строк, байт JSON колонок до и после
+    """
+    stats = {"rows": 0, "updated": 0, "bytes_before": 0, "bytes_after": 0}
+    after = (-1, -1)
+    columns = ", ".join(SCENARIO_JSON_COLUMNS)
+    assignments = ", ".join(f"{column} = ?" for column in SCENARIO_JSON_COLUMNS)
+    async with aiosqlite.connect(DB_NAME) as db:
+        while True:
+            await db.execute("BEGIN IMMEDIATE")
+            async with db.execute(
+                f"SELECT bot_id, user_id, {columns} FROM goal_scenarios "
+                "WHERE (bot_id, user_id) > (?, ?) ORDER BY bot_id, user_id LIMIT ?",
+                (*after, batch_size)
+            ) as cursor:
+                rows = await cursor.fetchall()
+            if not rows:
+                await db.rollback()
+                break
+            updates = []
+            for bot_id, user_id, *values in rows:
+                packed = [
+                    value if value is None else pack_json_text(unpack_json_text(value))
+                    for value in values
+                ]
+                stats["bytes_before"] += sum(map(_stored_size, values))
+                stats["bytes_after"] += sum(map(_stored_size, packed))
+                if packed != values:
+                    updates.append((*packed, bot_id, user_id))
+            if updates:
+                await db.executemany(
+                    f"UPDATE goal_scenarios SET {assignments} WHERE bot_id = ? AND user_id = ?", updates
+                )
+            await db.commit()
+            stats["rows"] += len(rows)
+            stats["updated"] += len(updates)
+            after = (rows[-1][0], rows[-1][1])
+    return stats
+
+
+async def vacuum():
+    """Полный VACUUM (нужен однократно, чтобы включить auto_vacuum в существующей БД)"""
+    async with aiosqlite.connect(DB_NAME) as db:
+        await db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        await db.execute("VACUUM")
+
+
+async def close():
+    """Подготовка БД к остановке: обновление статистики планировщика и перенос WAL в основной файл"""
+    async with aiosqlite.connect(DB_NAME) as db:
+        await db.execute("PRAGMA optimize")
+        await db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+# Функции для напоминаний о брошенных сценариях
+@timed_query
+async def get_idle_scenarios(
+    stage: str,
+    idle_since: datetime,
+    after: Optional[Tuple[str, int]],
+    limit: int
+) -> List[Tuple[int, str]]:
+    """
+    Получение порции сценариев без активности с заданного момента
+
+    Пагинация по ключу (updated_at, user_id) по индексу (bot_id, stage, updated_at, user_id):
+    каждая порция - это короткий диапазонный поиск, без сканирования таблицы.
+    Сценарии, по которым уже было напоминание после последней активности, пропускаются.
+
+    Args:
+        stage: Этап сценария
+        idle_since: Последняя активность раньше этого момента
+        after: Ключ (updated_at, user_id) последней строки предыдущей порции
+        limit: Размер порции
+
+    Returns:
+        Список (user_id, updated_at)
+    """
+    after_updated, after_user = after if after else ("", 0)
+    async with aiosqlite.connect(DB_NAME) as db:
+        async with db.execute("""
+            SELECT s.user_id, s.updated_at
+            FROM goal_scenarios s
+            JOIN users u ON u.bot_id = s.bot_id AND u.user_id = s.user_id AND u.is_active = 1
+            WHERE s.stage = ? AND s.updated_at < ? AND (s.updated_at, s.user_id) > (?, ?)
+              AND s.bot_id = ? AND (s.nudged_at IS NULL OR s.nudged_at < s.updated_at)
+            ORDER BY s.updated_at, s.user_id
+            LIMIT ?
+        """, (stage, idle_since, after_updated, after_user, current_bot_id.get(), limit)) as cursor:
+            return [(row[0], row[1]) for row in await cursor.fetchall()]
+
+
+@timed_query
+async def mark_scenarios_nudged(user_ids: List[int]):
+    """Отметка времени напоминания для порции сценариев (updated_at не меняется)"""
+    if not user_ids:
+        return
+    now = datetime.now()
+    async with aiosqlite.connect(DB_NAME) as db:
+        await db.executemany(
+            "UPDATE goal_scenarios SET nudged_at = ? WHERE bot_id = ? AND user_id = ?",
+            [(now, current_bot_id.get(), user_id) for user_id in user_ids]
+        )
+        await db.commit()
+
+
+# Функции для заранее сгенерированных запросов критерия успеха
+async def iter_scenario_goals(chunk_size: int = 1000) -> AsyncIterator[List[Tuple[str, str]]]:
+    """
+    Потоковое чтение целей из всех сценариев (только чтение, снимок WAL)
+
+    Yields:
+        Порции строк (all_goals, selected_goals) в виде JSON строк
+    """
+    async with aiosqlite.connect(f"file:{DB_NAME}?mode=ro", uri=True) as db:
+        async with db.execute("SELECT all_goals, selected_goals FROM goal_scenarios") as cursor:
+            while True:
+                rows = await cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield [(unpack_json_text(all_goals), unpack_json_text(selected)) for all_goals, selected in rows]
+
+
+@timed_query
+async def save_criteria_prompts(goal_key: str, variants: List[str]):
+    """Сохранение вариантов запроса критерия успеха для цели (старые варианты заменяются)"""
+    async with aiosqlite.connect(DB_NAME) as db:
+        await db.execute("DELETE FROM criteria_prompts WHERE goal_key = ?", (goal_key,))
+        await db.executemany(
+            "INSERT INTO criteria_prompts (goal_key, variant, text) VALUES (?, ?, ?)",
+            [(goal_key, index, text) for index, text in enumerate(variants)]
+        )
+        await db.commit()
+
+
+@timed_query
+async def get_job_run(name: str) -> Optional[datetime]:
+    """Время последнего завершенного запуска периодической задачи или None"""
+    async with aiosqlite.connect(DB_NAME) as db:
+        async with db.execute("SELECT finished_at FROM job_runs WHERE name = ?", (name,)) as cursor:
+            row = await cursor.fetchone()
+    return datetime.fromisoformat(row[0]) if row else None
+
+
+@timed_query
+async def save_job_run(name: str, finished_at: Optional[datetime] = None):
+    """Сохранение времени завершения запуска периодической задачи"""
+    async with aiosqlite.connect(DB_NAME) as db:
+        await db.execute(
+            "INSERT OR REPLACE INTO job_runs (name, finished_at) VALUES (?, ?)",
+            (name, (finished_at or datetime.now()).isoformat(" "))
+        )
+        await db.commit()
+
+
+@timed_query
+async def get_criteria_prompts() -> Dict[str, List[str]]:
+    """Получение всех заранее сгенерированных вариантов, сгруппированных по цели"""
+    prompts: Dict[str, List[str]] = {}
+    async with aiosqlite.connect(DB_NAME) as db:
+        async with db.execute("SELECT goal_key, text FROM criteria_prompts ORDER BY goal_key, variant") as cursor:
+            async for goal_key, text in cursor:
+                prompts.setdefault(goal_key, []).append(text)
+    return prompts
+
+
+@timed_query
+async def spill_fsm_records(records: List[Tuple[str, Optional[str], str]]):
+    """Сохранение вытесненных FSM контекстов (ключ, состояние, JSON данных)"""
+    if not records:
+        return
+    async with aiosqlite.connect(DB_NAME) as db:
+        await db.executemany(
+            """
+            INSERT OR REPLACE INTO fsm_spill (storage_key, state, data, updated_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            """,
+            records
+        )
+        await db.commit()
+
+
+@timed_query
+async def delete_fsm_records(storage_keys: List[str]):
+    """Удаление вытесненных FSM контекстов (например, устаревших после возврата в память)"""
+    if not storage_keys:
+        return
+    async with aiosqlite.connect(DB_NAME) as db:
+        await db.executemany("DELETE FROM fsm_spill WHERE storage_key = ?", [(key,) for key in storage_keys])
+        await db.commit()
+
+
+@timed_query
+async def pop_fsm_record(storage_key: str) -> Optional[Tuple[Optional[str], str]]:
+    """Получение и удаление вытесненного FSM контекста: (состояние, JSON данных) или None"""
+    async with aiosqlite.connect(DB_NAME) as db:
+        async with db.execute(
+            "SELECT state, data FROM fsm_spill WHERE storage_key = ?", (storage_key,)
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row:
+            await db.execute("DELETE FROM fsm_spill WHERE storage_key = ?", (storage_key,))
+            await db.commit()
+        return row
+
+
+@timed_query
+async def get_processed_updates(bot_id: int, window: int) -> List[int]:
+    """Получение update_id из журнала в пределах окна от последнего обработанного"""
+    async with aiosqlite.connect(DB_NAME) as db:
+        async with db.execute(
+            """
+            SELECT update_id FROM processed_updates
+            WHERE bot_id = ? AND update_id > (
+                SELECT COALESCE(MAX(update_id), 0) FROM processed_updates WHERE bot_id = ?
+            ) - ?
+            """,
+            (bot_id, bot_id, window)
+        ) as cursor:
+            return [row[0] for row in await cursor.fetchall()]
+
+
+@timed_query
+async def save_processed_updates(bot_id: int, update_ids: List[int], prune_below: int):
+    """Запись update_id в журнал и удаление записей за пределами окна"""
+    async with aiosqlite.connect(DB_NAME) as db:
+        await db.executemany(
+            "INSERT OR IGNORE INTO processed_updates (bot_id, update_id) VALUES (?, ?)",
+            [(bot_id, update_id) for update_id in update_ids]
+        )
+        await db.execute(
+            "DELETE FROM processed_updates WHERE bot_id = ? AND update_id < ?",
+            (bot_id, prune_below)
+        )
+        await db.commit()
+
+
+# Функции для выгрузки данных
+EXPORT_COLUMNS = (
+    "bot_id", "user_id", "username", "name", "age", "city", "interests", "is_active", "created_at",
+    "stage", "all_goals", "selected_goals", "current_goal_index", "scenario_updated_at"
+)
+EXPORT_JSON_COLUMNS = ("all_goals", "selected_goals", "conversation_history")
+
+
+async def iter_users_with_scenarios(
+    chunk_size: int = 1000,
+    with_history: bool = False,
+    bot_id: Optional[int] = None
+) -> AsyncIterator[List[Tuple]]:
+    """
+    Потоковое чтение пользователей вместе с их сценариями целеполагания
+
+    Чтение идет одним курсором в одной read-транзакции только для чтения: в режиме
+    WAL она видит согласованный снимок и не блокирует запись бота. JSON колонки
+    возвращаются распакованными JSON строками, без десериализации.
+
+    Args:
+        chunk_size: Количество строк в одной порции
+        with_history: Добавить колонку conversation_history
+        bot_id: Выгрузить только пользователей этого бота (None - всех ботов)
+
+    Yields:
+        Порции строк в порядке EXPORT_COLUMNS (+ conversation_history)
+    """
+    history_column = ", s.conversation_history" if with_history else ""
+    bot_filter, params = ("WHERE u.bot_id = ?", (bot_id,)) if bot_id is not None else ("", ())
+    json_indexes = [EXPORT_COLUMNS.index(column) for column in EXPORT_JSON_COLUMNS if column in EXPORT_COLUMNS]
+    if with_history:
+        json_indexes.append(len(EXPORT_COLUMNS))
+    async with aiosqlite.connect(f"file:{DB_NAME}?mode=ro", uri=True) as db:
+        async with db.execute(f"""
+            SELECT u.bot_id, u.user_id, u.username, u.name, u.age, u.city, u.interests, u.is_active, u.created_at,
+                   s.stage, s.all_goals, s.selected_goals, s.current_goal_index, s.updated_at{history_column}
+            FROM users u
+            LEFT JOIN goal_scenarios s ON s.bot_id = u.bot_id AND s.user_id = u.user_id
+            {bot_filter}
+            ORDER BY u.bot_id, u.user_id
+        """, params) as cursor:
+            while True:
+                rows = await cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for i, row in enumerate(rows):
+                    if any(isinstance(row[index], bytes) for index in json_indexes):
+                        row = list(row)
+                        for index in json_indexes:
+                            row[index] = unpack_json_text(row[index])
+                        rows[i] = tuple(row)
+                yield rows
+
+
+# Функции журнала событий (см. events.py)
+@timed_query
+async def save_events(
+    events: List[Tuple[datetime, int, Optional[int], str, str, Optional[str]]],
+    rollups: List[Tuple[Tuple[str, int, str, str], int]]
+):
+    """
+    Пакетная запись событий и прибавление дневных итогов в одной транзакции
+
+    Args:
+        events: Строки (created_at, bot_id, user_id, kind, name, detail)
+        rollups: Пары ((day, bot_id, kind, name), количество)
+    """
+    async with aiosqlite.connect(DB_NAME) as db:
+        await db.executemany(
+            "INSERT INTO scenario_events (created_at, bot_id, user_id, kind, name, detail) VALUES (?, ?, ?, ?, ?, ?)",
+            events
+        )
+        await db.executemany("""
+            INSERT INTO scenario_daily_stats (day, bot_id, kind, name, count) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(bot_id, day, kind, name) DO UPDATE SET count = count + excluded.count
+        """, [(*key, count) for key, count in rollups])
+        await db.commit()
+
+
+@timed_query
+async def get_daily_stats(since_day: str) -> List[Tuple[str, str, str, int]]:
+    """
+    Дневные итоги событий текущего бота начиная с дня since_day (YYYY-MM-DD)
+
+    Returns:
+        Список (day, kind, name, count)
+    """
+    async with aiosqlite.connect(DB_NAME) as db:
+        async with db.execute(
+            "SELECT day, kind, name, count FROM scenario_daily_stats WHERE bot_id = ? AND day >= ? ORDER BY day",
+            (current_bot_id.get(), since_day)
+        ) as cursor:
+            return [tuple(row) for row in await cursor.fetchall()]
+
+
+@timed_query
+async def prune_events(older_than: datetime, limit: int) -> int:
+    """
+    Удаление порции старых строк журнала событий (дневные итоги сохраняются)
+
+    Returns:
+        Количество удаленных строк
+    """
+    async with aiosqlite.connect(DB_NAME) as db:
+        cursor = await db.execute("""
+            DELETE FROM scenario_events WHERE id IN (
+                SELECT id FROM scenario_events WHERE created_at < ? ORDER BY created_at LIMIT ?
+            )
+        """, (older_than, limit))
+        await db.commit()
+        return cursor.rowcount
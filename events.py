@@ -0,0 +1,138 @@
+"""
+Модуль журнала событий сценария для аналитики воронки
+
+События (переход на этап сценария, результат вызова LLM) добавляются в
+буфер в памяти без обращения к БД. Раз в flush_interval секунд буфер
+записывается одной транзакцией: строки журнала - через executemany в
+таблицу scenario_events, а счетчики, заранее сгруппированные в памяти по
+дню, боту, типу и имени события, - в дневные итоги scenario_daily_stats.
+Отчеты (команда /funnel) читают только дневные итоги, поэтому аналитика
+не сканирует goal_scenarios и не декодирует JSON.
+"""
+import asyncio
+import logging
+import os
+from collections import Counter, deque
+from datetime import datetime
+from typing import Deque, Optional, Tuple
+
+import database
+import metrics
+import tenancy
+
+logger = logging.getLogger(__name__)
+
+EVENTS_DROPPED = metrics.registry.counter(
+    "bot_events_dropped_total",
+    "События, вытесненные из переполненного буфера журнала до записи в БД"
+)
+EVENTS_BUFFERED = metrics.registry.gauge(
+    "bot_events_buffered",
+    "События в буфере журнала, ожидающие записи в БД"
+)
+
+# Типы событий
+STAGE = "stage"
+LLM = "llm"
+
+# (время, ID бота, ID пользователя, тип, имя, подробности)
+Event = Tuple[datetime, int, Optional[int], str, str, Optional[str]]
+
+
+class EventLog:
+    """Буфер событий с периодической пакетной записью в БД"""
+
+    def __init__(self, flush_interval: float = 5, max_buffer: int = 50_000):
+        """
+        Инициализация журнала
+
+        Args:
+            flush_interval: Период записи буфера в БД в секундах
+            max_buffer: Максимальный размер буфера; при переполнении вытесняются самые старые события
+        """
+        self.flush_interval = flush_interval
+        self._buffer: Deque[Event] = deque(maxlen=max_buffer)
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, kind: str, name: str, user_id: Optional[int] = None, detail: Optional[str] = None) -> None:
+        """
+        Добавить событие в буфер (без обращения к БД)
+
+        Args:
+            kind: Тип события (STAGE, LLM)
+            name: Имя события: этап сценария, результат вызова
+            user_id: ID пользователя
+            detail: Подробности (например, модель LLM)
+        """
+        if len(self._buffer) == self._buffer.maxlen:
+            EVENTS_DROPPED.inc()
+        self._buffer.append((datetime.now(), tenancy.current_bot_id.get(), user_id, kind, name, detail))
+        EVENTS_BUFFERED.set(len(self._buffer))
+
+    async def flush(self) -> int:
+        """
+        Записать буфер в БД одной транзакцией
+
+        Returns:
+            Количество записанных событий
+        """
+        if not self._buffer:
+            return 0
+        events = list(self._buffer)
+        self._buffer.clear()
+        rollups = Counter(
+            (created_at.date().isoformat(), bot_id, kind, name)
+            for created_at, bot_id, _, kind, name, _ in events
+        )
+        try:
+            await database.save_events(events, list(rollups.items()))
+        except Exception:
+            # События вернутся в буфер перед записанными за время попытки и будут
+            # записаны при следующей. Если все не помещаются, вытесняются самые старые:
+            # extendleft в полный deque молча отбросил бы новые события с конца
+            overflow = len(events) + len(self._buffer) - self._buffer.maxlen
+            if overflow > 0:
+                EVENTS_DROPPED.inc(overflow)
+                events = events[overflow:]
+            self._buffer.extendleft(reversed(events))
+            raise
+        finally:
+            EVENTS_BUFFERED.set(len(self._buffer))
+        return len(events)
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка записи журнала событий: {e}")
+
+    def start(self) -> None:
+        """Запустить периодическую запись в текущем цикле событий"""
+        self._task = asyncio.create_task(self._loop())
+
+    async def close(self) -> None:
+        """Остановить периодическую запись и записать оставшиеся события"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+def create_log() -> EventLog:
+    """Создать журнал с настройками из переменных окружения"""
+    return EventLog(
+        flush_interval=float(os.getenv("EVENTS_FLUSH_SECONDS", "5")),
+        max_buffer=int(os.getenv("EVENTS_MAX_BUFFER", "50000"))
+    )
+
+
+# Глобальный журнал событий
+log = create_log()
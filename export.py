@@ -0,0 +1,159 @@
+"""
+Модуль потоковой выгрузки пользователей и сценариев целеполагания в CSV/JSONL
+
+Строки читаются из БД порциями, каждая порция сериализуется и пишется в
+gzip-файл в отдельном потоке, поэтому память не зависит от размера таблиц,
+а цикл событий бота не блокируется. JSON колонки не декодируются: в CSV
+они пишутся как есть, в JSONL вставляются в строку без повторной сериализации.
+
+Запуск из командной строки (без --bot выгружаются пользователи всех ботов):
+    python export.py --format jsonl --output goals.jsonl.gz --bot 123456
+"""
+import argparse
+import asyncio
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import time
+from typing import List, Optional, Sequence, Tuple
+
+import database
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "jsonl")
+EXPORTS_DIR = os.getenv("EXPORTS_DIR", "exports")
+# Сколько часов хранить на сервере выгрузки, которые не удалось отправить в Telegram
+EXPORTS_RETENTION_HOURS = float(os.getenv("EXPORTS_RETENTION_HOURS", "24"))
+
+
+def _columns(with_history: bool) -> Tuple[str, ...]:
+    columns = database.EXPORT_COLUMNS
+    return columns + ("conversation_history",) if with_history else columns
+
+
+def _csv_chunk(rows: Sequence[Tuple], header: Optional[Sequence[str]] = None) -> str:
+    """Сериализация порции строк в CSV"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(header)
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+def _jsonl_chunk(rows: Sequence[Tuple], columns: Sequence[str]) -> str:
+    """Сериализация порции строк в JSONL; JSON колонки вставляются без декодирования"""
+    lines = []
+    for row in rows:
+        parts = []
+        for column, value in zip(columns, row):
+            if column in database.EXPORT_JSON_COLUMNS:
+                encoded = value if value else "null"
+            else:
+                encoded = json.dumps(value, ensure_ascii=False)
+            parts.append(f'"{column}": {encoded}')
+        lines.append("{" + ", ".join(parts) + "}\n")
+    return "".join(lines)
+
+
+async def export(
+    path: str,
+    fmt: str = "jsonl",
+    chunk_size: int = 1000,
+    with_history: bool = False,
+    bot_id: Optional[int] = None
+) -> int:
+    """
+    Выгрузить пользователей и сценарии в gzip-файл
+
+    Args:
+        path: Путь к выходному файлу (.gz)
+        fmt: Формат: "csv" или "jsonl"
+        chunk_size: Количество строк в одной порции
+        with_history: Выгружать conversation_history
+        bot_id: Выгрузить только пользователей этого бота (None - всех ботов)
+
+    Returns:
+        Количество выгруженных строк
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат '{fmt}', доступны: {', '.join(FORMATS)}")
+
+    columns = _columns(with_history)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    started = time.perf_counter()
+    total = 0
+    output = await asyncio.to_thread(gzip.open, path, "wt", encoding="utf-8", newline="")
+    try:
+        header: Optional[Sequence[str]] = columns if fmt == "csv" else None
+        async for rows in database.iter_users_with_scenarios(chunk_size, with_history, bot_id):
+            if fmt == "csv":
+                chunk = _csv_chunk(rows, header)
+                header = None
+            else:
+                chunk = _jsonl_chunk(rows, columns)
+            # Сжатие и запись выполняются в потоке, чтобы не блокировать цикл событий
+            await asyncio.to_thread(output.write, chunk)
+            total += len(rows)
+    finally:
+        await asyncio.to_thread(output.close)
+
+    logger.info(f"Выгружено {total} строк в {path} за {time.perf_counter() - started:.1f} с")
+    return total
+
+
+def cleanup(directory: str = EXPORTS_DIR, max_age_hours: float = EXPORTS_RETENTION_HOURS) -> int:
+    """
+    Удалить старые файлы выгрузок (в них персональные данные пользователей)
+
+    Args:
+        directory: Каталог выгрузок
+        max_age_hours: Файлы старше этого срока удаляются
+
+    Returns:
+        Количество удаленных файлов
+    """
+    if not os.path.isdir(directory):
+        return 0
+    deadline = time.time() - max_age_hours * 3600
+    removed = 0
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.startswith("export-") and os.path.isfile(path) and os.path.getmtime(path) < deadline:
+            os.remove(path)
+            removed += 1
+    if removed:
+        logger.info(f"Удалено старых выгрузок: {removed}")
+    return removed
+
+
+def default_path(fmt: str) -> str:
+    """Путь к файлу выгрузки по умолчанию"""
+    return os.path.join(EXPORTS_DIR, f"export-{time.strftime('%Y%m%d-%H%M%S')}.{fmt}.gz")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Выгрузка пользователей и сценариев целеполагания")
+    parser.add_argument("--format", choices=FORMATS, default="jsonl", help="Формат выгрузки")
+    parser.add_argument("--output", help="Путь к выходному .gz файлу")
+    parser.add_argument("--db", default=database.DB_NAME, help="Путь к файлу БД")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Размер порции строк")
+    parser.add_argument("--with-history", action="store_true", help="Выгружать conversation_history")
+    parser.add_argument("--bot", type=int, help="ID бота, пользователей которого выгрузить (по умолчанию всех)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    database.DB_NAME = args.db
+    path = args.output or default_path(args.format)
+    asyncio.run(export(path, args.format, args.chunk_size, args.with_history, args.bot))
+
+
+if __name__ == "__main__":
+    main()
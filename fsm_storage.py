@@ -0,0 +1,289 @@
+"""
+Хранилище FSM в памяти с вытеснением неактивных контекстов
+
+В отличие от MemoryStorage, контекст пользователя не хранится вечно:
+контексты без обращений дольше TTL вытесняются периодической очисткой.
+При включенной выгрузке непустые вытесненные контексты сохраняются в SQLite
+(таблица fsm_spill) и загружаются обратно при следующем обращении
+пользователя, поэтому объем памяти ограничен активными пользователями,
+а не всеми, кто когда-либо писал боту. Пустой контекст тоже хранится до
+истечения TTL, чтобы не обращаться к БД на каждом обновлении пользователя
+без состояния.
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+import database
+import metrics
+
+logger = logging.getLogger(__name__)
+
+FSM_CONTEXTS = metrics.registry.gauge("bot_fsm_contexts", "Количество FSM контекстов в памяти")
+FSM_MEMORY = metrics.registry.gauge("bot_fsm_memory_bytes", "Оценка памяти FSM контекстов в байтах")
+FSM_EVICTIONS = metrics.registry.counter(
+    "bot_fsm_evictions_total",
+    "Вытесненные FSM контексты: spilled - сохранены в БД, dropped - удалены",
+    ("result",)
+)
+FSM_RELOADS = metrics.registry.counter("bot_fsm_reloads_total", "FSM контексты, загруженные обратно из БД")
+
+
+def deep_sizeof(value: Any) -> int:
+    """Оценка занимаемой памяти с учетом вложенных словарей, списков и строк"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_sizeof(k) + deep_sizeof(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(deep_sizeof(item) for item in value)
+    return size
+
+
+def format_key(key: StorageKey) -> str:
+    """Строковое представление ключа для хранения в БД"""
+    return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id}:{key.destiny}"
+
+
+@dataclass
+class Record:
+    """FSM контекст пользователя"""
+    state: Optional[str] = None
+    data: Dict[str, Any] = field(default_factory=dict)
+    accessed: float = 0.0
+    size: int = 0
+
+    def is_empty(self) -> bool:
+        return self.state is None and not self.data
+
+
+class EvictingMemoryStorage(BaseStorage):
+    """Хранилище FSM в памяти с TTL вытеснением, выгрузкой в SQLite и учетом памяти"""
+
+    def __init__(self, idle_ttl: float = 6 * 3600, spill: bool = True, sweep_interval: float = 300):
+        """
+        Инициализация хранилища
+
+        Args:
+            idle_ttl: Через сколько секунд без обращений контекст вытесняется
+            spill: Сохранять вытесненные контексты в БД и загружать их обратно
+            sweep_interval: Период очистки в секундах
+        """
+        self.idle_ttl = idle_ttl
+        self.spill = spill
+        self.sweep_interval = sweep_interval
+        # Порядок словаря - порядок последнего обращения (самые старые в начале)
+        self._records: "OrderedDict[StorageKey, Record]" = OrderedDict()
+        self._memory = 0
+        self._task: Optional[asyncio.Task] = None
+        # Загрузки из БД, которые сейчас выполняются (по ключу)
+        self._loading: Dict[StorageKey, asyncio.Future] = {}
+        # Вытесненные контексты, запись которых в БД еще не завершена
+        self._spilling: Dict[StorageKey, Record] = {}
+
+    async def _get(self, key: StorageKey) -> Optional[Record]:
+        """Контекст по ключу (с загрузкой из БД) с отметкой обращения"""
+        record = self._records.get(key)
+        if record is None:
+            # Контекст еще записывается в БД: возвращаем его в память, а устаревшую
+            # строку удалит evict после записи
+            record = self._spilling.pop(key, None)
+            if record is not None:
+                self._store(key, record)
+        if record is None and self.spill:
+            # Одновременные первые обращения к ключу ждут одну загрузку: строка
+            # из fsm_spill забирается один раз и не теряется
+            loading = self._loading.get(key)
+            if loading is None:
+                loading = self._loading[key] = asyncio.ensure_future(self._load(key))
+                loading.add_done_callback(lambda _: self._loading.pop(key, None))
+            # Отмена одного обработчика не прерывает загрузку для остальных
+            record = await asyncio.shield(loading)
+        if record is not None:
+            record.accessed = time.monotonic()
+            self._records.move_to_end(key)
+        return record
+
+    async def _load(self, key: StorageKey) -> Record:
+        """Загрузка вытесненного контекста из БД (пустой контекст, если его нет)"""
+        row = await database.pop_fsm_record(format_key(key))
+        # Пока шел запрос, контекст мог появиться в памяти
+        record = self._records.get(key)
+        if record is None:
+            if row is not None:
+                state, data = row
+                record = Record(state=state, data=json.loads(data))
+                FSM_RELOADS.inc()
+            else:
+                record = Record()
+            self._store(key, record)
+        return record
+
+    def _store(self, key: StorageKey, record: Record) -> None:
+        """Сохранить контекст в памяти и обновить учет памяти"""
+        old = self._records.pop(key, None)
+        if old is not None:
+            self._memory -= old.size
+        record.accessed = time.monotonic()
+        record.size = deep_sizeof(record.data) + deep_sizeof(record.state)
+        self._records[key] = record
+        self._memory += record.size
+        FSM_CONTEXTS.set(len(self._records))
+        FSM_MEMORY.set(self._memory)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._get(key) or Record()
+        record.state = state.state if isinstance(state, State) else state
+        self._store(key, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = await self._get(key)
+        return record.state if record else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        record = await self._get(key) or Record()
+        record.data = data.copy()
+        self._store(key, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = await self._get(key)
+        return record.data.copy() if record else {}
+
+    async def evict(self, idle_ttl: Optional[float] = None) -> int:
+        """
+        Вытеснить контексты без обращений дольше TTL
+
+        Args:
+            idle_ttl: TTL в секундах (по умолчанию настройка хранилища; 0 - вытеснить все)
+
+        Returns:
+            Количество вытесненных контекстов
+        """
+        ttl = self.idle_ttl if idle_ttl is None else idle_ttl
+        deadline = time.monotonic() - ttl
+        evicted: List[Tuple[StorageKey, Record]] = []
+        while self._records:
+            key, record = next(iter(self._records.items()))
+            if record.accessed > deadline:
+                break
+            self._records.popitem(last=False)
+            self._memory -= record.size
+            evicted.append((key, record))
+        FSM_CONTEXTS.set(len(self._records))
+        FSM_MEMORY.set(self._memory)
+        if not evicted:
+            return 0
+
+        rows = []
+        spilled: List[Tuple[StorageKey, Record]] = []
+        for key, record in evicted:
+            if not self.spill or record.is_empty():
+                FSM_EVICTIONS.inc(result="dropped")
+                continue
+            try:
+                rows.append((format_key(key), record.state, json.dumps(record.data, ensure_ascii=False)))
+            except (TypeError, ValueError) as e:
+                logger.warning(f"FSM контекст {format_key(key)} не сериализуется и будет удален: {e}")
+                FSM_EVICTIONS.inc(result="dropped")
+                continue
+            # До окончания записи контекст доступен обработчикам через _spilling
+            self._spilling[key] = record
+            spilled.append((key, record))
+        try:
+            await database.spill_fsm_records(rows)
+        except BaseException:
+            # Запись не удалась: контексты возвращаются в память (в начало очереди
+            # вытеснения) и будут записаны при следующей очистке
+            for key, record in reversed(spilled):
+                if self._spilling.get(key) is record:
+                    del self._spilling[key]
+                    self._records[key] = record
+                    self._records.move_to_end(key, last=False)
+                    self._memory += record.size
+            FSM_CONTEXTS.set(len(self._records))
+            FSM_MEMORY.set(self._memory)
+            raise
+        stale = []
+        for key, record in spilled:
+            if self._spilling.get(key) is record:
+                del self._spilling[key]
+            elif key in self._records:
+                # Контекст вернулся в память во время записи: строка в БД устарела
+                stale.append(format_key(key))
+        await database.delete_fsm_records(stale)
+        FSM_EVICTIONS.inc(len(rows), result="spilled")
+        return len(evicted)
+
+    def memory_report(self, top: int = 10) -> Dict[str, Any]:
+        """
+        Отчет о памяти FSM контекстов
+
+        Args:
+            top: Сколько самых больших контекстов включить в отчет
+
+        Returns:
+            Словарь: contexts, total_bytes и largest - список (ключ, байты, состояние)
+        """
+        largest = sorted(self._records.items(), key=lambda item: item[1].size, reverse=True)[:top]
+        return {
+            "contexts": len(self._records),
+            "total_bytes": self._memory,
+            "largest": [(format_key(key), record.size, record.state) for key, record in largest]
+        }
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                evicted = await self.evict()
+                if evicted:
+                    logger.info(f"Вытеснено неактивных FSM контекстов: {evicted}, в памяти {len(self._records)}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка вытеснения FSM контекстов: {e}")
+
+    def start(self) -> None:
+        """Запустить периодическую очистку в текущем цикле событий"""
+        self._task = asyncio.create_task(self._loop())
+
+    async def flush(self) -> int:
+        """
+        При включенной выгрузке сохранить все контексты в БД
+
+        Returns:
+            Количество сохраненных контекстов
+        """
+        if not (self.spill and self._records):
+            return 0
+        count = await self.evict(idle_ttl=0)
+        logger.info(f"FSM контексты сохранены в БД при остановке: {count}")
+        return count
+
+    async def close(self) -> None:
+        """Остановить очистку и сохранить контексты (хранилище остается рабочим для следующего flush)"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+def create_storage() -> EvictingMemoryStorage:
+    """Создать хранилище с настройками из переменных окружения"""
+    return EvictingMemoryStorage(
+        idle_ttl=float(os.getenv("FSM_IDLE_TTL_HOURS", "6")) * 3600,
+        spill=os.getenv("FSM_SPILL", "1") != "0",
+        sweep_interval=float(os.getenv("FSM_SWEEP_MINUTES", "5")) * 60
+    )
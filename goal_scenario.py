@@ -2,16 +2,77 @@
 Модуль сценария целеполагания на 12 недель
 """
 from typing import List, Dict, Optional
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field
 from enum import Enum
 import json
 import logging
+import os
+import zlib
 
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+import criteria_templates
+import history_manager
+import intents
 import llm_client
+import metrics
+import payloads
+import prompt_cache
 
 logger = logging.getLogger(__name__)
 
 
+# Бюджет времени на генерацию запроса критерия успеха (пользователь ждет ответа)
+CRITERIA_DEADLINE = float(os.getenv("LLM_DEADLINE_SECONDS", "8"))
+
+# Промпты для генерации запроса критерия успеха
+CRITERIA_SYSTEM_PROMPT = (
+    "Ты - помощник по целеполаганию. Помоги пользователю сформулировать четкие критерии успеха для его цели. "
+    "Критерий должен быть измеримым и конкретным. Будь дружелюбным и мотивирующим."
+)
+
+
+def build_criteria_user_prompt(goal: str, goal_number: Optional[int] = None, total_goals: Optional[int] = None) -> str:
+    """
+    Пользовательский промпт для генерации запроса критерия успеха
+    
+    Если номер цели не указан (заранее генерируемые варианты), он не упоминается в промпте.
+    """
+    position = f" (цель {goal_number} из {total_goals})" if goal_number is not None else ""
+    return (
+        f"Пользователь работает над целью: '{goal}'{position}. "
+        "Нужно помочь ему сформулировать критерий успеха. "
+        "Напиши короткое дружелюбное сообщение, которое попросит пользователя определить, "
+        "как он поймет, что цель достигнута. Приведи 1-2 конкретных примера критериев для этой цели. "
+        "Ответ должен быть на русском языке и максимум 150 слов."
+    )
+
+
+# Сколько приоритетных целей выбирает пользователь
+GOALS_TO_SELECT = 3
+
+
+class GoalSelectionCallback(CallbackData, prefix="gs"):
+    """
+    Данные кнопок выбора целей
+    
+    Выбранные цели хранятся в самих данных кнопки (битовая маска), поэтому
+    переключение не требует записи в БД: пересобирается только клавиатура.
+    Версия - контрольная сумма списка целей, для которого построена клавиатура:
+    нажатия на клавиатуру старого выбора отклоняются.
+    """
+    action: str  # "t" - переключить цель, "c" - подтвердить выбор
+    index: int = 0
+    mask: int = 0
+    version: int = 0
+
+
+def goals_version(goals: List[str]) -> int:
+    """Версия списка целей для данных кнопок выбора (CRC32 текстов целей)"""
+    return zlib.crc32("\n".join(goals).encode("utf-8"))
+
+
 class ScenarioStage(Enum):
     """Этапы сценария целеполагания"""
     INTRODUCTION = "introduction"
@@ -39,6 +100,8 @@ class ScenarioState:
     selected_goals: List[Goal]
     current_goal_index: int
     conversation_history: List[Dict[str, str]]
+    # Этап, сохраненный в БД (не хранится; по нему определяются переходы между этапами)
+    saved_stage: Optional[ScenarioStage] = field(default=None, compare=False, repr=False)
     
     def to_dict(self) -> Dict:
         """Преобразование в словарь для хранения в БД"""
@@ -60,7 +123,8 @@ class ScenarioState:
             all_goals=data["all_goals"],
             selected_goals=[Goal(text=g["text"], success_criteria=g.get("success_criteria")) for g in data["selected_goals"]],
             current_goal_index=data["current_goal_index"],
-            conversation_history=data.get("conversation_history", [])
+            conversation_history=data.get("conversation_history", []),
+            saved_stage=ScenarioStage(data["stage"])
         )
 
 
@@ -84,29 +148,15 @@ class GoalSettingScenario:
                 self.llm = None
         else:
             self.llm = llm_client_instance
+        
+        # LLM используется менеджером истории для фонового сжатия
+        manager = history_manager.get_history_manager()
+        if manager.llm is None:
+            manager.llm = self.llm
     
     def get_introduction_message(self) -> str:
         """Получить вводное сообщение сценария"""
-        return (
-            "🎯 <b>Добро пожаловать в систему целеполагания на 12 недель!</b>\n\n"
-            "Эта система поможет тебе:\n"
-            "• Сформулировать и структурировать цели на ближайшие 3 месяца\n"
-            "• Выбрать самые важные из них\n"
-            "• Определить четкие критерии успеха\n"
-            "• Создать план действий для достижения\n\n"
-            "Готов начать? Поехали! 🚀\n\n"
-            "<b>Шаг 1: Постановка целей</b>\n\n"
-            "Подумай о том, чего ты хочешь достичь в ближайшие 3 месяца. "
-            "Сформулируй и введи свои цели (до 10 целей).\n\n"
-            "<i>Примеры:</i>\n"
-            "• Карьерный рост (получить повышение)\n"
-            "• Ранний подъем (вставать в 7 утра)\n"
-            "• Похудение (сбросить 5 кг)\n"
-            "• Изучение нового языка\n"
-            "• Развитие навыка программирования\n\n"
-            "Введи свои цели по одной, или все сразу через запятую или с новой строки. "
-            "Когда закончишь, напиши <b>\"Готово\"</b> или <b>\"Завершить\"</b>."
-        )
+        return payloads.registry.text("scenario_introduction")
     
     def process_goals_input(self, user_input: str, current_goals: List[str]) -> tuple[str, List[str], bool]:
         """
@@ -119,10 +169,8 @@ class GoalSettingScenario:
         Returns:
             Кортеж (сообщение для пользователя, обновленный список целей, завершено ли введение)
         """
-        user_input_lower = user_input.lower().strip()
-        
         # Проверка на команды завершения
-        if user_input_lower in ["готово", "завершить", "готов", "закончить", "/done"]:
+        if intents.matcher.classify(user_input, intents.GOALS_DONE) == "done":
             if len(current_goals) == 0:
                 return (
                     "❌ Ты еще не ввел ни одной цели. Пожалуйста, введи хотя бы одну цель перед завершением.",
@@ -172,14 +220,65 @@ class GoalSettingScenario:
                 False
             )
     
-    def get_goals_selection_message(self, goals: List[str]) -> str:
-        """Получить сообщение для выбора целей"""
-        goals_text = "\n".join([f"{i+1}. {goal}" for i, goal in enumerate(goals)])
+    def get_goals_selection_message(self, goals: List[str], inline: bool = False) -> str:
+        """Получить сообщение для выбора целей (inline - выбор кнопками)"""
+        template = "goals_selection_inline" if inline else "goals_selection"
+        return payloads.registry.render(template, goals=payloads.render_numbered_list(goals))
+    
+    def get_goals_selection_keyboard(self, goals: List[str], mask: int = 0) -> InlineKeyboardMarkup:
+        """
+        Клавиатура выбора целей: кнопка-переключатель на каждую цель и кнопка подтверждения
+        
+        Args:
+            goals: Полный список целей
+            mask: Битовая маска выбранных целей
+        """
+        selected = bin(mask).count("1")
+        version = goals_version(goals)
+        rows = [
+            [InlineKeyboardButton(
+                text=f"{'✅' if mask >> i & 1 else '⬜'} {i + 1}. {goal}",
+                callback_data=GoalSelectionCallback(action="t", index=i, mask=mask, version=version).pack()
+            )]
+            for i, goal in enumerate(goals)
+        ]
+        rows.append([InlineKeyboardButton(
+            text=f"Подтвердить ({selected}/{GOALS_TO_SELECT})",
+            callback_data=GoalSelectionCallback(action="c", mask=mask, version=version).pack()
+        )])
+        return InlineKeyboardMarkup(inline_keyboard=rows)
+    
+    def toggle_goal_selection(self, mask: int, index: int) -> tuple[int, Optional[str]]:
+        """
+        Переключение цели в выборе
+        
+        Returns:
+            Кортеж (новая маска, текст предупреждения или None)
+        """
+        if not mask >> index & 1 and bin(mask).count("1") >= GOALS_TO_SELECT:
+            return mask, f"Можно выбрать только {GOALS_TO_SELECT} цели. Сними отметку с другой цели."
+        return mask ^ (1 << index), None
+    
+    def confirm_goals_selection(self, mask: int, all_goals: List[str]) -> tuple[str, List[str], bool]:
+        """
+        Подтверждение выбора целей с клавиатуры
+        
+        Returns:
+            Кортеж (сообщение, выбранные цели, успешно ли выбрано)
+        """
+        selected_goals = [goal for i, goal in enumerate(all_goals) if mask >> i & 1]
+        if len(selected_goals) != GOALS_TO_SELECT:
+            return (
+                f"Нужно отметить ровно {GOALS_TO_SELECT} цели, сейчас отмечено {len(selected_goals)}.",
+                [],
+                False
+            )
+        goals_text = "\n".join(f"• {goal}" for goal in selected_goals)
         return (
-            f"📋 <b>Все твои цели:</b>\n\n{goals_text}\n\n"
-            "<b>Шаг 2: Фокусировка</b>\n\n"
-            "Теперь нужно выбрать 3 самые важные цели для дальнейшей работы.\n\n"
-            "Введи номера целей через запятую или пробел (например: 1, 3, 5 или 1 3 5)"
+            f"✅ Отлично! Выбраны 3 приоритетные цели:\n\n{goals_text}\n\n"
+            "Переходим к следующему шагу!",
+            selected_goals,
+            True
         )
     
     def process_goals_selection(self, user_input: str, all_goals: List[str]) -> tuple[str, List[str], bool]:
@@ -243,7 +342,14 @@ class GoalSettingScenario:
                 False
             )
     
-    async def get_success_criteria_prompt(self, goal: str, goal_number: int, total_goals: int) -> str:
+    async def get_success_criteria_prompt(
+        self,
+        goal: str,
+        goal_number: int,
+        total_goals: int,
+        conversation_history: Optional[List[Dict[str, str]]] = None,
+        user_id: Optional[int] = None
+    ) -> str:
         """
         Получить промпт для запроса критерия успеха с использованием LLM
         
@@ -251,104 +357,51 @@ class GoalSettingScenario:
             goal: Текст цели
             goal_number: Номер цели (1, 2, 3)
             total_goals: Всего целей (обычно 3)
+            conversation_history: История диалога сценария (передается в LLM)
+            user_id: ID пользователя (для краткого содержания истории)
         
         Returns:
             Сообщение с запросом критерия успеха
         """
-        system_prompt = (
-            "Ты - помощник по целеполаганию. Помоги пользователю сформулировать четкие критерии успеха для его цели. "
-            "Критерий должен быть измеримым и конкретным. Будь дружелюбным и мотивирующим."
-        )
+        # Заранее сгенерированный вариант для популярной цели отдается без обращения к LLM
+        cached = prompt_cache.lookup(goal)
+        if cached is not None:
+            return cached
         
-        user_prompt = (
-            f"Пользователь работает над целью: '{goal}' (цель {goal_number} из {total_goals}). "
-            "Нужно помочь ему сформулировать критерий успеха. "
-            "Напиши короткое дружелюбное сообщение, которое попросит пользователя определить, "
-            "как он поймет, что цель достигнута. Приведи 1-2 конкретных примера критериев для этой цели. "
-            "Ответ должен быть на русском языке и максимум 150 слов."
-        )
-        
-        # Если LLM недоступен, используем fallback
-        if self.llm is None:
-            pass  # Переходим к fallback
-        else:
+        # Основная и более быстрые модели в пределах бюджета времени (см. model_router.py)
+        if self.llm is not None:
             try:
-                llm_response = await self.llm.generate_response(
-                    user_message=user_prompt,
-                    system_prompt=system_prompt,
+                return await self.llm.generate_response(
+                    user_message=build_criteria_user_prompt(goal, goal_number, total_goals),
+                    system_prompt=CRITERIA_SYSTEM_PROMPT,
                     temperature=0.8,
-                    max_tokens=200
+                    max_tokens=200,
+                    deadline=CRITERIA_DEADLINE,
+                    conversation_history=conversation_history,
+                    user_id=user_id
                 )
-                return llm_response
             except Exception as e:
-                logger.warning(f"Ошибка при обращении к LLM: {e}, используем fallback")
+                logger.warning(f"Ошибка при обращении к LLM: {e!r}, используем fallback")
         
-        # Fallback сообщение в случае отсутствия или ошибки LLM
-        examples = {
-            "карьерный рост": "получил новую должность",
-            "ранний подъем": "встаю в 7 утра без будильника всю неделю",
-            "похудение": "похудел на 5 кг"
-        }
+        # Заранее сгенерированный вариант для похожей популярной цели
+        similar = prompt_cache.lookup_similar(goal)
+        if similar is not None:
+            metrics.FALLBACKS.inc(kind="success_criteria_prompt_similar")
+            return similar
         
-        example = ""
-        for key, value in examples.items():
-            if key in goal.lower():
-                example = f"Например: '{value}'"
-                break
-        
-        if not example:
-            example = "Например: 'получил новую должность' или 'встаю в 7 утра без будильника всю неделю'"
-        
-        return (
-            f"<b>Шаг 3: Конкретизация результатов</b>\n\n"
-            f"🎯 <b>Цель {goal_number} из {total_goals}: {goal}</b>\n\n"
-            f"Как ты поймешь, что эта цель достигнута? "
-            f"Опиши конкретный результат (количественный или качественный).\n\n"
-            f"<i>{example}</i>"
-        )
+        # Локальный шаблон с примерами по теме цели
+        metrics.FALLBACKS.inc(kind="success_criteria_prompt")
+        return criteria_templates.render(goal, goal_number, total_goals)
     
     def get_planning_instruction_message(self) -> str:
         """Получить сообщение с инструкцией по планированию"""
-        return (
-            "📚 <b>Шаг 4: Создание плана действий</b>\n\n"
-            "Теперь у тебя есть 3 четкие цели с определенными критериями успеха. "
-            "Вот пошаговая инструкция по планированию, основанная на принципах SMART:\n\n"
-            "<b>Шаг 1:</b> Четко определи 1-3 ключевые цели на 12 недель (уже сделано ✅)\n\n"
-            "<b>Шаг 2:</b> Декомпозируй каждую цель на тактические еженедельные и ежедневные шаги\n"
-            "   • Разбей большие цели на маленькие задачи\n"
-            "   • Определи, что нужно делать каждую неделю\n"
-            "   • Планируй ежедневные действия\n\n"
-            "<b>Шаг 3:</b> Заблокируй время в календаре на ключевые задачи\n"
-            "   • Рекомендуется 3-4 часа фокусной работы в день\n"
-            "   • Выдели конкретное время для работы над каждой целью\n\n"
-            "<b>Шаг 4:</b> Еженедельно отслеживай прогресс и корректируй действия\n"
-            "   • В конце каждой недели проверяй, что сделано\n"
-            "   • Адаптируй план при необходимости\n\n"
-            "<b>Шаг 5:</b> По итогам 12 недель проведи оценку результатов\n"
-            "   • Что удалось достичь?\n"
-            "   • Какие были препятствия?\n"
-            "   • Что нужно скорректировать в следующем цикле?\n\n"
-            "<b>Шаг 6:</b> Начни новый 12-недельный цикл для непрерывного развития 🔄\n\n"
-            "💡 Помни: регулярность и отслеживание прогресса - ключ к успеху!"
-        )
+        return payloads.registry.text("scenario_planning_instruction")
     
     def get_finalization_message(self, selected_goals: List[Goal]) -> str:
         """Получить финальное сообщение с итогами"""
-        goals_summary = "\n".join([
-            f"• <b>{goal.text}</b>\n  Критерий успеха: {goal.success_criteria or 'Не указан'}"
+        render = payloads.registry.render
+        goals_summary = "\n".join(
+            render("finalization_goal", text=goal.text, criteria=goal.success_criteria or "Не указан")
             for goal in selected_goals
-        ])
-        
-        return (
-            "🎉 <b>Поздравляю! Сценарий завершен!</b>\n\n"
-            f"📋 <b>Твои приоритетные цели на 12 недель:</b>\n\n{goals_summary}\n\n"
-            "Теперь у тебя есть:\n"
-            "✅ 3 четкие приоритетные цели\n"
-            "✅ Критерии успеха для каждой цели\n"
-            "✅ Инструкция по планированию и отслеживанию прогресса\n\n"
-            "<b>Готов двигаться дальше?</b>\n\n"
-            "Хочешь декомпозировать цели на конкретные задания? 🎯\n"
-            "Или нужна консультация коуча? 💼\n\n"
-            "Напиши, что тебя интересует!"
         )
-
+        return render("finalization", goals=goals_summary)
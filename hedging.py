@@ -0,0 +1,162 @@
+"""
+Модуль хеджирования запросов для сокращения "хвоста" задержек
+
+Если запрос не завершился за адаптивный порог (заданный перцентиль недавних
+задержек), отправляется второй такой же запрос; используется первый успешный
+ответ, второй отменяется. Доля дополнительных запросов ограничена бюджетом:
+каждый запрос пополняет бюджет на budget_percent / 100, хедж тратит единицу.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Optional, TypeVar
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+HEDGES = metrics.registry.counter(
+    "bot_llm_hedges_total",
+    "Решения политики хеджирования: not_needed, budget_exhausted, sent; won - хедж ответил первым",
+    ("result",)
+)
+HEDGE_DELAY = metrics.registry.gauge(
+    "bot_llm_hedge_delay_seconds",
+    "Текущий порог отправки хеджирующего запроса"
+)
+
+
+class LatencyWindow:
+    """Скользящее окно последних задержек для оценки перцентилей"""
+
+    def __init__(self, size: int = 200):
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def observe(self, seconds: float) -> None:
+        """Добавить измерение"""
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Перцентиль p (0-100) по окну или None, если измерений нет"""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(len(ordered) * p / 100))
+        return ordered[index]
+
+
+class HedgePolicy:
+    """Политика хеджирования запросов с адаптивным порогом и бюджетом"""
+
+    def __init__(
+        self,
+        percentile: float = 95,
+        budget_percent: float = 5,
+        min_delay: float = 0.5,
+        max_delay: float = 10,
+        window: int = 200,
+        min_samples: int = 20,
+        max_credit: float = 10
+    ):
+        """
+        Инициализация политики
+
+        Args:
+            percentile: Перцентиль недавних задержек, после которого отправляется хедж
+            budget_percent: Максимальная доля дополнительных запросов в процентах
+            min_delay: Нижняя граница порога в секундах
+            max_delay: Верхняя граница порога (используется, пока мало измерений)
+            window: Размер окна измерений
+            min_samples: Сколько измерений нужно для адаптивного порога
+            max_credit: Максимальный накопленный запас хеджей (всплеск)
+        """
+        self.percentile = percentile
+        self.budget = budget_percent / 100
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.max_credit = max_credit
+        self.latencies = LatencyWindow(window)
+        self._credit = 0.0
+
+    def delay(self) -> float:
+        """Текущий порог отправки хеджа в секундах"""
+        value = self.latencies.percentile(self.percentile)
+        if value is None or len(self.latencies) < self.min_samples:
+            delay = self.max_delay
+        else:
+            delay = min(self.max_delay, max(self.min_delay, value))
+        HEDGE_DELAY.set(delay)
+        return delay
+
+    async def run(self, factory: Callable[[], Awaitable[T]]) -> T:
+        """
+        Выполнить запрос с хеджированием
+
+        Args:
+            factory: Функция, создающая новую попытку запроса
+
+        Returns:
+            Результат первой успешной попытки
+        """
+        self._credit = min(self.max_credit, self._credit + self.budget)
+        started = time.monotonic()
+        attempts = {asyncio.ensure_future(factory()): started}
+        try:
+            done, _ = await asyncio.wait(set(attempts), timeout=self.delay())
+            if not done:
+                if self._credit >= 1:
+                    self._credit -= 1
+                    HEDGES.inc(result="sent")
+                    attempts[asyncio.ensure_future(factory())] = time.monotonic()
+                else:
+                    HEDGES.inc(result="budget_exhausted")
+            else:
+                HEDGES.inc(result="not_needed")
+
+            primary = next(iter(attempts))
+            pending = set(attempts)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        now = time.monotonic()
+                        self.latencies.observe(now - attempts[task])
+                        if task is not primary:
+                            HEDGES.inc(result="won")
+                            if not primary.done():
+                                # Основная попытка будет отменена: ее задержка не меньше
+                                # прошедшего времени. Без этой оценки окно видит только
+                                # быстрые ответы, и порог хеджирования занижается
+                                self.latencies.observe(now - started)
+                                logger.debug(
+                                    f"Хедж ответил за {now - attempts[task]:.2f} с, "
+                                    f"основная попытка не ответила за {now - started:.2f} с"
+                                )
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in attempts:
+                if not task.done():
+                    task.cancel()
+
+
+def create_policy() -> Optional[HedgePolicy]:
+    """Создать политику по переменным окружения (LLM_HEDGING=1 включает хеджирование)"""
+    if os.getenv("LLM_HEDGING", "0") != "1":
+        return None
+    return HedgePolicy(
+        percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", "95")),
+        budget_percent=float(os.getenv("LLM_HEDGE_BUDGET_PERCENT", "5")),
+        min_delay=float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5")),
+        max_delay=float(os.getenv("LLM_HEDGE_MAX_DELAY", "10"))
+    )
@@ -0,0 +1,266 @@
+"""
+Модуль управления историей диалога (conversation_history)
+
+История ограничивается бюджетом токенов: последние реплики хранятся
+в кольцевом буфере, а вытесненные сворачиваются в краткое содержание,
+которое генерируется LLM в фоне.
+"""
+import asyncio
+import logging
+import os
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+import tenancy
+
+logger = logging.getLogger(__name__)
+
+# Префикс, по которому сообщение с кратким содержанием отличается от обычных реплик
+SUMMARY_PREFIX = "Краткое содержание предыдущего диалога:"
+
+# Служебные токены, которые OpenAI добавляет к каждому сообщению
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def _load_tokenizer():
+    """Попытка загрузить tiktoken. Если пакет не установлен, используется оценка по длине."""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+
+
+class HistoryManager:
+    """Менеджер истории диалога с ограничением по токенам"""
+
+    def __init__(
+        self,
+        max_tokens: int = 1500,
+        max_turns: int = 20,
+        summary_max_tokens: int = 300,
+        max_summaries: int = 10000,
+        llm=None
+    ):
+        """
+        Инициализация менеджера истории
+
+        Args:
+            max_tokens: Бюджет токенов на историю (включая краткое содержание)
+            max_turns: Максимальное количество реплик в кольцевом буфере
+            summary_max_tokens: Максимальная длина краткого содержания в токенах
+            max_summaries: Сколько готовых фоновых кратких содержаний, еще не перенесенных
+                           в историю, хранить в памяти (при переполнении вытесняются самые старые)
+            llm: Экземпляр LLM клиента для фонового сжатия. Если None, используется
+                 усечение без обращения к модели.
+        """
+        self.max_tokens = max_tokens
+        self.max_turns = max_turns
+        self.summary_max_tokens = summary_max_tokens
+        self.max_summaries = max_summaries
+        self.llm = llm
+        self._tokenizer = _load_tokenizer()
+        # Готовые фоновые краткие содержания, еще не перенесенные в историю при сохранении
+        # (ключ - (ID бота, ID пользователя)); удаляются в compact()
+        self._summaries: Dict[Tuple[int, int], str] = {}
+        # Фоновые задачи суммаризации по пользователям
+        self._tasks: Dict[Tuple[int, int], asyncio.Task] = {}
+
+    @staticmethod
+    def _key(user_id: int) -> Tuple[int, int]:
+        """Ключ пользователя: один и тот же пользователь у разных ботов - разные диалоги"""
+        return tenancy.current_bot_id.get(), user_id
+
+    def estimate_tokens(self, text: str) -> int:
+        """
+        Оценка количества токенов в тексте
+
+        Используется tiktoken, если он установлен, иначе грубая оценка:
+        около 3 символов на токен для кириллицы и латиницы.
+        """
+        if not text:
+            return 0
+        if self._tokenizer is not None:
+            return len(self._tokenizer.encode(text))
+        return len(text) // 3 + 1
+
+    def message_tokens(self, message: Dict[str, str]) -> int:
+        """Оценка количества токенов в одном сообщении"""
+        return self.estimate_tokens(message.get("content", "")) + MESSAGE_OVERHEAD_TOKENS
+
+    @staticmethod
+    def is_summary(message: Dict[str, str]) -> bool:
+        """Является ли сообщение кратким содержанием"""
+        return message.get("role") == "system" and message.get("content", "").startswith(SUMMARY_PREFIX)
+
+    @staticmethod
+    def make_summary_message(summary: str) -> Dict[str, str]:
+        """Создать сообщение с кратким содержанием"""
+        return {"role": "system", "content": f"{SUMMARY_PREFIX}\n{summary}"}
+
+    def _split(self, history: List[Dict[str, str]]) -> tuple[Optional[str], List[Dict[str, str]]]:
+        """Разделить историю на краткое содержание и обычные реплики"""
+        summary = None
+        turns = []
+        for message in history:
+            if self.is_summary(message):
+                summary = message["content"][len(SUMMARY_PREFIX):].strip()
+            else:
+                turns.append(message)
+        return summary, turns
+
+    def _fill_buffer(
+        self,
+        turns: List[Dict[str, str]],
+        budget: int
+    ) -> tuple[List[Dict[str, str]], List[Dict[str, str]]]:
+        """
+        Заполнить кольцевой буфер последними репликами в пределах бюджета
+
+        Returns:
+            Кортеж (оставленные реплики, вытесненные реплики)
+        """
+        buffer: Deque[Dict[str, str]] = deque(maxlen=self.max_turns)
+        used = 0
+        split_at = len(turns)
+        for index in range(len(turns) - 1, -1, -1):
+            tokens = self.message_tokens(turns[index])
+            if used + tokens > budget or len(buffer) == buffer.maxlen:
+                break
+            buffer.appendleft(turns[index])
+            used += tokens
+            split_at = index
+        return list(buffer), turns[:split_at]
+
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        """Усечь текст до заданного количества токенов (с начала)"""
+        if self.estimate_tokens(text) <= max_tokens:
+            return text
+        if self._tokenizer is not None:
+            return self._tokenizer.decode(self._tokenizer.encode(text)[-max_tokens:])
+        return text[-max_tokens * 3:]
+
+    def _extractive_summary(self, previous: Optional[str], evicted: List[Dict[str, str]]) -> str:
+        """Быстрое краткое содержание без LLM: склейка и усечение вытесненных реплик"""
+        parts = [previous] if previous else []
+        parts.extend(f"{m.get('role')}: {m.get('content', '')}" for m in evicted)
+        return self._truncate("\n".join(parts), self.summary_max_tokens)
+
+    def fit(self, history: Optional[List[Dict[str, str]]], user_id: Optional[int] = None) -> List[Dict[str, str]]:
+        """
+        Подготовить историю к отправке в LLM без изменения исходного списка
+
+        Args:
+            history: История диалога
+            user_id: ID пользователя (для подстановки готового фонового краткого содержания)
+
+        Returns:
+            Список сообщений в пределах бюджета токенов
+        """
+        if not history:
+            return []
+        summary, turns = self._split(history)
+        if user_id is not None:
+            summary = self._summaries.get(self._key(user_id), summary)
+
+        summary_message = self.make_summary_message(summary) if summary else None
+        budget = self.max_tokens - (self.message_tokens(summary_message) if summary_message else 0)
+        kept, _ = self._fill_buffer(turns, budget)
+        return ([summary_message] if summary_message else []) + kept
+
+    def compact(self, user_id: int, history: Optional[List[Dict[str, str]]]) -> List[Dict[str, str]]:
+        """
+        Сжать историю для хранения в БД
+
+        Вытесненные реплики сразу заменяются быстрым кратким содержанием,
+        а в фоне запускается его переписывание с помощью LLM. Готовое фоновое
+        краткое содержание переносится в возвращаемую историю и удаляется из памяти.
+
+        Args:
+            user_id: ID пользователя
+            history: История диалога
+
+        Returns:
+            Сжатая история (краткое содержание + последние реплики)
+        """
+        if not history:
+            return []
+        summary, turns = self._split(history)
+        summary = self._summaries.pop(self._key(user_id), summary)
+
+        reserved = self.summary_max_tokens + MESSAGE_OVERHEAD_TOKENS
+        kept, evicted = self._fill_buffer(turns, self.max_tokens - reserved)
+        if evicted:
+            summary = self._extractive_summary(summary, evicted)
+            self._schedule_summary(user_id, summary)
+
+        if not summary:
+            return kept
+        return [self.make_summary_message(summary)] + kept
+
+    def _schedule_summary(self, user_id: int, draft: str) -> None:
+        """Запустить фоновую суммаризацию, если есть LLM и запущен цикл событий"""
+        key = self._key(user_id)
+        if self.llm is None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+
+        previous = self._tasks.get(key)
+        if previous and not previous.done():
+            previous.cancel()
+        self._tasks[key] = loop.create_task(self._summarize(user_id, draft))
+
+    async def _summarize(self, user_id: int, draft: str) -> None:
+        """Фоновое переписывание краткого содержания с помощью LLM"""
+        key = self._key(user_id)
+        try:
+            summary = await self.llm.generate_response(
+                user_message=draft,
+                system_prompt=(
+                    "Сожми следующий фрагмент диалога в краткое содержание на русском языке. "
+                    "Сохрани цели пользователя, критерии успеха и принятые решения."
+                ),
+                temperature=0.2,
+                max_tokens=self.summary_max_tokens
+            )
+            if summary:
+                self._summaries.pop(key, None)
+                self._summaries[key] = self._truncate(summary.strip(), self.summary_max_tokens)
+                # Пользователь может не вернуться: самые старые содержания вытесняются
+                while len(self._summaries) > self.max_summaries:
+                    del self._summaries[next(iter(self._summaries))]
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Не удалось сжать историю пользователя {user_id}: {e}")
+        finally:
+            if self._tasks.get(key) is asyncio.current_task():
+                del self._tasks[key]
+
+    def forget(self, user_id: int) -> None:
+        """Удалить краткое содержание и фоновые задачи пользователя"""
+        key = self._key(user_id)
+        self._summaries.pop(key, None)
+        task = self._tasks.pop(key, None)
+        if task and not task.done():
+            task.cancel()
+
+
+# Глобальный экземпляр менеджера (инициализируется при первом использовании)
+_manager: Optional[HistoryManager] = None
+
+
+def get_history_manager() -> HistoryManager:
+    """Получить глобальный экземпляр менеджера истории"""
+    global _manager
+    if _manager is None:
+        _manager = HistoryManager(
+            max_tokens=int(os.getenv("HISTORY_MAX_TOKENS", "1500")),
+            max_turns=int(os.getenv("HISTORY_MAX_TURNS", "20")),
+            summary_max_tokens=int(os.getenv("HISTORY_SUMMARY_MAX_TOKENS", "300")),
+            max_summaries=int(os.getenv("HISTORY_MAX_SUMMARIES", "10000"))
+        )
+    return _manager
@@ -0,0 +1,221 @@
+"""
+Модуль распознавания намерений в свободном тексте
+
+Вместо последовательных проверок `any(word in text for word in [...])` по
+нескольким спискам ключевых слов все намерения компилируются один раз:
+- фразы (весь ответ целиком, например "готово") - в словарь, поиск за O(1);
+- основы слов всех намерений (подстрока в любом месте, например "декомпозир") -
+  в одно регулярное выражение, в котором основы свернуты в общее префиксное
+  дерево. Текст просматривается за один проход, в каждой позиции находится
+  самая длинная основа (более короткие основы-префиксы следуют из нее), а
+  добавление новых намерений почти не замедляет разбор сообщения.
+
+Фразы и основы встроенных намерений можно расширить JSON файлом
+(переменная окружения INTENTS_FILE):
+    {"done": {"phrases": ["все"]}, "coach": {"stems": ["наставни"]}}
+Фразы и основы добавляются к встроенным. Новые намерения из файла не
+загружаются: этапы сценария распознают только свои наборы намерений
+(CONTINUE_OR_RESTART, GOALS_DONE, FINALIZATION), и обработчиков для новых
+имен нет.
+"""
+import json
+import logging
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Pattern, Sequence, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+INTENTS = metrics.registry.counter(
+    "bot_intents_total",
+    "Распознанные намерения в свободном тексте",
+    ("intent",)
+)
+
+# Встроенные намерения: фразы (весь ответ целиком) и основы слов (в любом месте текста)
+DEFAULT_INTENTS: Dict[str, Dict[str, Tuple[str, ...]]] = {
+    # Ответ на вопрос "продолжить или начать заново" при повторном запуске сценария
+    "continue": {"phrases": ("продолжить", "продолжать")},
+    "restart": {"phrases": ("начать заново", "заново", "новый")},
+    # Завершение ввода целей
+    "done": {"phrases": ("готово", "завершить", "готов", "закончить", "/done")},
+    # Следующие шаги после финализации сценария
+    "decompose": {"stems": ("декомпозир", "задания", "разбить", "план", "задачи")},
+    "coach": {"stems": ("коуч", "консультац", "помощь", "поддержка")},
+}
+
+
+def normalize(text: str) -> str:
+    """Нормализация текста: нижний регистр, ё -> е, схлопнутые пробелы"""
+    return " ".join(text.lower().replace("ё", "е").split())
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """
+    Регулярное выражение для набора строк, свернутого в префиксное дерево
+
+    Например, ("план", "планк", "плюс") -> "пл(?:ан(?:к)?|юс)": движок проверяет
+    общий префикс один раз, а не каждую альтернативу с начала, и находит самую
+    длинную строку из набора.
+    """
+    trie: Dict[str, dict] = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: Dict[str, dict]) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # Строка может закончиться в этом узле: продолжение необязательно
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+class IntentMatcher:
+    """Распознавание намерений по фразам и основам слов за один проход по тексту"""
+
+    def __init__(self, intents: Optional[Dict[str, Dict[str, Sequence[str]]]] = None):
+        """
+        Инициализация
+
+        Args:
+            intents: Намерения в порядке приоритета: имя -> {"phrases": [...], "stems": [...]}
+        """
+        self._phrases: Dict[str, List[str]] = {}
+        self._stems: Dict[str, List[str]] = {}
+        self._order: List[str] = []
+        self._compiled: Dict[Tuple[str, ...], Tuple[Dict[str, str], Optional[Pattern], Dict[str, int]]] = {}
+        for name, patterns in (intents or {}).items():
+            self.add(name, phrases=patterns.get("phrases", ()), stems=patterns.get("stems", ()))
+
+    @property
+    def intents(self) -> List[str]:
+        """Имена намерений в порядке приоритета"""
+        return list(self._order)
+
+    def add(self, name: str, phrases: Iterable[str] = (), stems: Iterable[str] = ()) -> None:
+        """
+        Добавить намерение или расширить существующее
+
+        Args:
+            name: Имя намерения
+            phrases: Фразы, с которыми должен совпасть весь текст
+            stems: Основы слов, которые ищутся в любом месте текста
+        """
+        if name not in self._order:
+            self._order.append(name)
+            self._phrases[name] = []
+            self._stems[name] = []
+        self._phrases[name].extend(normalize(phrase) for phrase in phrases)
+        self._stems[name].extend(filter(None, (normalize(stem) for stem in stems)))
+        self._compiled.clear()
+
+    def _compile(self, scope: Tuple[str, ...]) -> Tuple[Dict[str, str], Optional[Pattern], Dict[str, int]]:
+        """
+        Словарь фраз, общее регулярное выражение основ и приоритеты основ для набора намерений
+
+        Приоритет основы - индекс в scope самого приоритетного намерения среди
+        этой основы и всех основ, которые являются ее префиксами.
+        """
+        compiled = self._compiled.get(scope)
+        if compiled is not None:
+            return compiled
+        unknown = [name for name in scope if name not in self._phrases]
+        if unknown:
+            raise KeyError(f"Неизвестные намерения: {', '.join(unknown)}")
+
+        phrases: Dict[str, str] = {}
+        own: Dict[str, int] = {}
+        # Порядок scope - приоритет: при совпадении у двух намерений побеждает первое
+        for index, name in enumerate(scope):
+            for phrase in self._phrases[name]:
+                phrases.setdefault(phrase, name)
+            for stem in self._stems[name]:
+                own.setdefault(stem, index)
+        priorities = {
+            stem: min(own[stem[:end]] for end in range(1, len(stem) + 1) if stem[:end] in own)
+            for stem in own
+        }
+        # Опережающая проверка находит совпадения в каждой позиции, в том числе перекрывающиеся
+        pattern = re.compile(f"(?=({_trie_pattern(own)}))") if own else None
+        compiled = self._compiled[scope] = (phrases, pattern, priorities)
+        return compiled
+
+    def classify(self, text: Optional[str], intents: Optional[Sequence[str]] = None) -> Optional[str]:
+        """
+        Определить намерение текста
+
+        Args:
+            text: Текст сообщения
+            intents: Какие намерения учитывать, в порядке приоритета (по умолчанию все)
+
+        Returns:
+            Имя намерения или None
+        """
+        if not text:
+            return None
+        scope = tuple(intents) if intents is not None else tuple(self._order)
+        phrases, pattern, priorities = self._compile(scope)
+        normalized = normalize(text)
+        intent = phrases.get(normalized)
+        if intent is None and pattern is not None:
+            # Один проход по тексту; из найденных намерений выбирается самое приоритетное
+            best = None
+            for match in pattern.finditer(normalized):
+                priority = priorities[match.group(1)]
+                if best is None or priority < best:
+                    best = priority
+                    if best == 0:
+                        break
+            if best is not None:
+                intent = scope[best]
+        if intent is not None:
+            INTENTS.inc(intent=intent)
+        return intent
+
+    def warm_up(self, *scopes: Sequence[str]) -> None:
+        """Скомпилировать наборы намерений заранее (при запуске бота)"""
+        for scope in scopes:
+            self._compile(tuple(scope))
+
+
+def create_matcher() -> IntentMatcher:
+    """Создать распознаватель из встроенных намерений, расширенных файлом INTENTS_FILE"""
+    matcher = IntentMatcher(DEFAULT_INTENTS)
+    path = os.getenv("INTENTS_FILE")
+    if path:
+        try:
+            with open(path, encoding="utf-8") as file:
+                extra = json.load(file)
+            unknown = [name for name in extra if name not in DEFAULT_INTENTS]
+            if unknown:
+                logger.warning(
+                    f"Намерения из {path} пропущены: {', '.join(unknown)} "
+                    f"(файл может только расширять встроенные: {', '.join(DEFAULT_INTENTS)})"
+                )
+            loaded = [name for name in extra if name in DEFAULT_INTENTS]
+            for name in loaded:
+                patterns = extra[name]
+                matcher.add(name, phrases=patterns.get("phrases", ()), stems=patterns.get("stems", ()))
+            if loaded:
+                logger.info(f"Расширены намерения из {path}: {', '.join(loaded)}")
+        except (OSError, ValueError, AttributeError) as e:
+            logger.error(f"Не удалось загрузить намерения из {path}: {e}")
+    return matcher
+
+
+# Наборы намерений для этапов сценария (в порядке приоритета)
+CONTINUE_OR_RESTART = ("continue", "restart")
+GOALS_DONE = ("done",)
+FINALIZATION = ("decompose", "coach")
+
+# Глобальный распознаватель; наборы этапов сценария компилируются при импорте
+matcher = create_matcher()
+matcher.warm_up(CONTINUE_OR_RESTART, GOALS_DONE, FINALIZATION)
@@ -0,0 +1,191 @@
+"""
+Модуль управления жизненным циклом бота: корректная остановка без потерь
+
+По SIGTERM/SIGINT бот:
+1. снимает сигнал готовности и прекращает получать обновления;
+2. дожидается обработчиков, которые уже выполняются, и задач "слива"
+   (текущая порция рассылки, фоновые сжатия истории) в пределах общего срока;
+3. по очереди выполняет шаги остановки: фоновые задачи, запись буферов
+   в БД (журнал обновлений, FSM контексты), закрытие БД, LLM и Bot API сессий;
+4. пишет в лог время каждого этапа.
+"""
+import asyncio
+import logging
+import os
+import signal
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.types import TelegramObject
+
+import startup
+
+logger = logging.getLogger(__name__)
+
+
+class InFlightTracker(BaseMiddleware):
+    """Внешний middleware: учет обновлений, обработка которых еще не завершена"""
+
+    def __init__(self):
+        self.tasks: Set[asyncio.Task] = set()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        task = asyncio.current_task()
+        self.tasks.add(task)
+        try:
+            return await handler(event, data)
+        finally:
+            self.tasks.discard(task)
+
+
+class Lifecycle:
+    """Остановка бота: прекращение приема обновлений, ожидание обработчиков и закрытие ресурсов"""
+
+    def __init__(self, drain_timeout: float = 20, step_timeout: float = 10):
+        """
+        Инициализация
+
+        Args:
+            drain_timeout: Сколько секунд ждать выполняющиеся обработчики и задачи слива
+            step_timeout: Максимальное время одного шага остановки
+        """
+        self.drain_timeout = drain_timeout
+        self.step_timeout = step_timeout
+        self.tracker = InFlightTracker()
+        self.timings: Dict[str, float] = {}
+        self._drain_tasks: List[Tuple[str, Callable[[float], Awaitable]]] = []
+        self._steps: List[Tuple[str, Callable[[], Awaitable]]] = []
+        self._stop: Optional[asyncio.Event] = None
+
+    def add_drain_task(self, name: str, task: Callable[[float], Awaitable]) -> None:
+        """Добавить задачу слива: выполняется параллельно с ожиданием обработчиков, получает срок в секундах"""
+        self._drain_tasks.append((name, task))
+
+    def add_shutdown_step(self, name: str, step: Callable[[], Awaitable]) -> None:
+        """Добавить шаг остановки (выполняются по очереди в порядке добавления)"""
+        self._steps.append((name, step))
+
+    def request_stop(self, sig: Optional[signal.Signals] = None) -> None:
+        """Запросить остановку (обработчик сигналов)"""
+        if sig is not None:
+            logger.info(f"Получен сигнал {sig.name}, останавливаем бота")
+        if self._stop is not None:
+            self._stop.set()
+
+    def _install_signal_handlers(self) -> None:
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, self.request_stop, sig)
+            except NotImplementedError:
+                # Windows: остановка только по KeyboardInterrupt
+                pass
+
+    async def run_polling(self, dp: Dispatcher, *bots: Bot, **kwargs: Any) -> None:
+        """
+        Получать обновления до сигнала остановки, затем корректно остановиться
+
+        Args:
+            dp: Диспетчер
+            bots: Боты для долгого опроса
+            kwargs: Дополнительные параметры dp.start_polling
+        """
+        self._stop = asyncio.Event()
+        self._install_signal_handlers()
+        polling = asyncio.create_task(
+            dp.start_polling(*bots, handle_signals=False, close_bot_session=False, **kwargs)
+        )
+        stop = asyncio.create_task(self._stop.wait())
+        try:
+            await asyncio.wait({polling, stop}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            stop.cancel()
+            startup.pipeline.mark_not_ready()
+            started = time.perf_counter()
+            if not polling.done():
+                try:
+                    await dp.stop_polling()
+                except RuntimeError:
+                    # Сигнал пришел до начала опроса
+                    polling.cancel()
+            try:
+                await polling
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                logger.error(f"Получение обновлений завершилось ошибкой: {e}")
+            self.timings["polling"] = time.perf_counter() - started
+            await self.shutdown()
+
+    async def _run_drain_task(self, name: str, task: Callable[[float], Awaitable], deadline: float) -> None:
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(task(deadline), timeout=deadline + 1)
+        except asyncio.TimeoutError:
+            logger.warning(f"Слив '{name}' не уложился в {deadline:.0f} с")
+        except Exception as e:
+            logger.warning(f"Слив '{name}' завершился ошибкой: {e}")
+        finally:
+            self.timings[name] = time.perf_counter() - started
+
+    async def drain(self) -> Tuple[int, int]:
+        """
+        Дождаться выполняющихся обработчиков и задач слива
+
+        Returns:
+            (завершились, прерваны по истечении срока) для обработчиков
+        """
+        started = time.perf_counter()
+        handlers = set(self.tracker.tasks)
+        pending: Set[asyncio.Task] = set()
+
+        async def wait_handlers() -> None:
+            nonlocal pending
+            if handlers:
+                _, pending = await asyncio.wait(handlers, timeout=self.drain_timeout)
+
+        await asyncio.gather(
+            wait_handlers(),
+            *(self._run_drain_task(name, task, self.drain_timeout) for name, task in self._drain_tasks)
+        )
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning(f"Прервано обработчиков по истечении {self.drain_timeout:.0f} с: {len(pending)}")
+        self.timings["drain"] = time.perf_counter() - started
+        return len(handlers) - len(pending), len(pending)
+
+    async def shutdown(self) -> None:
+        """Слив и шаги остановки с отчетом о времени"""
+        started = time.perf_counter()
+        finished, interrupted = await self.drain()
+        for name, step in self._steps:
+            step_started = time.perf_counter()
+            try:
+                await asyncio.wait_for(step(), timeout=self.step_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Шаг остановки '{name}' не уложился в {self.step_timeout} с")
+            except Exception as e:
+                logger.warning(f"Шаг остановки '{name}' завершился ошибкой: {e}")
+            finally:
+                self.timings[name] = time.perf_counter() - step_started
+        self.timings["total"] = time.perf_counter() - started + self.timings.get("polling", 0)
+
+        report = ", ".join(f"{name}: {seconds * 1000:.0f} мс" for name, seconds in self.timings.items())
+        logger.info(
+            f"Бот остановлен: обработчиков завершено {finished}, прервано {interrupted} ({report})"
+        )
+
+
+def create_lifecycle() -> Lifecycle:
+    """Создать менеджер остановки с настройками из переменных окружения"""
+    return Lifecycle(
+        drain_timeout=float(os.getenv("SHUTDOWN_DRAIN_SECONDS", "20")),
+        step_timeout=float(os.getenv("SHUTDOWN_STEP_SECONDS", "10"))
+    )
@@ -1,12 +1,16 @@
 """
 Модуль для работы с ChatGPT API
 """
+import asyncio
 import os
+import time
 from typing import Optional, List, Dict
-from openai import AsyncOpenAI
 from dotenv import load_dotenv
 import logging
 
+import history_manager
+import model_router
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
@@ -15,48 +19,115 @@ logger = logging.getLogger(__name__)
 class LLMClient:
     """Клиент для работы с ChatGPT API"""
     
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None):
         """
         Инициализация клиента OpenAI
         
         Args:
             api_key: API ключ OpenAI. Если не указан, берется из переменной окружения OPENAI_API_KEY
+            base_url: Адрес API (например, локальный тестовый сервер). Если не указан,
+                      берется из переменной окружения OPENAI_BASE_URL или используется адрес OpenAI
         """
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
         if not self.api_key:
             raise ValueError("OPENAI_API_KEY не найден. Укажите его в .env файле или передайте при инициализации.")
         
-        self.client = AsyncOpenAI(api_key=self.api_key)
-        self.model = "gpt-4o-mini"  # Используем более доступную модель
+        # openai импортируется здесь, а не при загрузке модуля: это ускоряет запуск бота
+        from openai import AsyncOpenAI
+        
+        self._client_class = AsyncOpenAI
+        self._clients: Dict[Optional[str], object] = {}
+        # Модели в порядке предпочтения (переменная окружения LLM_MODELS)
+        self.router = model_router.create_router(base_url or os.getenv("OPENAI_BASE_URL"))
+        self.model = self.router.primary.model
+        self.client = self._client_for(self.router.primary)
+    
+    def _client_for(self, endpoint: model_router.ModelEndpoint):
+        """Клиент API для адреса модели (один на адрес)"""
+        client = self._clients.get(endpoint.base_url)
+        if client is None:
+            client = self._clients[endpoint.base_url] = self._client_class(
+                api_key=self.api_key,
+                base_url=endpoint.base_url
+            )
+        return client
+    
+    async def close(self) -> None:
+        """Закрыть HTTP соединения всех клиентов API"""
+        for client in self._clients.values():
+            await client.close()
+        self._clients.clear()
     
     async def chat_completion(
         self,
         messages: List[Dict[str, str]],
         temperature: float = 0.7,
-        max_tokens: int = 1000
+        max_tokens: int = 1000,
+        deadline: Optional[float] = None,
+        background: bool = False
     ) -> str:
         """
         Выполнение запроса к ChatGPT API
         
+        Модели пробуются в порядке, выбранном маршрутизатором; при ошибке или
+        таймауте запрос повторяется к следующей модели, пока не истечет бюджет.
+        
         Args:
             messages: Список сообщений в формате [{"role": "user", "content": "..."}]
             temperature: Параметр температуры (0.0 - 2.0), контролирует случайность ответа
             max_tokens: Максимальное количество токенов в ответе
+            deadline: Бюджет времени на весь вызов в секундах (None - без ограничения)
+            background: Фоновый запрос: без хеджирования и без учета в статистике
+                        маршрутизатора, чтобы не расходовать бюджет хеджей и не
+                        искажать выбор модели для пользователей
         
         Returns:
             Текст ответа от модели
         """
-        try:
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            logger.error(f"Ошибка при обращении к ChatGPT API: {e}")
-            raise
+        plan = self.router.plan(deadline)
+        finish = time.monotonic() + deadline if deadline is not None else None
+        error: Exception = asyncio.TimeoutError()
+        
+        for index, endpoint in enumerate(plan):
+            timeout = None
+            if finish is not None:
+                remaining = finish - time.monotonic()
+                if remaining <= 0:
+                    break
+                next_endpoint = plan[index + 1] if index + 1 < len(plan) else None
+                timeout = self.router.attempt_timeout(remaining, next_endpoint)
+            
+            client = self._client_for(endpoint)
+            
+            def request():
+                return client.chat.completions.create(
+                    model=endpoint.model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens
+                )
+            
+            started = time.monotonic()
+            try:
+                attempt = endpoint.hedge.run(request) if endpoint.hedge and not background else request()
+                response = await asyncio.wait_for(attempt, timeout)
+                endpoint.record(time.monotonic() - started, "ok", self.router.alpha, background)
+                return response.choices[0].message.content
+            except asyncio.TimeoutError as e:
+                endpoint.record(time.monotonic() - started, "timeout", self.router.alpha, background)
+                limit = "без срока" if timeout is None else f"за {timeout:.1f} с"
+                logger.warning(f"Модель {endpoint.model} не ответила ({limit})")
+                error = e
+            except Exception as e:
+                endpoint.record(time.monotonic() - started, "error", self.router.alpha, background)
+                logger.error(f"Ошибка при обращении к ChatGPT API ({endpoint.model}): {e}")
+                error = e
+        
+        raise error
+    
+    async def warm_up(self) -> None:
+        """Прогрев клиента: установка TLS соединения с API до первого запроса пользователя"""
+        await self.client.models.retrieve(self.model)
     
     async def generate_response(
         self,
@@ -64,7 +135,10 @@ class LLMClient:
         system_prompt: Optional[str] = None,
         conversation_history: Optional[List[Dict[str, str]]] = None,
         temperature: float = 0.7,
-        max_tokens: int = 1000
+        max_tokens: int = 1000,
+        deadline: Optional[float] = None,
+        user_id: Optional[int] = None,
+        background: bool = False
     ) -> str:
         """
         Генерация ответа на сообщение пользователя
@@ -75,6 +149,9 @@ class LLMClient:
             conversation_history: История диалога (список предыдущих сообщений)
             temperature: Параметр температуры
             max_tokens: Максимальное количество токенов
+            deadline: Бюджет времени на ответ в секундах (None - без ограничения)
+            user_id: ID пользователя (подставляется готовое фоновое краткое содержание истории)
+            background: Фоновый запрос (см. chat_completion)
         
         Returns:
             Ответ модели
@@ -85,14 +162,17 @@ class LLMClient:
             messages.append({"role": "system", "content": system_prompt})
         
         if conversation_history:
-            messages.extend(conversation_history)
+            # История ограничивается бюджетом токенов, чтобы задержка и стоимость не росли
+            messages.extend(history_manager.get_history_manager().fit(conversation_history, user_id))
         
         messages.append({"role": "user", "content": user_message})
         
         return await self.chat_completion(
             messages=messages,
             temperature=temperature,
-            max_tokens=max_tokens
+            max_tokens=max_tokens,
+            deadline=deadline,
+            background=background
         )
 
 
@@ -0,0 +1,180 @@
+"""
+Модуль мониторинга цикла событий
+
+Измеряет задержку (lag) цикла событий и обнаруживает синхронный код,
+блокирующий цикл дольше порога. Для этого фоновый поток-сторож следит
+за "пульсом" корутины в цикле и, если пульс пропал, снимает стек потока
+цикла событий. Худшие места блокировки попадают в логи и метрики.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+LOOP_LAG = metrics.registry.histogram(
+    "bot_event_loop_lag_seconds",
+    "Задержка цикла событий",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+LOOP_BLOCKED = metrics.registry.counter(
+    "bot_event_loop_blocked_total",
+    "Количество блокировок цикла событий дольше порога",
+    ("site",)
+)
+
+
+@dataclass
+class Offender:
+    """Место в коде, заблокировавшее цикл событий"""
+    site: str
+    stack: List[str]
+    count: int = 0
+    worst: float = 0.0
+    total: float = field(default=0.0)
+
+
+def _project_site(frames: traceback.StackSummary) -> str:
+    """Самый глубокий кадр из кода проекта (или просто самый глубокий кадр)"""
+    for frame in reversed(frames):
+        if frame.filename.startswith(PROJECT_DIR) and "site-packages" not in frame.filename:
+            return f"{os.path.basename(frame.filename)}:{frame.lineno} {frame.name}"
+    if frames:
+        frame = frames[-1]
+        return f"{os.path.basename(frame.filename)}:{frame.lineno} {frame.name}"
+    return "unknown"
+
+
+class LoopMonitor:
+    """Монитор задержки цикла событий и детектор блокирующих вызовов"""
+
+    def __init__(
+        self,
+        interval: float = 0.1,
+        threshold: float = 0.1,
+        report_interval: float = 300.0,
+        top: int = 5
+    ):
+        """
+        Инициализация монитора
+
+        Args:
+            interval: Период "пульса" в цикле событий в секундах
+            threshold: Порог блокировки в секундах, после которого снимается стек
+            report_interval: Период вывода худших мест блокировки в лог
+            top: Количество мест в отчете
+        """
+        self.interval = interval
+        self.threshold = threshold
+        self.report_interval = report_interval
+        self.top = top
+        self.offenders: Dict[str, Offender] = {}
+
+        self._beat = time.monotonic()
+        self._beat_number = 0
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        # Блокировка, которую сторож сейчас отслеживает: (номер пульса, место, время начала)
+        self._blocked: Optional[tuple[int, str, float]] = None
+
+    def start(self) -> None:
+        """Запустить монитор в текущем цикле событий"""
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watchdog, name="loop-monitor", daemon=True)
+        self._thread.start()
+        logger.info(f"Монитор цикла событий запущен (порог {self.threshold * 1000:.0f} мс)")
+
+    async def stop(self) -> None:
+        """Остановить монитор"""
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._thread:
+            self._thread.join(timeout=1)
+
+    async def _heartbeat(self) -> None:
+        """Корутина "пульса": измеряет, насколько позже ожидаемого просыпается цикл"""
+        next_report = time.monotonic() + self.report_interval
+        while True:
+            self._beat = time.monotonic()
+            self._beat_number += 1
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            LOOP_LAG.observe(max(0.0, now - self._beat - self.interval))
+            self._finish_block(now)
+            if now >= next_report:
+                next_report = now + self.report_interval
+                self.log_report()
+
+    def _watchdog(self) -> None:
+        """Поток-сторож: снимает стек цикла событий, если пульс пропал дольше порога"""
+        check_every = max(self.threshold / 2, 0.005)
+        while not self._stopped.wait(check_every):
+            beat_number = self._beat_number
+            stalled = time.monotonic() - self._beat - self.interval
+            if stalled < self.threshold:
+                continue
+            if self._blocked is not None and self._blocked[0] == beat_number:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            frames = traceback.extract_stack(frame)
+            site = _project_site(frames)
+            offender = self.offenders.get(site)
+            if offender is None:
+                offender = self.offenders[site] = Offender(site=site, stack=traceback.format_list(frames[-8:]))
+            offender.count += 1
+            self._blocked = (beat_number, site, self._beat + self.interval)
+            LOOP_BLOCKED.inc(site=site)
+
+    def _finish_block(self, now: float) -> None:
+        """Записать длительность завершившейся блокировки (вызывается из цикла событий)"""
+        blocked = self._blocked
+        if blocked is None:
+            return
+        self._blocked = None
+        _, site, started = blocked
+        duration = now - started
+        offender = self.offenders[site]
+        offender.total += duration
+        if duration > offender.worst:
+            offender.worst = duration
+        logger.warning(
+            f"Цикл событий заблокирован на {duration * 1000:.0f} мс: {site}\n"
+            + "".join(offender.stack)
+        )
+
+    def worst_offenders(self) -> List[Offender]:
+        """Худшие места блокировки по суммарному времени"""
+        return sorted(self.offenders.values(), key=lambda o: o.total, reverse=True)[:self.top]
+
+    def log_report(self) -> None:
+        """Вывести в лог худшие места блокировки"""
+        offenders = self.worst_offenders()
+        if not offenders:
+            return
+        lines = [
+            f"  {o.site}: {o.count} раз, худшее {o.worst * 1000:.0f} мс, всего {o.total * 1000:.0f} мс"
+            for o in offenders
+        ]
+        logger.info("Худшие блокировки цикла событий:\n" + "\n".join(lines))
@@ -0,0 +1,198 @@
+"""
+Модуль фонового обслуживания БД
+
+Периодически переносит в архив (таблица goal_scenarios_archive, сжатый JSON)
+завершенные сценарии и давно брошенные незавершенные сценарии, удаляет
+старые строки журнала событий (дневные итоги остаются), после чего
+освобождает место в файле БД через PRAGMA incremental_vacuum. Заодно удаляет
+файлы выгрузок старше срока хранения (EXPORTS_RETENTION_HOURS, см. export.py).
+
+Однократный запуск из командной строки:
+    python maintenance.py --once
+    python maintenance.py --convert-vacuum   # включить auto_vacuum в существующей БД
+    python maintenance.py --compress-json    # пересжать JSON колонки сценариев (с полным VACUUM)
+"""
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import database
+import export
+import metrics
+from goal_scenario import ScenarioStage
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_SCENARIOS = metrics.registry.counter(
+    "bot_archived_scenarios_total",
+    "Количество сценариев, перенесенных в архив",
+    ("stage",)
+)
+
+
+class MaintenanceJob:
+    """Фоновая задача архивации сценариев и очистки файла БД"""
+
+    def __init__(
+        self,
+        completed_days: float = 30,
+        stale_days: float = 90,
+        batch_size: int = 200,
+        pause: float = 0.05,
+        interval_hours: float = 6,
+        vacuum_pages: int = 2000,
+        events_days: float = 90
+    ):
+        """
+        Инициализация задачи
+
+        Args:
+            completed_days: Через сколько дней после завершения сценарий уходит в архив
+            stale_days: Через сколько дней без активности в архив уходит незавершенный сценарий
+            batch_size: Размер порции строк в одной транзакции
+            pause: Пауза между порциями в секундах (чтобы не мешать записи бота)
+            interval_hours: Период запуска задачи в часах
+            vacuum_pages: Сколько страниц освобождать за один запуск (0 - все)
+            events_days: Сколько дней хранить строки журнала событий
+        """
+        self.completed_days = completed_days
+        self.stale_days = stale_days
+        self.batch_size = batch_size
+        self.pause = pause
+        self.interval_hours = interval_hours
+        self.vacuum_pages = vacuum_pages
+        self.events_days = events_days
+        self._task: Optional[asyncio.Task] = None
+
+    def _cutoffs(self, now: datetime) -> Dict[str, datetime]:
+        """Граница давности для каждого этапа сценария"""
+        completed = now - timedelta(days=self.completed_days)
+        stale = now - timedelta(days=self.stale_days)
+        return {
+            stage.value: completed if stage == ScenarioStage.COMPLETED else stale
+            for stage in ScenarioStage
+        }
+
+    async def archive(self) -> Dict[str, int]:
+        """
+        Перенести старые сценарии в архив порциями
+
+        Returns:
+            Количество перенесенных строк по этапам
+        """
+        archived: Dict[str, int] = {}
+        for stage, cutoff in self._cutoffs(datetime.now()).items():
+            while True:
+                moved = await database.archive_scenarios_batch(stage, cutoff, self.batch_size)
+                if not moved:
+                    break
+                archived[stage] = archived.get(stage, 0) + moved
+                ARCHIVED_SCENARIOS.inc(moved, stage=stage)
+                await asyncio.sleep(self.pause)
+        return archived
+
+    async def prune_events(self) -> int:
+        """
+        Удалить старые строки журнала событий порциями
+
+        Returns:
+            Количество удаленных строк
+        """
+        cutoff = datetime.now() - timedelta(days=self.events_days)
+        pruned = 0
+        while True:
+            deleted = await database.prune_events(cutoff, self.batch_size)
+            pruned += deleted
+            if deleted < self.batch_size:
+                return pruned
+            await asyncio.sleep(self.pause)
+
+    async def run_once(self) -> None:
+        """Один проход обслуживания: архивация, очистка журнала событий и выгрузок, освобождение места"""
+        await asyncio.to_thread(export.cleanup)
+        archived = await self.archive()
+        pruned = await self.prune_events()
+        vacuum = await database.incremental_vacuum(self.vacuum_pages)
+        if vacuum["auto_vacuum"] != 2:
+            logger.warning(
+                "auto_vacuum в БД не включен, место не освобождается. "
+                "Выполни однократно: python maintenance.py --convert-vacuum"
+            )
+        logger.info(
+            f"Обслуживание БД: в архив {sum(archived.values())} сценариев {archived}, "
+            f"удалено событий {pruned}, "
+            f"свободных страниц {vacuum['freelist_before']} -> {vacuum['freelist_after']}"
+        )
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка обслуживания БД: {e}")
+            await asyncio.sleep(self.interval_hours * 3600)
+
+    def start(self) -> None:
+        """Запустить периодическое обслуживание в текущем цикле событий"""
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        """Остановить периодическое обслуживание"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+def create_job() -> MaintenanceJob:
+    """Создать задачу с настройками из переменных окружения"""
+    return MaintenanceJob(
+        completed_days=float(os.getenv("RETENTION_COMPLETED_DAYS", "30")),
+        stale_days=float(os.getenv("RETENTION_STALE_DAYS", "90")),
+        batch_size=int(os.getenv("RETENTION_BATCH_SIZE", "200")),
+        interval_hours=float(os.getenv("MAINTENANCE_INTERVAL_HOURS", "6")),
+        events_days=float(os.getenv("EVENTS_RETENTION_DAYS", "90"))
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Обслуживание БД: архивация сценариев и очистка файла")
+    parser.add_argument("--db", default=database.DB_NAME, help="Путь к файлу БД")
+    parser.add_argument("--once", action="store_true", help="Выполнить один проход обслуживания")
+    parser.add_argument("--convert-vacuum", action="store_true", help="Включить auto_vacuum (полный VACUUM)")
+    parser.add_argument("--compress-json", action="store_true", help="Пересжать JSON колонки сценариев")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    database.DB_NAME = args.db
+
+    async def run() -> None:
+        await database.init_db()
+        if args.convert_vacuum:
+            await database.vacuum()
+            logger.info("auto_vacuum включен")
+        if args.compress_json:
+            size_before = os.path.getsize(database.DB_NAME)
+            stats = await database.compress_scenario_json()
+            # Полный VACUUM: после пересжатия страницы таблицы заполнены частично
+            await database.vacuum()
+            logger.info(
+                f"JSON колонки пересжаты ({database.JSON_CODEC}): обновлено строк {stats['updated']} "
+                f"из {stats['rows']}, JSON {stats['bytes_before'] / 2 ** 20:.1f} -> {stats['bytes_after'] / 2 ** 20:.1f} МБ, "
+                f"файл БД {size_before / 2 ** 20:.1f} -> {os.path.getsize(database.DB_NAME) / 2 ** 20:.1f} МБ"
+            )
+        if args.once or not (args.convert_vacuum or args.compress_json):
+            await create_job().run_once()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
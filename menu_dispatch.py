@@ -0,0 +1,85 @@
+"""
+Модуль диспетчеризации кнопок главного меню
+
+Вместо последовательной проверки фильтров `F.text == "..."` для каждого
+входящего сообщения строится один словарь "текст кнопки -> обработчик",
+и сообщение маршрутизируется одним поиском по хешу. Если текст не найден,
+обновление передается обычному роутеру.
+"""
+import logging
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.dispatcher.event.handler import CallableObject
+from aiogram.fsm.state import State
+from aiogram.types import Message
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class MenuDispatcher(BaseMiddleware):
+    """Диспетчер кнопок меню с поиском обработчика за O(1)"""
+
+    def __init__(self, skip_states: Optional[Iterable[State]] = None):
+        """
+        Инициализация диспетчера
+
+        Args:
+            skip_states: Состояния FSM, в которых кнопки меню не перехватываются
+                         (например, регистрация, где любой текст - это ответ пользователя)
+        """
+        self._handlers: Dict[str, CallableObject] = {}
+        self._skip_states = {s.state for s in skip_states or []}
+
+    def button(self, text: str) -> Callable:
+        """
+        Декоратор для регистрации обработчика кнопки меню
+
+        Args:
+            text: Точный текст кнопки
+        """
+        def decorator(callback: Callable) -> Callable:
+            if text in self._handlers:
+                raise ValueError(f"Обработчик для кнопки '{text}' уже зарегистрирован")
+            self._handlers[text] = CallableObject(callback)
+            return callback
+        return decorator
+
+    def skip_state(self, *states: State) -> None:
+        """Добавить состояния FSM, в которых кнопки меню не перехватываются"""
+        self._skip_states.update(s.state for s in states)
+
+    @property
+    def buttons(self) -> list[str]:
+        """Тексты всех зарегистрированных кнопок"""
+        return list(self._handlers)
+
+    def resolve(self, text: Optional[str], raw_state: Optional[str] = None) -> Optional[CallableObject]:
+        """
+        Найти обработчик для текста сообщения
+
+        Returns:
+            Обработчик или None, если сообщение нужно передать роутеру
+        """
+        if text is None or raw_state in self._skip_states:
+            return None
+        return self._handlers.get(text)
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any]
+    ) -> Any:
+        menu_handler = self.resolve(event.text, data.get("raw_state"))
+        if menu_handler is None:
+            return await handler(event, data)
+        with metrics.time_handler(menu_handler.callback.__name__, data.get("raw_state")):
+            return await menu_handler.call(event, **data)
+
+    def setup(self, dp: Dispatcher) -> None:
+        """Подключить диспетчер к диспетчеру aiogram (до фильтров всех роутеров)"""
+        dp.message.outer_middleware(self)
+        logger.info(f"Диспетчер меню подключен, кнопок: {len(self._handlers)}")
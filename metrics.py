@@ -0,0 +1,282 @@
+"""
+Модуль метрик: счетчики, гистограммы и HTTP эндпоинт /metrics
+
+Метрики хранятся в памяти процесса и отдаются в текстовом формате Prometheus
+HTTP сервером aiohttp, работающим в том же цикле событий, что и бот.
+"""
+import bisect
+import functools
+import logging
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм по умолчанию (в секундах)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    """Экранирование значения метки для формата Prometheus"""
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    """Сформировать строку меток {a="1",b="2"}"""
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    """Базовый класс метрики с метками"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        """Увеличить счетчик"""
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        """Текущее значение счетчика"""
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for key, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    """Значение, которое может как расти, так и уменьшаться"""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        """Установить значение"""
+        self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными корзинами"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Для каждого набора меток: [счетчики корзин..., +Inf], сумма
+        self._counts: Dict[Tuple[str, ...], List[int]] = {}
+        self._sums: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        """Записать наблюдение"""
+        key = self._key(labels)
+        counts = self._counts.get(key)
+        if counts is None:
+            counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+            self._sums[key] = 0.0
+        # Индекс len(buckets) соответствует корзине +Inf
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sums[key] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Контекстный менеджер для замера длительности блока кода"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        """Количество наблюдений"""
+        return sum(self._counts.get(self._key(labels), []))
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for key, counts in self._counts.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            cumulative += counts[-1]
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {self._sums[key]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Реестр метрик процесса"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> Any:
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика '{metric.name}' уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        """Создать и зарегистрировать счетчик"""
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        """Создать и зарегистрировать gauge"""
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        """Создать и зарегистрировать гистограмму"""
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def get(self, name: str) -> Optional[_Metric]:
+        """Получить метрику по имени"""
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+UPDATES = registry.counter("bot_updates_total", "Количество полученных обновлений по типу и боту", ("type", "bot"))
+ERRORS = registry.counter("bot_handler_errors_total", "Количество исключений в обработчиках", ("handler",))
+FALLBACKS = registry.counter("bot_fallbacks_total", "Количество срабатываний запасных вариантов", ("kind",))
+HANDLER_LATENCY = registry.histogram(
+    "bot_handler_duration_seconds", "Длительность обработчиков", ("handler", "state")
+)
+DB_QUERY_LATENCY = registry.histogram(
+    "bot_db_query_duration_seconds", "Длительность запросов к БД", ("query",)
+)
+
+
+def timed_query(func: Callable[..., Awaitable]) -> Callable[..., Awaitable]:
+    """Декоратор для замера длительности функций модуля database"""
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with DB_QUERY_LATENCY.time(query=name):
+            return await func(*args, **kwargs)
+
+    return wrapper
+
+
+@contextmanager
+def time_handler(name: str, state: Optional[str]) -> Iterator[None]:
+    """Замер длительности обработчика и подсчет исключений"""
+    try:
+        with HANDLER_LATENCY.time(handler=name, state=state or "none"):
+            yield
+    except Exception:
+        ERRORS.inc(handler=name)
+        raise
+
+
+class UpdateCounterMiddleware(BaseMiddleware):
+    """Внешний middleware для подсчета всех обновлений по типу и боту"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        bot = data.get("bot")
+        UPDATES.inc(type=getattr(event, "event_type", "unknown"), bot=str(bot.id) if bot else "unknown")
+        return await handler(event, data)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Внутренний middleware для замера длительности обработчиков по имени и состоянию FSM"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object else "unknown"
+        with time_handler(name, data.get("raw_state")):
+            return await handler(event, data)
+
+
+async def start_server(host: str, port: int, ready: Optional[Callable[[], bool]] = None):
+    """
+    Запуск HTTP сервера метрик в текущем цикле событий
+
+    Args:
+        host: Адрес для прослушивания
+        port: Порт
+        ready: Функция проверки готовности для эндпоинта /ready
+
+    Returns:
+        AppRunner (для остановки сервера через runner.cleanup())
+    """
+    from aiohttp import web
+
+    async def handle_metrics(request: web.Request) -> web.Response:
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+    async def handle_ready(request: web.Request) -> web.Response:
+        if ready is None or ready():
+            return web.Response(text="ok")
+        return web.Response(text="starting", status=503)
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    app.router.add_get("/ready", handle_ready)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,176 @@
+"""
+Модуль выбора модели LLM с учетом задержек и ошибок
+
+Модели (или OpenAI-совместимые адреса) перечисляются в порядке предпочтения:
+первая - основная, следующие - более быстрые запасные. Для каждой ведется
+скользящая статистика задержек и доля ошибок; под бюджет времени вызова
+подбирается порядок попыток, при котором успевает хотя бы одна модель.
+
+Настройка: LLM_MODELS="gpt-4o-mini,gpt-4.1-nano@http://127.0.0.1:8089/v1"
+"""
+import os
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import events
+import hedging
+import metrics
+
+LLM_REQUESTS = metrics.registry.counter(
+    "bot_llm_requests_total",
+    "Запросы к LLM по моделям и результатам (ok, error, timeout)",
+    ("model", "result")
+)
+LLM_LATENCY = metrics.registry.histogram(
+    "bot_llm_request_seconds",
+    "Время успешного запроса к LLM по моделям",
+    ("model",)
+)
+
+
+@dataclass
+class ModelEndpoint:
+    """Модель и адрес API со статистикой задержек и ошибок"""
+    model: str
+    base_url: Optional[str] = None
+    latencies: hedging.LatencyWindow = field(default_factory=hedging.LatencyWindow)
+    error_rate: float = 0.0
+    last_attempt: float = 0.0
+    hedge: Optional[hedging.HedgePolicy] = None
+
+    def predicted_latency(self, percentile: float) -> Optional[float]:
+        """Ожидаемая задержка (перцентиль по окну) или None, если статистики нет"""
+        return self.latencies.percentile(percentile)
+
+    def record(self, seconds: float, result: str, alpha: float, background: bool = False) -> None:
+        """
+        Учесть результат запроса в статистике
+
+        Фоновые запросы (background) учитываются только в метриках: их задержка
+        и ошибки не влияют на выбор модели для запросов пользователей.
+        """
+        LLM_REQUESTS.inc(model=self.model, result=result)
+        if background:
+            return
+        self.last_attempt = time.monotonic()
+        if result == "ok":
+            LLM_LATENCY.observe(seconds, model=self.model)
+        if result != "error":
+            # Таймаут - нижняя оценка задержки: модель не успела бы и за это время
+            self.latencies.observe(seconds)
+        # Экспоненциальное сглаживание доли ошибок (таймаут тоже считается ошибкой)
+        self.error_rate += alpha * ((result != "ok") - self.error_rate)
+        events.log.record(events.LLM, result, detail=self.model)
+
+
+class ModelRouter:
+    """Выбор порядка попыток по бюджету времени и статистике моделей"""
+
+    def __init__(
+        self,
+        endpoints: List[ModelEndpoint],
+        percentile: float = 90,
+        error_threshold: float = 0.5,
+        alpha: float = 0.2,
+        probe_interval: float = 60,
+        reserve_factor: float = 1.5
+    ):
+        """
+        Инициализация маршрутизатора
+
+        Args:
+            endpoints: Модели в порядке предпочтения (первая - основная)
+            percentile: Перцентиль задержки, по которому оценивается, успеет ли модель
+            error_threshold: Доля ошибок, после которой модель пробуется в последнюю очередь
+            alpha: Коэффициент сглаживания доли ошибок
+            probe_interval: Через сколько секунд снова пробовать модель с большой долей ошибок
+            reserve_factor: Во сколько раз запас времени на следующую модель больше ее ожидаемой задержки
+        """
+        if not endpoints:
+            raise ValueError("Не указано ни одной модели")
+        self.endpoints = endpoints
+        self.percentile = percentile
+        self.error_threshold = error_threshold
+        self.alpha = alpha
+        self.probe_interval = probe_interval
+        self.reserve_factor = reserve_factor
+
+    @property
+    def primary(self) -> ModelEndpoint:
+        """Основная модель"""
+        return self.endpoints[0]
+
+    def predicted_latency(self, endpoint: ModelEndpoint) -> Optional[float]:
+        """Ожидаемая задержка модели"""
+        return endpoint.predicted_latency(self.percentile)
+
+    def plan(self, budget: Optional[float] = None) -> List[ModelEndpoint]:
+        """
+        Порядок попыток для вызова
+
+        Сначала исправные модели, которые укладываются в бюджет (в порядке
+        предпочтения), затем остальные исправные по возрастанию ожидаемой
+        задержки, и в конце модели с большой долей ошибок. Модель с большой
+        долей ошибок раз в probe_interval считается исправной, чтобы ее
+        статистика обновлялась после восстановления.
+
+        Args:
+            budget: Бюджет времени вызова в секундах (None - без ограничения)
+        """
+        def fits(endpoint: ModelEndpoint) -> bool:
+            latency = self.predicted_latency(endpoint)
+            return budget is None or latency is None or latency <= budget
+
+        now = time.monotonic()
+        healthy, failing = [], []
+        for endpoint in self.endpoints:
+            if endpoint.error_rate < self.error_threshold or now - endpoint.last_attempt >= self.probe_interval:
+                healthy.append(endpoint)
+            else:
+                failing.append(endpoint)
+        slow = sorted((e for e in healthy if not fits(e)), key=lambda e: self.predicted_latency(e) or 0)
+        return [e for e in healthy if fits(e)] + slow + sorted(failing, key=lambda e: e.error_rate)
+
+    def attempt_timeout(self, remaining: float, next_endpoint: Optional[ModelEndpoint]) -> float:
+        """
+        Таймаут попытки с запасом времени на следующую модель
+
+        Args:
+            remaining: Оставшийся бюджет времени
+            next_endpoint: Следующая модель в плане (None - попытка последняя)
+        """
+        if next_endpoint is None:
+            return remaining
+        latency = self.predicted_latency(next_endpoint)
+        reserve = latency * self.reserve_factor if latency is not None else remaining / 2
+        if reserve >= remaining:
+            reserve = remaining / 2
+        return remaining - reserve
+
+
+def parse_endpoints(spec: str, base_url: Optional[str] = None) -> List[ModelEndpoint]:
+    """
+    Разбор списка моделей вида "model[@base_url],..."
+
+    Args:
+        spec: Список моделей через запятую
+        base_url: Адрес API по умолчанию для моделей без явного адреса
+    """
+    endpoints = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        model, _, url = item.partition("@")
+        endpoints.append(ModelEndpoint(model=model, base_url=url or base_url, hedge=hedging.create_policy()))
+    return endpoints
+
+
+def create_router(base_url: Optional[str] = None) -> ModelRouter:
+    """Создать маршрутизатор по переменным окружения"""
+    return ModelRouter(
+        parse_endpoints(os.getenv("LLM_MODELS", "gpt-4o-mini"), base_url),
+        percentile=float(os.getenv("LLM_ROUTER_PERCENTILE", "90")),
+        error_threshold=float(os.getenv("LLM_ROUTER_ERROR_THRESHOLD", "0.5"))
+    )
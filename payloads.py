@@ -0,0 +1,211 @@
+"""
+Реестр готовых клавиатур и текстов сообщений
+
+Статические клавиатуры и сообщения создаются один раз при импорте модуля,
+поэтому при каждой отправке не создаются новые объекты и не выполняется
+повторная валидация pydantic. Динамические сообщения (список целей,
+итоги сценария) собираются из заранее подготовленных шаблонов.
+"""
+from typing import Dict, List
+
+from aiogram.types import (
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    KeyboardButton,
+    ReplyKeyboardMarkup,
+    ReplyKeyboardRemove
+)
+
+
+class PayloadRegistry:
+    """Реестр готовых клавиатур, текстов и шаблонов сообщений"""
+
+    def __init__(self):
+        self._keyboards: Dict[str, object] = {}
+        self._texts: Dict[str, str] = {}
+        self._templates: Dict[str, str] = {}
+
+    def register_keyboard(self, name: str, markup: object) -> object:
+        """Зарегистрировать готовую клавиатуру"""
+        self._keyboards[name] = markup
+        return markup
+
+    def register_text(self, name: str, text: str) -> str:
+        """Зарегистрировать статический текст сообщения"""
+        self._texts[name] = text
+        return text
+
+    def register_template(self, name: str, template: str, **defaults: str) -> str:
+        """
+        Зарегистрировать шаблон сообщения
+
+        Шаблон проверяется сразу: подстановка тестовых значений должна пройти без ошибок.
+        """
+        template.format(**defaults)
+        self._templates[name] = template
+        return template
+
+    def keyboard(self, name: str) -> object:
+        """Получить готовую клавиатуру"""
+        return self._keyboards[name]
+
+    def text(self, name: str) -> str:
+        """Получить статический текст"""
+        return self._texts[name]
+
+    def render(self, name: str, **values) -> str:
+        """Собрать сообщение по шаблону"""
+        return self._templates[name].format(**values)
+
+
+registry = PayloadRegistry()
+
+
+# ========== Клавиатуры ==========
+
+MAIN_MENU = registry.register_keyboard("main_menu", ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text="📋 Мой профиль"), KeyboardButton(text="✏️ Редактировать профиль")],
+        [KeyboardButton(text="🎯 Целеполагание на 12 недель")],
+        [KeyboardButton(text="ℹ️ Информация"), KeyboardButton(text="❓ Помощь")],
+        [KeyboardButton(text="📊 Статистика бота")]
+    ],
+    resize_keyboard=True,
+    input_field_placeholder="Выберите пункт меню..."
+))
+
+REMOVE_KEYBOARD = registry.register_keyboard("remove", ReplyKeyboardRemove())
+
+# Данные кнопки продолжения сценария из напоминания
+NUDGE_CONTINUE = "nudge:continue"
+
+NUDGE_KEYBOARD = registry.register_keyboard("nudge", InlineKeyboardMarkup(
+    inline_keyboard=[[InlineKeyboardButton(text="▶️ Продолжить", callback_data=NUDGE_CONTINUE)]]
+))
+
+
+# ========== Статические сообщения ==========
+
+registry.register_text("info", (
+    "ℹ️ <b>О боте</b>\n\n"
+    "Этот бот создан для управления сообществом и общения с участниками.\n\n"
+    "<b>Возможности:</b>\n"
+    "• Регистрация новых участников\n"
+    "• Управление профилем\n"
+    "• 🎯 Целеполагание на 12 недель - цифровой ассистент для постановки и достижения целей\n"
+    "• Просмотр статистики\n"
+    "• Получение помощи\n\n"
+    "💡 Используй меню для навигации по боту!"
+))
+
+registry.register_text("help", (
+    "❓ <b>Помощь</b>\n\n"
+    "<b>Доступные команды:</b>\n"
+    "/start - Начать работу с ботом\n"
+    "/help - Показать это сообщение\n"
+    "/menu - Показать главное меню\n\n"
+    "<b>Кнопки меню:</b>\n"
+    "📋 <b>Мой профиль</b> - Просмотр твоего профиля\n"
+    "✏️ <b>Редактировать профиль</b> - Изменение данных профиля\n"
+    "🎯 <b>Целеполагание на 12 недель</b> - Начать сценарий постановки и планирования целей\n"
+    "ℹ️ <b>Информация</b> - Информация о боте\n"
+    "❓ <b>Помощь</b> - Это сообщение\n"
+    "📊 <b>Статистика бота</b> - Общая статистика\n\n"
+    "<b>О сценарии целеполагания:</b>\n"
+    "Сценарий поможет тебе:\n"
+    "• Сформулировать до 10 целей на 12 недель\n"
+    "• Выбрать 3 самые важные\n"
+    "• Определить критерии успеха\n"
+    "• Получить инструкцию по планированию\n\n"
+    "❔ Если у тебя есть вопросы, обратись к администратору."
+))
+
+registry.register_text("scenario_introduction", (
+    "🎯 <b>Добро пожаловать в систему целеполагания на 12 недель!</b>\n\n"
+    "Эта система поможет тебе:\n"
+    "• Сформулировать и структурировать цели на ближайшие 3 месяца\n"
+    "• Выбрать самые важные из них\n"
+    "• Определить четкие критерии успеха\n"
+    "• Создать план действий для достижения\n\n"
+    "Готов начать? Поехали! 🚀\n\n"
+    "<b>Шаг 1: Постановка целей</b>\n\n"
+    "Подумай о том, чего ты хочешь достичь в ближайшие 3 месяца. "
+    "Сформулируй и введи свои цели (до 10 целей).\n\n"
+    "<i>Примеры:</i>\n"
+    "• Карьерный рост (получить повышение)\n"
+    "• Ранний подъем (вставать в 7 утра)\n"
+    "• Похудение (сбросить 5 кг)\n"
+    "• Изучение нового языка\n"
+    "• Развитие навыка программирования\n\n"
+    "Введи свои цели по одной, или все сразу через запятую или с новой строки. "
+    "Когда закончишь, напиши <b>\"Готово\"</b> или <b>\"Завершить\"</b>."
+))
+
+registry.register_text("scenario_planning_instruction", (
+    "📚 <b>Шаг 4: Создание плана действий</b>\n\n"
+    "Теперь у тебя есть 3 четкие цели с определенными критериями успеха. "
+    "Вот пошаговая инструкция по планированию, основанная на принципах SMART:\n\n"
+    "<b>Шаг 1:</b> Четко определи 1-3 ключевые цели на 12 недель (уже сделано ✅)\n\n"
+    "<b>Шаг 2:</b> Декомпозируй каждую цель на тактические еженедельные и ежедневные шаги\n"
+    "   • Разбей большие цели на маленькие задачи\n"
+    "   • Определи, что нужно делать каждую неделю\n"
+    "   • Планируй ежедневные действия\n\n"
+    "<b>Шаг 3:</b> Заблокируй время в календаре на ключевые задачи\n"
+    "   • Рекомендуется 3-4 часа фокусной работы в день\n"
+    "   • Выдели конкретное время для работы над каждой целью\n\n"
+    "<b>Шаг 4:</b> Еженедельно отслеживай прогресс и корректируй действия\n"
+    "   • В конце каждой недели проверяй, что сделано\n"
+    "   • Адаптируй план при необходимости\n\n"
+    "<b>Шаг 5:</b> По итогам 12 недель проведи оценку результатов\n"
+    "   • Что удалось достичь?\n"
+    "   • Какие были препятствия?\n"
+    "   • Что нужно скорректировать в следующем цикле?\n\n"
+    "<b>Шаг 6:</b> Начни новый 12-недельный цикл для непрерывного развития 🔄\n\n"
+    "💡 Помни: регулярность и отслеживание прогресса - ключ к успеху!"
+))
+
+registry.register_text("nudge", (
+    "👋 Ты начал сценарий целеполагания на 12 недель, но не закончил его.\n\n"
+    "Все твои ответы сохранены - можно продолжить с того места, где ты остановился. "
+    "Это займет всего пару минут! 🎯"
+))
+
+
+# ========== Шаблоны динамических сообщений ==========
+
+registry.register_template("goals_selection", (
+    "📋 <b>Все твои цели:</b>\n\n{goals}\n\n"
+    "<b>Шаг 2: Фокусировка</b>\n\n"
+    "Теперь нужно выбрать 3 самые важные цели для дальнейшей работы.\n\n"
+    "Введи номера целей через запятую или пробел (например: 1, 3, 5 или 1 3 5)"
+), goals="")
+
+registry.register_template("goals_selection_inline", (
+    "📋 <b>Все твои цели:</b>\n\n{goals}\n\n"
+    "<b>Шаг 2: Фокусировка</b>\n\n"
+    "Теперь нужно выбрать 3 самые важные цели для дальнейшей работы.\n\n"
+    "Отметь их кнопками ниже и нажми <b>\"Подтвердить\"</b> "
+    "(или введи номера целей через запятую, например: 1, 3, 5)"
+), goals="")
+
+registry.register_template("finalization_goal", (
+    "• <b>{text}</b>\n  Критерий успеха: {criteria}"
+), text="", criteria="")
+
+registry.register_template("finalization", (
+    "🎉 <b>Поздравляю! Сценарий завершен!</b>\n\n"
+    "📋 <b>Твои приоритетные цели на 12 недель:</b>\n\n{goals}\n\n"
+    "Теперь у тебя есть:\n"
+    "✅ 3 четкие приоритетные цели\n"
+    "✅ Критерии успеха для каждой цели\n"
+    "✅ Инструкция по планированию и отслеживанию прогресса\n\n"
+    "<b>Готов двигаться дальше?</b>\n\n"
+    "Хочешь декомпозировать цели на конкретные задания? 🎯\n"
+    "Или нужна консультация коуча? 💼\n\n"
+    "Напиши, что тебя интересует!"
+), goals="")
+
+
+def render_numbered_list(items: List[str]) -> str:
+    """Нумерованный список (1. ..., 2. ...) одним проходом"""
+    return "\n".join(f"{i}. {item}" for i, item in enumerate(items, 1))
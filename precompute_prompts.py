@@ -0,0 +1,238 @@
+"""
+Модуль предварительной генерации запросов критерия успеха для популярных целей
+
+Находит самые частые (после нормализации) цели в goal_scenarios.all_goals и
+selected_goals, генерирует для каждой несколько вариантов запроса критерия
+успеха с ограниченной параллельностью и сохраняет их в таблицу criteria_prompts.
+Уже сгенерированные цели пропускаются (кроме режима --refresh).
+
+В процессе бота задача запускается раз в interval_hours: время последнего
+запуска хранится в БД, поэтому перезапуск бота не вызывает повторный проход.
+Запросы к LLM фоновые: у каждого свой бюджет времени, они не хеджируются и
+не влияют на статистику выбора модели для запросов пользователей.
+
+Запуск из командной строки (OPENAI_BASE_URL или --base-url позволяют
+использовать локальный тестовый сервер):
+    python precompute_prompts.py --top 200 --variants 3
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import database
+import llm_client
+import prompt_cache
+from goal_scenario import CRITERIA_SYSTEM_PROMPT, build_criteria_user_prompt
+
+logger = logging.getLogger(__name__)
+
+# Имя задачи в таблице job_runs
+JOB_NAME = "precompute_prompts"
+
+
+async def mine_top_goals(top: int, min_count: int = 2) -> List[Tuple[str, str, int]]:
+    """
+    Найти самые частые цели пользователей
+
+    Args:
+        top: Сколько целей вернуть
+        min_count: Минимальное количество пользователей с такой целью
+
+    Returns:
+        Список (ключ цели, исходный текст, количество) по убыванию частоты
+    """
+    counts: Counter = Counter()
+    originals: Dict[str, str] = {}
+    async for rows in database.iter_scenario_goals():
+        for all_goals, selected_goals in rows:
+            goals = set(json.loads(all_goals or "[]"))
+            goals.update(g["text"] for g in json.loads(selected_goals or "[]"))
+            # Каждая цель учитывается один раз на пользователя
+            for key, text in {prompt_cache.normalize_goal(g): g for g in goals}.items():
+                if key:
+                    counts[key] += 1
+                    originals.setdefault(key, text)
+    return [
+        (key, originals[key], count)
+        for key, count in counts.most_common(top)
+        if count >= min_count
+    ]
+
+
+class PromptPrecomputeJob:
+    """Задача предварительной генерации вариантов"""
+
+    def __init__(
+        self,
+        llm: llm_client.LLMClient,
+        top: int = 200,
+        variants: int = 3,
+        concurrency: int = 4,
+        min_count: int = 2,
+        interval_hours: float = 24,
+        request_timeout: float = 60
+    ):
+        """
+        Инициализация задачи
+
+        Args:
+            llm: LLM клиент для генерации
+            top: Сколько самых частых целей обрабатывать
+            variants: Сколько вариантов генерировать для каждой цели
+            concurrency: Максимальное количество одновременных запросов к LLM
+            min_count: Минимальная частота цели
+            interval_hours: Период запуска в процессе бота
+            request_timeout: Бюджет времени на генерацию одного варианта в секундах
+        """
+        self.llm = llm
+        self.top = top
+        self.variants = variants
+        self.concurrency = concurrency
+        self.min_count = min_count
+        self.interval_hours = interval_hours
+        self.request_timeout = request_timeout
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._task: Optional[asyncio.Task] = None
+
+    async def _generate(self, goal: str) -> Optional[str]:
+        async with self._semaphore:
+            try:
+                return await self.llm.generate_response(
+                    user_message=build_criteria_user_prompt(goal),
+                    system_prompt=CRITERIA_SYSTEM_PROMPT,
+                    temperature=0.8,
+                    max_tokens=200,
+                    deadline=self.request_timeout,
+                    background=True
+                )
+            except Exception as e:
+                logger.warning(f"Не удалось сгенерировать вариант для цели '{goal}': {e}")
+                return None
+
+    async def _process_goal(self, key: str, goal: str) -> bool:
+        results = await asyncio.gather(*(self._generate(goal) for _ in range(self.variants)))
+        variants = [text for text in results if text]
+        if not variants:
+            return False
+        await database.save_criteria_prompts(key, variants)
+        prompt_cache.update(key, variants)
+        return True
+
+    async def run_once(self, refresh: bool = False) -> int:
+        """
+        Один проход генерации
+
+        Args:
+            refresh: Перегенерировать варианты и для уже обработанных целей
+
+        Returns:
+            Количество целей, для которых сохранены варианты
+        """
+        top_goals = await mine_top_goals(self.top, self.min_count)
+        existing = set() if refresh else set(prompt_cache.keys())
+        pending = [(key, goal) for key, goal, _ in top_goals if key not in existing]
+        results = await asyncio.gather(*(self._process_goal(key, goal) for key, goal in pending))
+        done = sum(results)
+        logger.info(
+            f"Предварительная генерация: популярных целей {len(top_goals)}, "
+            f"новых {len(pending)}, сохранено {done}"
+        )
+        return done
+
+    async def _seconds_until_due(self) -> float:
+        """Сколько секунд осталось до следующего запуска по времени последнего запуска в БД"""
+        last_run = await database.get_job_run(JOB_NAME)
+        if last_run is None:
+            return 0
+        elapsed = (datetime.now() - last_run).total_seconds()
+        return max(0.0, self.interval_hours * 3600 - elapsed)
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                delay = await self._seconds_until_due()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Не удалось прочитать время предварительной генерации: {e}")
+                delay = self.interval_hours * 3600
+            if delay:
+                await asyncio.sleep(delay)
+                continue
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка предварительной генерации: {e}")
+            try:
+                await database.save_job_run(JOB_NAME)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Не удалось сохранить время предварительной генерации: {e}")
+                await asyncio.sleep(self.interval_hours * 3600)
+
+    def start(self) -> None:
+        """Запустить периодическую генерацию в текущем цикле событий"""
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        """Остановить периодическую генерацию"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+def create_job(llm: llm_client.LLMClient) -> PromptPrecomputeJob:
+    """Создать задачу с настройками из переменных окружения"""
+    return PromptPrecomputeJob(
+        llm,
+        top=int(os.getenv("PRECOMPUTE_TOP_GOALS", "200")),
+        variants=int(os.getenv("PRECOMPUTE_VARIANTS", "3")),
+        concurrency=int(os.getenv("PRECOMPUTE_CONCURRENCY", "4")),
+        interval_hours=float(os.getenv("PRECOMPUTE_INTERVAL_HOURS", "24")),
+        request_timeout=float(os.getenv("PRECOMPUTE_REQUEST_TIMEOUT", "60"))
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Предварительная генерация запросов критерия успеха")
+    parser.add_argument("--db", default=database.DB_NAME, help="Путь к файлу БД")
+    parser.add_argument("--top", type=int, default=200, help="Сколько самых частых целей обработать")
+    parser.add_argument("--variants", type=int, default=3, help="Вариантов на цель")
+    parser.add_argument("--concurrency", type=int, default=4, help="Одновременных запросов к LLM")
+    parser.add_argument("--min-count", type=int, default=2, help="Минимальная частота цели")
+    parser.add_argument("--base-url", help="Адрес OpenAI-совместимого API (например, тестового сервера)")
+    parser.add_argument("--refresh", action="store_true", help="Перегенерировать уже сохраненные цели")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    database.DB_NAME = args.db
+
+    async def run() -> None:
+        await database.init_db()
+        await prompt_cache.load()
+        job = PromptPrecomputeJob(
+            llm_client.LLMClient(base_url=args.base_url),
+            top=args.top,
+            variants=args.variants,
+            concurrency=args.concurrency,
+            min_count=args.min_count
+        )
+        await job.run_once(refresh=args.refresh)
+        await database.save_job_run(JOB_NAME)
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Модуль семплирующего профилировщика
+
+Профилировщик работает в отдельном потоке и с заданной частотой снимает
+стеки всех потоков процесса через sys._current_frames(). Для потока цикла
+событий к стеку добавляется корутина текущей asyncio задачи. Результат
+сохраняется в формате collapsed stacks (совместим с flamegraph.pl и speedscope).
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+PROFILES_DIR = os.getenv("PROFILES_DIR", "profiles")
+
+
+def _frame_label(frame) -> str:
+    """Подпись кадра: функция и файл с номером первой строки функции"""
+    code = frame.f_code
+    # co_qualname (с именем класса) есть только в Python 3.11+
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _task_label(task: Optional[asyncio.Task]) -> Optional[str]:
+    """Подпись asyncio задачи по ее корутине"""
+    if task is None:
+        return None
+    coro = task.get_coro()
+    name = getattr(coro, "__qualname__", None) or type(coro).__name__
+    return f"task:{name}"
+
+
+class SamplingProfiler:
+    """Семплирующий профилировщик всего процесса"""
+
+    def __init__(self, interval: float = 0.01):
+        """
+        Инициализация профилировщика
+
+        Args:
+            interval: Интервал между снимками стеков в секундах
+        """
+        self.interval = interval
+        self.samples = 0
+        self._stacks: Counter = Counter()
+        self._lock = asyncio.Lock()
+
+    @property
+    def running(self) -> bool:
+        """Идет ли сейчас профилирование"""
+        return self._lock.locked()
+
+    def _sample(self, loop: asyncio.AbstractEventLoop, loop_thread_id: int, stop: threading.Event) -> None:
+        """Цикл снятия стеков (выполняется в отдельном потоке)"""
+        own_id = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        while not stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack: List[str] = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.reverse()
+                root = [names.get(thread_id) or f"thread-{thread_id}"]
+                if thread_id == loop_thread_id:
+                    task = _task_label(asyncio.current_task(loop))
+                    if task:
+                        root.append(task)
+                self._stacks[";".join(root + stack)] += 1
+            self.samples += 1
+
+    async def profile(self, seconds: float) -> Dict[str, int]:
+        """
+        Профилировать процесс заданное время
+
+        Args:
+            seconds: Длительность профилирования
+
+        Returns:
+            Словарь "свернутый стек -> количество снимков"
+        """
+        async with self._lock:
+            self._stacks = Counter()
+            self.samples = 0
+            stop = threading.Event()
+            thread = threading.Thread(
+                target=self._sample,
+                args=(asyncio.get_running_loop(), threading.get_ident(), stop),
+                name="sampling-profiler",
+                daemon=True
+            )
+            thread.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                stop.set()
+                await asyncio.to_thread(thread.join)
+            return dict(self._stacks)
+
+    def save(self, stacks: Dict[str, int], directory: str = PROFILES_DIR) -> str:
+        """
+        Сохранить стеки в формате collapsed stacks
+
+        Returns:
+            Путь к сохраненному файлу
+        """
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"profile-{time.strftime('%Y%m%d-%H%M%S')}.collapsed")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in sorted(stacks.items(), key=lambda item: item[1], reverse=True):
+                f.write(f"{stack} {count}\n")
+        return path
+
+    @staticmethod
+    def top_functions(stacks: Dict[str, int], limit: int = 10) -> List[tuple[str, int]]:
+        """Функции с наибольшим собственным временем (последний кадр стека)"""
+        own: Counter = Counter()
+        for stack, count in stacks.items():
+            own[stack.rsplit(";", 1)[-1]] += count
+        return own.most_common(limit)
+
+
+# Глобальный экземпляр профилировщика
+profiler = SamplingProfiler(interval=float(os.getenv("PROFILER_INTERVAL_MS", "10")) / 1000)
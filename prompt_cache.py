@@ -0,0 +1,103 @@
+"""
+Модуль кеша заранее сгенерированных запросов критерия успеха
+
+Варианты для самых популярных целей генерируются заранее (см. precompute_prompts.py),
+хранятся в таблице criteria_prompts и загружаются в память при запуске, поэтому
+для таких целей сценарий отвечает без обращения к LLM.
+"""
+import logging
+import random
+import re
+from typing import Dict, List, Optional, Set
+
+import database
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CACHE_LOOKUPS = metrics.registry.counter(
+    "bot_criteria_prompt_cache_total",
+    "Обращения к кешу запросов критерия успеха",
+    ("result",)
+)
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+_SPACES = re.compile(r"\s+")
+
+# Ключ нормализованной цели -> варианты текста
+_prompts: Dict[str, List[str]] = {}
+
+
+def normalize_goal(goal: str) -> str:
+    """Нормализация текста цели: нижний регистр, без пунктуации и лишних пробелов"""
+    text = goal.lower().replace("ё", "е")
+    text = _PUNCTUATION.sub(" ", text)
+    return _SPACES.sub(" ", text).strip()
+
+
+def lookup(goal: str) -> Optional[str]:
+    """Случайный заранее сгенерированный вариант для цели или None"""
+    variants = _prompts.get(normalize_goal(goal))
+    if not variants:
+        CACHE_LOOKUPS.inc(result="miss")
+        return None
+    CACHE_LOOKUPS.inc(result="hit")
+    return random.choice(variants)
+
+
+def lookup_similar(goal: str, threshold: float = 0.5) -> Optional[str]:
+    """
+    Вариант для самой похожей популярной цели (запасной вариант при недоступности LLM)
+
+    Сходство - доля общих слов (коэффициент Жаккара) нормализованных целей.
+    Слова сравниваются по первым пяти буквам, чтобы "похудеть" и "похудение"
+    считались одним словом; предлоги и короткие слова не учитываются.
+
+    Args:
+        goal: Текст цели
+        threshold: Минимальное сходство
+
+    Returns:
+        Текст варианта или None, если похожих целей нет
+    """
+    words = _stems(normalize_goal(goal))
+    if not words:
+        return None
+    best_key, best_score = None, threshold
+    for key in _prompts:
+        other = _stems(key)
+        score = len(words & other) / len(words | other)
+        if score >= best_score:
+            best_key, best_score = key, score
+    if best_key is None:
+        CACHE_LOOKUPS.inc(result="similar_miss")
+        return None
+    CACHE_LOOKUPS.inc(result="similar_hit")
+    return random.choice(_prompts[best_key])
+
+
+def _stems(text: str) -> Set[str]:
+    return {word[:5] for word in text.split() if len(word) > 2}
+
+
+def update(goal_key: str, variants: List[str]) -> None:
+    """Обновить варианты для цели в памяти"""
+    _prompts[goal_key] = list(variants)
+
+
+def keys() -> List[str]:
+    """Ключи целей, для которых есть варианты"""
+    return list(_prompts)
+
+
+async def load() -> int:
+    """
+    Загрузить все варианты из БД в память
+
+    Returns:
+        Количество целей в кеше
+    """
+    global _prompts
+    _prompts = await database.get_criteria_prompts()
+    logger.info(f"Загружены заранее сгенерированные запросы критерия успеха для {len(_prompts)} целей")
+    return len(_prompts)
@@ -0,0 +1,93 @@
+"""
+Модуль ограничения частоты запросов (token bucket)
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+
+class TokenBucket:
+    """Асинхронный token bucket: не более rate операций в секунду со всплеском до capacity"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        Инициализация ограничителя
+
+        Args:
+            rate: Скорость пополнения (операций в секунду)
+            capacity: Максимальный запас токенов (по умолчанию равен rate, минимум 1)
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self) -> bool:
+        """Взять токен без ожидания"""
+        now = time.monotonic()
+        self._refill(now)
+        if now >= self._paused_until and self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    async def acquire(self) -> None:
+        """Дождаться и взять токен"""
+        while True:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Приостановить выдачу токенов (например, после RetryAfter от Telegram)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+
+class KeyedTokenBucket:
+    """Набор token bucket по ключам (например, по chat_id) с ограничением числа ключей"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None, max_keys: int = 10000):
+        """
+        Инициализация ограничителя
+
+        Args:
+            rate: Скорость пополнения для каждого ключа
+            capacity: Запас токенов для каждого ключа
+            max_keys: Сколько ключей хранить; самые старые вытесняются
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[Hashable, TokenBucket]" = OrderedDict()
+
+    def get(self, key: Hashable) -> TokenBucket:
+        """Получить ограничитель для ключа"""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.capacity)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    async def acquire(self, key: Hashable) -> None:
+        """Дождаться и взять токен для ключа"""
+        await self.get(key).acquire()
+
+    def pause(self, key: Hashable, seconds: float) -> None:
+        """Приостановить выдачу токенов для ключа"""
+        self.get(key).pause(seconds)
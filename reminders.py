@@ -0,0 +1,156 @@
+"""
+Модуль напоминаний о брошенных сценариях целеполагания
+
+Периодически находит сценарии без активности дольше заданного времени на
+незавершенных этапах (пагинация по ключу по индексу (stage, updated_at))
+и отправляет пользователю напоминание с кнопкой продолжения. Кнопка
+продолжает сценарий через continue_scenario_from_stage в bot.py.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+import database
+import metrics
+import payloads
+import tenancy
+from goal_scenario import ScenarioStage
+from rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+NUDGES = metrics.registry.counter(
+    "bot_nudges_total",
+    "Результаты отправки напоминаний о брошенных сценариях",
+    ("stage", "result")
+)
+
+# Этапы, на которых пользователь ждет ответа и может бросить сценарий
+NUDGE_STAGES = (
+    ScenarioStage.COLLECTING_GOALS,
+    ScenarioStage.SELECTING_GOALS,
+    ScenarioStage.DEFINING_SUCCESS_CRITERIA,
+)
+
+
+class ReminderJob:
+    """Фоновая задача отправки напоминаний"""
+
+    def __init__(
+        self,
+        idle_hours: float = 24,
+        max_idle_days: float = 14,
+        interval_minutes: float = 30,
+        rate: float = 5,
+        batch_size: int = 200
+    ):
+        """
+        Инициализация задачи
+
+        Args:
+            idle_hours: Через сколько часов без активности отправлять напоминание
+            max_idle_days: Не напоминать о сценариях, брошенных раньше этого срока
+            interval_minutes: Период поиска брошенных сценариев
+            rate: Лимит напоминаний в секунду (ниже лимита Telegram, чтобы не мешать ответам бота)
+            batch_size: Размер порции сценариев, читаемой из БД
+        """
+        self.idle_hours = idle_hours
+        self.max_idle_days = max_idle_days
+        self.interval_minutes = interval_minutes
+        self.rate_limiter = TokenBucket(rate)
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self, bot: Bot) -> int:
+        """
+        Один проход: найти брошенные сценарии пользователей бота и отправить напоминания
+
+        Returns:
+            Количество отправленных напоминаний
+        """
+        tenancy.use_bot(bot)
+        now = datetime.now()
+        idle_since = now - timedelta(hours=self.idle_hours)
+        # Нижняя граница: слишком старые сценарии не трогаем (их заберет архивация)
+        start_key = (str(now - timedelta(days=self.max_idle_days)), 0)
+        sent = 0
+        for stage in NUDGE_STAGES:
+            after = start_key
+            while True:
+                rows = await database.get_idle_scenarios(stage.value, idle_since, after, self.batch_size)
+                if not rows:
+                    break
+                nudged = []
+                for user_id, _ in rows:
+                    if await self._send(bot, user_id, stage):
+                        nudged.append(user_id)
+                await database.mark_scenarios_nudged(nudged)
+                sent += len(nudged)
+                # Строки - (user_id, updated_at), ключ пагинации - (updated_at, user_id)
+                last_user_id, last_updated_at = rows[-1]
+                after = (last_updated_at, last_user_id)
+        if sent:
+            logger.info(f"Отправлено напоминаний о брошенных сценариях: {sent}")
+        return sent
+
+    async def _send(self, bot: Bot, user_id: int, stage: ScenarioStage) -> bool:
+        """Отправить напоминание одному пользователю"""
+        await self.rate_limiter.acquire()
+        try:
+            await bot.send_message(
+                user_id,
+                payloads.registry.text("nudge"),
+                reply_markup=payloads.NUDGE_KEYBOARD
+            )
+            NUDGES.inc(stage=stage.value, result="sent")
+            return True
+        except TelegramRetryAfter as e:
+            self.rate_limiter.pause(e.retry_after)
+            NUDGES.inc(stage=stage.value, result="retry_after")
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            if isinstance(e, TelegramForbiddenError) or "chat not found" in str(e).lower():
+                await database.set_user_active(user_id, False)
+            NUDGES.inc(stage=stage.value, result="failed")
+        except Exception as e:
+            logger.warning(f"Не удалось отправить напоминание {user_id}: {e}")
+            NUDGES.inc(stage=stage.value, result="failed")
+        return False
+
+    async def _loop(self, bots: Tuple[Bot, ...]) -> None:
+        while True:
+            for bot in bots:
+                try:
+                    await self.run_once(bot)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Ошибка отправки напоминаний бота {bot.id}: {e}")
+            await asyncio.sleep(self.interval_minutes * 60)
+
+    def start(self, *bots: Bot) -> None:
+        """Запустить периодические напоминания пользователям ботов в текущем цикле событий"""
+        self._task = asyncio.create_task(self._loop(bots))
+
+    async def stop(self) -> None:
+        """Остановить периодические напоминания"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+def create_job() -> ReminderJob:
+    """Создать задачу с настройками из переменных окружения"""
+    return ReminderJob(
+        idle_hours=float(os.getenv("NUDGE_IDLE_HOURS", "24")),
+        max_idle_days=float(os.getenv("NUDGE_MAX_IDLE_DAYS", "14")),
+        interval_minutes=float(os.getenv("NUDGE_INTERVAL_MINUTES", "30")),
+        rate=float(os.getenv("NUDGE_RATE", "5"))
+    )
@@ -0,0 +1,88 @@
+"""
+Модуль запуска бота: замер времени импорта, прогрев клиентов и сигнал готовности
+
+Перед началом получения обновлений параллельно прогреваются соединение с БД,
+LLM клиент (создание SDK и TLS соединение) и HTTP сессия Telegram, чтобы
+первый пользователь после рестарта не платил за холодный старт.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+# Момент импорта модуля: bot.py импортирует его первым, поэтому разница
+# с моментом запуска пайплайна - это время импорта остальных модулей
+IMPORT_STARTED = time.perf_counter()
+
+logger = logging.getLogger(__name__)
+
+
+class StartupPipeline:
+    """Пайплайн запуска с параллельным прогревом и сигналом готовности"""
+
+    def __init__(self, step_timeout: float = 10.0, readiness_file: Optional[str] = None):
+        """
+        Инициализация пайплайна
+
+        Args:
+            step_timeout: Максимальное время одного шага прогрева в секундах
+            readiness_file: Путь к файлу, который создается после прогрева
+                            (для проверок готовности со стороны хостинга)
+        """
+        self.step_timeout = step_timeout
+        self.readiness_file = readiness_file
+        self.ready = asyncio.Event()
+        self.timings: Dict[str, float] = {}
+        self._steps: Dict[str, Callable[[], Awaitable]] = {}
+
+    def add_step(self, name: str, step: Callable[[], Awaitable]) -> None:
+        """Добавить шаг прогрева (корутинную функцию без аргументов)"""
+        self._steps[name] = step
+
+    async def _run_step(self, name: str, step: Callable[[], Awaitable]) -> None:
+        """Выполнить шаг прогрева с замером времени; ошибки не прерывают запуск"""
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(step(), timeout=self.step_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Прогрев '{name}' не уложился в {self.step_timeout} с")
+        except Exception as e:
+            logger.warning(f"Прогрев '{name}' завершился ошибкой: {e}")
+        finally:
+            self.timings[name] = time.perf_counter() - started
+
+    async def run(self) -> None:
+        """Выполнить все шаги прогрева параллельно и выставить сигнал готовности"""
+        self.timings["imports"] = time.perf_counter() - IMPORT_STARTED
+        started = time.perf_counter()
+        await asyncio.gather(*(self._run_step(name, step) for name, step in self._steps.items()))
+        self.timings["warm_up"] = time.perf_counter() - started
+
+        self.mark_ready()
+        report = ", ".join(f"{name}: {seconds * 1000:.0f} мс" for name, seconds in self.timings.items())
+        logger.info(f"Бот готов к работе ({report})")
+
+    def mark_ready(self) -> None:
+        """Выставить сигнал готовности"""
+        self.ready.set()
+        if self.readiness_file:
+            with open(self.readiness_file, "w") as f:
+                f.write(str(time.time()))
+
+    def mark_not_ready(self) -> None:
+        """Снять сигнал готовности (например, при остановке)"""
+        self.ready.clear()
+        if self.readiness_file and os.path.exists(self.readiness_file):
+            os.remove(self.readiness_file)
+
+    def is_ready(self) -> bool:
+        """Готов ли бот принимать обновления"""
+        return self.ready.is_set()
+
+
+# Глобальный экземпляр пайплайна
+pipeline = StartupPipeline(
+    step_timeout=float(os.getenv("STARTUP_STEP_TIMEOUT", "10")),
+    readiness_file=os.getenv("READINESS_FILE")
+)
@@ -0,0 +1,68 @@
+"""
+Модуль работы нескольких ботов в одном процессе
+
+Несколько брендированных копий бота запускаются одним процессом: один цикл
+событий, один диспетчер с общими роутерами, общие БД, LLM клиент (с его
+ограничителями и кешами), метрики и пул соединений с Bot API.
+
+Данные пользователей разделяются по ID бота: текущий бот хранится в
+контекстной переменной, которую устанавливает middleware для каждого
+обновления (и фоновые задачи для своего бота), а функции database.py
+подставляют его в запросы.
+
+Токены задаются переменной окружения BOT_TOKENS (через запятую или перевод
+строки) или, для одного бота, BOT_TOKEN.
+"""
+import os
+import re
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, List
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.types import TelegramObject
+from aiogram.utils.token import TokenValidationError, extract_bot_id
+
+# ID бота, от имени которого выполняется текущая задача (0 - бот не определен)
+current_bot_id: ContextVar[int] = ContextVar("current_bot_id", default=0)
+
+
+def load_tokens() -> List[str]:
+    """
+    Токены ботов из переменных окружения
+
+    Returns:
+        Список токенов без повторов в порядке перечисления
+    """
+    raw = os.getenv("BOT_TOKENS") or os.getenv("BOT_TOKEN") or ""
+    tokens = [token.strip() for token in re.split(r"[,\s]+", raw) if token.strip()]
+    return list(dict.fromkeys(tokens))
+
+
+def use_bot(bot: Bot) -> None:
+    """Выполнять запросы к БД текущей задачи от имени бота"""
+    current_bot_id.set(bot.id)
+
+
+class TenantMiddleware(BaseMiddleware):
+    """Внешний middleware: ID бота, получившего обновление, становится текущим"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        # Каждое обновление обрабатывается в своей задаче со своей копией контекста
+        use_bot(data["bot"])
+        return await handler(event, data)
+
+
+def default_bot_id() -> int:
+    """ID первого настроенного бота (ему принадлежат данные, записанные до разделения по ботам)"""
+    tokens = load_tokens()
+    if not tokens:
+        return 0
+    try:
+        return extract_bot_id(tokens[0])
+    except TokenValidationError:
+        return 0
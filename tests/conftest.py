@@ -0,0 +1,10 @@
+"""
+Общие настройки тестов: модули бота и тестовые серверы из benchmarks/
+импортируются как модули верхнего уровня
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
@@ -0,0 +1,166 @@
+"""
+Сквозной тест предварительной генерации запросов критерия успеха
+
+PromptPrecomputeJob работает с временной БД и настоящим LLM клиентом,
+который обращается к тестовому OpenAI-совместимому серверу
+(benchmarks/fake_openai_server.py), запущенному на свободном порту.
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from aiohttp import web
+
+import database
+import fake_openai_server
+import llm_client
+import precompute_prompts
+import prompt_cache
+
+# Цели пользователей: "Прочитать 12 книг" у трех пользователей (в разном написании),
+# "Бегать по утрам" у двух, остальные - по одному разу
+USER_GOALS = {
+    1: ["Прочитать 12 книг", "Бегать по утрам"],
+    2: ["прочитать 12 книг!", "Выучить испанский"],
+    3: ["ПРОЧИТАТЬ 12 КНИГ", "бегать по утрам"],
+    4: ["Сделать ремонт"],
+}
+POPULAR = {"прочитать 12 книг", "бегать по утрам"}
+VARIANTS = 2
+
+
+@pytest.fixture
+def environment(tmp_path, monkeypatch):
+    """Временная БД, пустой кеш вариантов и один тестовый ключ API без хеджирования"""
+    monkeypatch.setattr(database, "DB_NAME", str(tmp_path / "bot.db"))
+    monkeypatch.setattr(prompt_cache, "_prompts", {})
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    for name in ("OPENAI_BASE_URL", "LLM_MODELS", "LLM_HEDGING"):
+        monkeypatch.delenv(name, raising=False)
+
+
+async def _start_server() -> web.AppRunner:
+    """Запустить тестовый сервер на свободном порту"""
+    app = fake_openai_server.create_app(median_ms=5, tail_rate=0)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    return runner
+
+
+async def _seed() -> None:
+    await database.init_db()
+    for user_id, goals in USER_GOALS.items():
+        await database.save_scenario_state(user_id, {
+            "stage": "selecting_goals",
+            "all_goals": goals,
+            "selected_goals": [{"text": goals[0], "success_criteria": None}]
+        })
+
+
+def test_run_once_saves_variants_and_updates_cache(environment):
+    async def scenario():
+        await _seed()
+        runner = await _start_server()
+        fake = runner.app[fake_openai_server.FAKE]
+        port = runner.addresses[0][1]
+        llm = llm_client.LLMClient(base_url=f"http://127.0.0.1:{port}/v1")
+        try:
+            job = precompute_prompts.PromptPrecomputeJob(llm, top=10, variants=VARIANTS, concurrency=2)
+            saved = await job.run_once()
+            requests = fake.requests
+            # Повторный проход пропускает уже обработанные цели
+            saved_again = await job.run_once()
+            return saved, requests, saved_again, fake.requests, await database.get_criteria_prompts()
+        finally:
+            await llm.close()
+            await runner.cleanup()
+
+    saved, requests, saved_again, requests_after, rows = asyncio.run(scenario())
+
+    assert saved == len(POPULAR)
+    assert requests == len(POPULAR) * VARIANTS
+    assert saved_again == 0
+    assert requests_after == requests
+
+    # В criteria_prompts только популярные цели, по VARIANTS ответов сервера на каждую
+    assert set(rows) == POPULAR
+    for variants in rows.values():
+        assert len(variants) == VARIANTS
+        assert all("тестовый ответ" in text for text in variants)
+
+    # Кеш в памяти совпадает с БД, и сценарий находит варианты по любому написанию цели
+    assert set(prompt_cache.keys()) == POPULAR
+    for key, variants in rows.items():
+        assert prompt_cache._prompts[key] == variants
+    assert prompt_cache.lookup("Прочитать 12 книг.") in rows["прочитать 12 книг"]
+    assert prompt_cache.lookup("Выучить испанский") is None
+
+
+def test_run_once_refresh_replaces_variants(environment):
+    async def scenario():
+        await _seed()
+        runner = await _start_server()
+        port = runner.addresses[0][1]
+        llm = llm_client.LLMClient(base_url=f"http://127.0.0.1:{port}/v1")
+        try:
+            job = precompute_prompts.PromptPrecomputeJob(llm, top=10, variants=VARIANTS)
+            await job.run_once()
+            before = await database.get_criteria_prompts()
+            saved = await job.run_once(refresh=True)
+            return before, saved, await database.get_criteria_prompts()
+        finally:
+            await llm.close()
+            await runner.cleanup()
+
+    before, saved, after = asyncio.run(scenario())
+
+    assert saved == len(POPULAR)
+    # Старые варианты заменены новыми, а не добавлены к ним
+    assert set(after) == POPULAR
+    for key in POPULAR:
+        assert len(after[key]) == VARIANTS
+        assert not set(after[key]) & set(before[key])
+        assert prompt_cache._prompts[key] == after[key]
+
+
+def test_background_requests_do_not_touch_router_stats(environment, monkeypatch):
+    monkeypatch.setenv("LLM_HEDGING", "1")
+
+    async def scenario():
+        await _seed()
+        runner = await _start_server()
+        port = runner.addresses[0][1]
+        llm = llm_client.LLMClient(base_url=f"http://127.0.0.1:{port}/v1")
+        try:
+            job = precompute_prompts.PromptPrecomputeJob(llm, top=10, variants=VARIANTS)
+            saved = await job.run_once()
+            return saved, llm.router.primary
+        finally:
+            await llm.close()
+            await runner.cleanup()
+
+    saved, endpoint = asyncio.run(scenario())
+
+    assert saved == len(POPULAR)
+    # Задержки фоновых запросов не попадают ни в окно маршрутизатора, ни в окно хеджирования
+    assert len(endpoint.latencies) == 0
+    assert endpoint.error_rate == 0
+    assert len(endpoint.hedge.latencies) == 0
+
+
+def test_loop_waits_for_interval_after_restart(environment):
+    async def scenario():
+        await database.init_db()
+        job = precompute_prompts.PromptPrecomputeJob(llm=None, interval_hours=24)
+        first = await job._seconds_until_due()
+        await database.save_job_run(
+            precompute_prompts.JOB_NAME, datetime.now() - timedelta(hours=20)
+        )
+        return first, await job._seconds_until_due()
+
+    first, after_restart = asyncio.run(scenario())
+
+    # Без сохраненного запуска задача выполняется сразу, после недавнего - ждет остаток периода
+    assert first == 0
+    assert 4 * 3600 - 60 < after_restart <= 4 * 3600
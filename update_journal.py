@@ -0,0 +1,208 @@
+"""
+Модуль защиты от повторной обработки обновлений
+
+После падения или перезапуска бота Telegram повторно доставляет обновления,
+которые не успели подтвердиться (а при webhook - повторяет запросы). Чтобы
+обработчики не выполнялись дважды (двойной сдвиг сценария, лишние запросы
+к LLM), каждое update_id отмечается в журнале до запуска обработчиков, а
+повторы пропускаются.
+
+Журнал - битовая карта последних window идентификаторов в памяти (update_id
+у бота возрастают) и таблица processed_updates в SQLite, куда отметки
+записываются порциями раз в flush_interval. Идентификаторы старше окна
+считаются обработанными.
+"""
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+import database
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_UPDATES = metrics.registry.counter(
+    "bot_duplicate_updates_total",
+    "Повторно доставленные обновления, пропущенные без обработки"
+)
+
+
+class UpdateWindow:
+    """Битовая карта последних size идентификаторов обновлений"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._bits = bytearray((size + 7) // 8)
+        self.high: Optional[int] = None
+
+    def _position(self, update_id: int) -> tuple:
+        index = update_id % self.size
+        return index >> 3, 1 << (index & 7)
+
+    def add(self, update_id: int) -> bool:
+        """
+        Отметить идентификатор
+
+        Returns:
+            True, если идентификатор новый; False для повтора или слишком старого
+        """
+        if self.high is None:
+            self.high = update_id - 1
+        if update_id > self.high:
+            if update_id - self.high >= self.size:
+                self._bits = bytearray(len(self._bits))
+            else:
+                # Позиции, которые переходят к новым идентификаторам, очищаются
+                for skipped in range(self.high + 1, update_id):
+                    byte, mask = self._position(skipped)
+                    self._bits[byte] &= ~mask & 0xFF
+            self.high = update_id
+        elif update_id <= self.high - self.size:
+            return False
+        else:
+            byte, mask = self._position(update_id)
+            if self._bits[byte] & mask:
+                return False
+        byte, mask = self._position(update_id)
+        self._bits[byte] |= mask
+        return True
+
+
+class UpdateJournal:
+    """Журнал обработанных обновлений одного бота"""
+
+    def __init__(self, bot_id: int, window: int = 100_000):
+        """
+        Инициализация журнала
+
+        Args:
+            bot_id: ID бота (update_id уникальны в пределах бота)
+            window: Сколько последних идентификаторов хранить
+        """
+        self.bot_id = bot_id
+        self.window = UpdateWindow(window)
+        self._pending: List[int] = []
+
+    async def load(self) -> int:
+        """
+        Загрузить отметки из БД
+
+        Returns:
+            Количество загруженных идентификаторов
+        """
+        update_ids = await database.get_processed_updates(self.bot_id, self.window.size)
+        for update_id in sorted(update_ids):
+            self.window.add(update_id)
+        return len(update_ids)
+
+    def check_and_add(self, update_id: int) -> bool:
+        """
+        Отметить обновление как обрабатываемое
+
+        Returns:
+            True, если обновление новое и его нужно обработать
+        """
+        if not self.window.add(update_id):
+            return False
+        self._pending.append(update_id)
+        return True
+
+    async def flush(self) -> None:
+        """Записать накопленные отметки в БД"""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        try:
+            await database.save_processed_updates(
+                self.bot_id,
+                pending,
+                prune_below=self.window.high - self.window.size
+            )
+        except Exception:
+            # Отметки вернутся в очередь и будут записаны при следующей попытке
+            self._pending = pending + self._pending
+            raise
+
+
+class IdempotencyMiddleware(BaseMiddleware):
+    """Внешний middleware: пропуск повторно доставленных обновлений до запуска обработчиков"""
+
+    def __init__(self, window: int = 100_000, flush_interval: float = 0.5):
+        """
+        Инициализация middleware
+
+        Args:
+            window: Размер окна идентификаторов для каждого бота
+            flush_interval: Период записи отметок в БД в секундах
+        """
+        self.window = window
+        self.flush_interval = flush_interval
+        self._journals: Dict[int, UpdateJournal] = {}
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def _journal(self, bot_id: int) -> UpdateJournal:
+        journal = self._journals.get(bot_id)
+        if journal is None:
+            async with self._lock:
+                journal = self._journals.get(bot_id)
+                if journal is None:
+                    journal = UpdateJournal(bot_id, self.window)
+                    loaded = await journal.load()
+                    logger.info(f"Журнал обновлений бота {bot_id}: загружено {loaded} отметок")
+                    self._journals[bot_id] = journal
+                    if self._task is None:
+                        self._task = asyncio.create_task(self._loop())
+        return journal
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if isinstance(event, Update):
+            journal = await self._journal(data["bot"].id)
+            if not journal.check_and_add(event.update_id):
+                DUPLICATE_UPDATES.inc()
+                logger.info(f"Повторное обновление {event.update_id} пропущено")
+                return None
+        return await handler(event, data)
+
+    async def flush(self) -> None:
+        """Записать отметки всех ботов в БД"""
+        for journal in list(self._journals.values()):
+            await journal.flush()
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка записи журнала обновлений: {e}")
+
+    async def close(self) -> None:
+        """Остановить периодическую запись и записать оставшиеся отметки"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+def create_middleware() -> IdempotencyMiddleware:
+    """Создать middleware с настройками из переменных окружения"""
+    return IdempotencyMiddleware(
+        window=int(os.getenv("UPDATE_JOURNAL_WINDOW", "100000")),
+        flush_interval=float(os.getenv("UPDATE_JOURNAL_FLUSH_SECONDS", "0.5"))
+    )